@@ -9,7 +9,8 @@ from rich import print
 from typing_extensions import Annotated
 
 from .error_reporter import ErrorLevel, ErrorReporter
-from .lox import Lox
+from .interpreter import DEFAULT_MAX_DEPTH
+from .lox import Lox, backends
 from .token import Token
 
 app = typer.Typer()
@@ -60,21 +61,55 @@ def report_error(error_reporter: ErrorReporter, source: str) -> None:
 
 
 @app.command("")
-def main(file: Annotated[str, typer.Argument(help="Run this script")] = "") -> int:
+def main(
+    file: Annotated[str, typer.Argument(help="Run this script")] = "",
+    backend: Annotated[
+        str,
+        typer.Option(help=f"Execution engine to use ({', '.join(backends)})"),
+    ] = "tree",
+    disassemble: Annotated[
+        bool,
+        typer.Option(help="Print the bytecode of FILE instead of running it"),
+    ] = False,
+    emit_python: Annotated[
+        bool,
+        typer.Option(help="Print FILE transpiled to python instead of running it"),
+    ] = False,
+    max_depth: Annotated[
+        int,
+        typer.Option(
+            help="Maximum number of nested calls, for backends with their own call stack (vm)"
+        ),
+    ] = DEFAULT_MAX_DEPTH,
+) -> int:
     """
     Run FILE in script mode if FILE is provided. Otherwise run in interactive mode
     """
+    if backend not in backends:
+        raise typer.BadParameter(
+            f"Should be one of {', '.join(backends)}", param_hint="--backend"
+        )
 
     error_reporter = ErrorReporter()
 
-    lox = Lox(error_reporter)
+    lox = Lox(error_reporter, backend=backend, max_depth=max_depth)
 
     # Run in script mode
     if file:
         source = ""
         with open(file, "r") as f:
-            source = f.read()
-        exit_code = lox.run(source)
+            if disassemble or emit_python:
+                source = f.read()
+                listing = (
+                    lox.disassemble(source) if disassemble else lox.emit_python(source)
+                )
+                report_error(error_reporter, source)
+                if listing is None:
+                    sys.exit(1)
+                sys.stdout.write(listing + "\n")
+                sys.exit(0)
+            # The script is lexed and parsed as it is read
+            exit_code = lox.run(f)
         lox.close()
         report_error(error_reporter, source)
         if error_reporter.is_error:
@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import TYPE_CHECKING, Generic, List, TypeVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generic, List, Tuple, TypeVar
 
-from ..token import Token
+from ..position import Position
+from ..token import Token, TokenType
 
 if TYPE_CHECKING:
+    from ..lox_class import PropertyCache
     from .stmt import Stmt
 
 T = TypeVar("T")
@@ -67,33 +69,91 @@ class Visitor(ABC, Generic[T]):
     def visit_super_expr(self, expr: "Super") -> T:
         pass
 
+    def visit_add_expr(self, expr: "Add") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_subtract_expr(self, expr: "Subtract") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_multiply_expr(self, expr: "Multiply") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_divide_expr(self, expr: "Divide") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_modulo_expr(self, expr: "Modulo") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_less_expr(self, expr: "Less") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_less_equal_expr(self, expr: "LessEqual") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_greater_expr(self, expr: "Greater") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_greater_equal_expr(self, expr: "GreaterEqual") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_equal_expr(self, expr: "Equal") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_not_equal_expr(self, expr: "NotEqual") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_comma_expr(self, expr: "Comma") -> T:
+        return self.visit_binary_expr(expr)
+
+    def visit_negate_expr(self, expr: "Negate") -> T:
+        return self.visit_unary_expr(expr)
+
+    def visit_not_expr(self, expr: "Not") -> T:
+        return self.visit_unary_expr(expr)
+
+    def visit_typeof_expr(self, expr: "Typeof") -> T:
+        return self.visit_unary_expr(expr)
+
+    def visit_deep_expr(self, expr: "Deep") -> T:
+        return self.visit_grouping_expr(expr)
+
 
 class Expr(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def accept(self, visitor: Visitor[T]) -> T:
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class Binary(Expr):
     left: Expr
     operator: Token
     right: Expr
+    quickened_type: type | None = field(default=None, compare=False, repr=False)
+    quickened: Callable[[Any, Any], object] | None = field(
+        default=None, compare=False, repr=False
+    )
+    deopts: int = field(default=0, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_binary_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Assign(Expr):
     name: Token
     value: Expr
+    access: int = field(default=-1, compare=False, repr=False)
+    depth: int = field(default=-1, compare=False, repr=False)
+    slot: int = field(default=-1, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_assign_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Ternary(Expr):
     condition: Expr
     if_branch: Expr
@@ -103,7 +163,7 @@ class Ternary(Expr):
         return visitor.visit_ternary_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Grouping(Expr):
     expression: Expr
 
@@ -111,7 +171,7 @@ class Grouping(Expr):
         return visitor.visit_grouping_expr(self)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Literal(Expr):
     value: object
 
@@ -119,7 +179,7 @@ class Literal(Expr):
         return visitor.visit_literal_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Unary(Expr):
     operator: Token
     right: Expr
@@ -128,15 +188,18 @@ class Unary(Expr):
         return visitor.visit_unary_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Variable(Expr):
     name: Token
+    access: int = field(default=-1, compare=False, repr=False)
+    depth: int = field(default=-1, compare=False, repr=False)
+    slot: int = field(default=-1, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_variable_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Logical(Expr):
     left: Expr
     operator: Token
@@ -146,55 +209,190 @@ class Logical(Expr):
         return visitor.visit_logical_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Call(Expr):
     callee: Expr
-    paren: Token
+    paren: Position
     args: List[Expr]
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_call_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Arrow(Expr):
     params: List[Token]
     body: List["Stmt"]
+    captures: List[Tuple[bool, int]] = field(
+        default_factory=list, compare=False, repr=False
+    )
+    cell_params: List[int] = field(default_factory=list, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_arrow_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Get(Expr):
     obj: Expr
     name: Token
+    cache: "PropertyCache | None" = field(default=None, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_get_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Set(Expr):
     obj: Expr
     name: Token
     value: Expr
+    cache: "PropertyCache | None" = field(default=None, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_set_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class This(Expr):
     keyword: Token
+    access: int = field(default=-1, compare=False, repr=False)
+    depth: int = field(default=-1, compare=False, repr=False)
+    slot: int = field(default=-1, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_this_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Super(Expr):
     keyword: Token
+    access: int = field(default=-1, compare=False, repr=False)
+    depth: int = field(default=-1, compare=False, repr=False)
+    slot: int = field(default=-1, compare=False, repr=False)
+    this: "This | None" = field(default=None, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_super_expr(self)
+
+
+@dataclass(slots=True)
+class Add(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_add_expr(self)
+
+
+@dataclass(slots=True)
+class Subtract(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_subtract_expr(self)
+
+
+@dataclass(slots=True)
+class Multiply(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_multiply_expr(self)
+
+
+@dataclass(slots=True)
+class Divide(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_divide_expr(self)
+
+
+@dataclass(slots=True)
+class Modulo(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_modulo_expr(self)
+
+
+@dataclass(slots=True)
+class Less(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_less_expr(self)
+
+
+@dataclass(slots=True)
+class LessEqual(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_less_equal_expr(self)
+
+
+@dataclass(slots=True)
+class Greater(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_greater_expr(self)
+
+
+@dataclass(slots=True)
+class GreaterEqual(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_greater_equal_expr(self)
+
+
+@dataclass(slots=True)
+class Equal(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_equal_expr(self)
+
+
+@dataclass(slots=True)
+class NotEqual(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_not_equal_expr(self)
+
+
+@dataclass(slots=True)
+class Comma(Binary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_comma_expr(self)
+
+
+# The node created for each operator
+binary_classes: Dict[TokenType, type[Binary]] = {
+    TokenType.PLUS: Add,
+    TokenType.MINUS: Subtract,
+    TokenType.STAR: Multiply,
+    TokenType.SLASH: Divide,
+    TokenType.PERCENTAGE: Modulo,
+    TokenType.LESS: Less,
+    TokenType.LESS_EQUAL: LessEqual,
+    TokenType.GREATER: Greater,
+    TokenType.GREATER_EQUAL: GreaterEqual,
+    TokenType.EQUAL_EQUAL: Equal,
+    TokenType.BANG_EQUAL: NotEqual,
+    TokenType.COMMA: Comma,
+}
+
+
+@dataclass(slots=True)
+class Negate(Unary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_negate_expr(self)
+
+
+@dataclass(slots=True)
+class Not(Unary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_not_expr(self)
+
+
+@dataclass(slots=True)
+class Typeof(Unary):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_typeof_expr(self)
+
+
+# The node created for each operator
+unary_classes: Dict[TokenType, type[Unary]] = {
+    TokenType.MINUS: Negate,
+    TokenType.BANG: Not,
+    TokenType.NOT: Not,
+    TokenType.TYPEOF: Typeof,
+}
+
+
+@dataclass(slots=True)
+class Deep(Grouping):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_deep_expr(self)
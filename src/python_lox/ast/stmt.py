@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Generic, List, TypeVar
+from dataclasses import dataclass, field
+from typing import Generic, List, Tuple, TypeVar
 
+from ..position import Position
 from ..token import Token
 from .expr import Expr, Variable
 
@@ -71,12 +72,14 @@ class Visitor(ABC, Generic[T]):
 
 
 class Stmt(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def accept(self, visitor: Visitor[T]) -> T:
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class Expression(Stmt):
     expression: Expr
 
@@ -84,7 +87,7 @@ class Expression(Stmt):
         return visitor.visit_expression_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Print(Stmt):
     expression: Expr
 
@@ -92,7 +95,7 @@ class Print(Stmt):
         return visitor.visit_print_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Println(Stmt):
     expression: Expr
 
@@ -100,25 +103,29 @@ class Println(Stmt):
         return visitor.visit_println_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Var(Stmt):
     name: Token
     initializer: Expr | None = None
+    slot: int = field(default=-1, compare=False, repr=False)
+    is_cell: bool = field(default=False, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_var_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Const(Stmt):
     name: Token
     initializer: Expr
+    slot: int = field(default=-1, compare=False, repr=False)
+    is_cell: bool = field(default=False, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_const_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Block(Stmt):
     statements: List[Stmt]
 
@@ -126,7 +133,7 @@ class Block(Stmt):
         return visitor.visit_block_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class If(Stmt):
     condition: Expr
     if_branch: Block
@@ -136,7 +143,7 @@ class If(Stmt):
         return visitor.visit_if_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class While(Stmt):
     condition: Expr
     body: Block
@@ -145,7 +152,7 @@ class While(Stmt):
         return visitor.visit_while_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class For(Stmt):
     body: Block
     initializer: Stmt | None = None
@@ -156,23 +163,23 @@ class For(Stmt):
         return visitor.visit_for_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Break(Stmt):
-    keyword: Token
+    keyword: Position
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_break_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Continue(Stmt):
-    keyword: Token
+    keyword: Position
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_continue_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Assert(Stmt):
     expression: Expr
     message_expression: Expr | None = None
@@ -181,32 +188,41 @@ class Assert(Stmt):
         return visitor.visit_assert_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Function(Stmt):
     name: Token
     params: List[Token]
     body: List[Stmt]
+    slot: int = field(default=-1, compare=False, repr=False)
+    is_cell: bool = field(default=False, compare=False, repr=False)
+    captures: List[Tuple[bool, int]] = field(
+        default_factory=list, compare=False, repr=False
+    )
+    cell_params: List[int] = field(default_factory=list, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_function_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Return(Stmt):
-    keyword: Token
+    keyword: Position
     value: Expr | None = None
+    is_tail_call: bool = field(default=False, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_return_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Class(Stmt):
     name: Token
     methods: List[Function]
     static_methods: List[Function]
     getters: List[Function]
     base_class: Variable | None = None
+    slot: int = field(default=-1, compare=False, repr=False)
+    is_cell: bool = field(default=False, compare=False, repr=False)
 
     def accept(self, visitor: Visitor[T]) -> T:
         return visitor.visit_class_stmt(self)
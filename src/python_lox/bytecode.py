@@ -0,0 +1,203 @@
+from dataclasses import dataclass, field
+from enum import IntEnum, auto
+from typing import Dict, List, Tuple
+
+from .lox_class import PropertyCache
+from .token import Token
+
+
+class OpCode(IntEnum):
+    """
+    Every instruction is two words long, the opcode followed by its operand. Instructions that do not need
+    an operand have 0 as the operand.
+    """
+
+    # Push constants[operand]
+    CONSTANT = auto()
+    POP = auto()
+
+    # Local variables live in the slots of the current frame. Locals captured by a closure are boxed in a
+    # Cell, and are accessed through the *_CELL instructions
+    GET_LOCAL = auto()
+    SET_LOCAL = auto()
+    DEFINE_LOCAL = auto()
+    GET_CELL = auto()
+    SET_CELL = auto()
+    DEFINE_CELL = auto()
+    DECLARE_LOCAL = auto()
+    DECLARE_CELL = auto()
+    GET_UPVALUE = auto()
+    SET_UPVALUE = auto()
+
+    # Operand is the index of the name in the constant pool
+    GET_GLOBAL = auto()
+    SET_GLOBAL = auto()
+    DEFINE_GLOBAL = auto()
+
+    GET_PROPERTY = auto()
+    SET_PROPERTY = auto()
+    SUPER = auto()
+    # Replaces the instance on top of the stack by the method and the instance, so that CALL_METHOD can
+    # pass the instance to the method without binding it. If the property is not a method, pushes its
+    # value and NOT_A_METHOD (see vm.py)
+    GET_METHOD = auto()
+
+    EQUAL = auto()
+    NOT_EQUAL = auto()
+    ADD = auto()
+    SUBTRACT = auto()
+    MULTIPLY = auto()
+    DIVIDE = auto()
+    MODULO = auto()
+    GREATER = auto()
+    GREATER_EQUAL = auto()
+    LESS = auto()
+    LESS_EQUAL = auto()
+    NEGATE = auto()
+    NOT = auto()
+    TYPEOF = auto()
+
+    # Operand is the absolute offset of the target instruction
+    JUMP = auto()
+    JUMP_IF_FALSE = auto()
+    JUMP_IF_TRUE = auto()
+    JUMP_IF_FALSE_OR_POP = auto()
+    JUMP_IF_TRUE_OR_POP = auto()
+
+    # Operand is the number of arguments
+    CALL = auto()
+    # Calls the result of GET_METHOD, operand is the number of arguments
+    CALL_METHOD = auto()
+    # Operand is the index of the CodeObject of the function in the constant pool
+    CLOSURE = auto()
+    # Operand is the index of the ClassTemplate in the constant pool
+    CLASS = auto()
+    RETURN = auto()
+
+    PRINT = auto()
+    PRINTLN = auto()
+    # Operand is 1 if there is a message on the stack, 0 otherwise
+    ASSERT_FAIL = auto()
+
+
+# Instructions whose operand is an index into the constant pool
+CONSTANT_OPERANDS = {
+    OpCode.CONSTANT,
+    OpCode.GET_GLOBAL,
+    OpCode.SET_GLOBAL,
+    OpCode.DEFINE_GLOBAL,
+    OpCode.GET_PROPERTY,
+    OpCode.SET_PROPERTY,
+    OpCode.GET_METHOD,
+    OpCode.CLOSURE,
+    OpCode.CLASS,
+}
+
+# Instructions whose operand is a slot in the current frame
+SLOT_OPERANDS = {
+    OpCode.GET_LOCAL,
+    OpCode.SET_LOCAL,
+    OpCode.DEFINE_LOCAL,
+    OpCode.GET_CELL,
+    OpCode.SET_CELL,
+    OpCode.DEFINE_CELL,
+    OpCode.DECLARE_LOCAL,
+    OpCode.DECLARE_CELL,
+}
+
+# Instructions whose operand is the offset of another instruction
+JUMP_OPERANDS = {
+    OpCode.JUMP,
+    OpCode.JUMP_IF_FALSE,
+    OpCode.JUMP_IF_TRUE,
+    OpCode.JUMP_IF_FALSE_OR_POP,
+    OpCode.JUMP_IF_TRUE_OR_POP,
+}
+
+
+@dataclass
+class CodeObject:
+    name: str
+    arity: int = 0
+    code: List[int] = field(default_factory=list)
+    constants: List[object] = field(default_factory=list)
+    # Source line of every instruction, indexed by offset // 2
+    lines: List[int] = field(default_factory=list)
+    # Tokens used for reporting errors, keyed by the offset of the instruction
+    tokens: Dict[int, Token] = field(default_factory=dict)
+    num_slots: int = 0
+    # For each upvalue of the function, (is_local, index). If is_local is True, the upvalue captures the
+    # cell in the given slot of the enclosing frame, otherwise it is the upvalue of the enclosing function
+    captures: List[Tuple[bool, int]] = field(default_factory=list)
+    # Parameters which are captured by a closure, and have to be boxed when the frame is created
+    cell_params: List[int] = field(default_factory=list)
+    is_method: bool = False
+    is_initializer: bool = False
+    slot_names: Dict[int, str] = field(default_factory=dict)
+    # Inline cache of every GET_PROPERTY, SET_PROPERTY and GET_METHOD instruction, keyed by its offset
+    property_caches: Dict[int, PropertyCache] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return f"<code {self.name}>"
+
+
+@dataclass
+class ClassTemplate:
+    name: Token
+    methods: List[str]
+    getters: List[str]
+    static_methods: List[str]
+    base_class: Token | None = None
+
+    def __str__(self) -> str:
+        return f"<class {self.name.string_repr}>"
+
+
+def disassemble(code: CodeObject) -> str:
+    """
+    Returns a human readable listing of the instructions of code, and of all the functions defined in it
+    """
+    lines: List[str] = [f"== {code.name} =="]
+    nested: List[CodeObject] = []
+    previous_line = -1
+    for offset in range(0, len(code.code), 2):
+        op = OpCode(code.code[offset])
+        operand = code.code[offset + 1]
+        line = code.lines[offset // 2]
+        line_str = "   |" if line == previous_line else f"{line:4d}"
+        previous_line = line
+
+        text = f"{offset:04d} {line_str} {op.name:<20}"
+        if op in CONSTANT_OPERANDS:
+            constant = code.constants[operand]
+            if isinstance(constant, CodeObject):
+                nested.append(constant)
+            text += f"{operand:4d} {constant_repr(constant)}"
+        elif op in SLOT_OPERANDS:
+            text += f"{operand:4d} {code.slot_names.get(operand, '')}"
+        elif op in JUMP_OPERANDS:
+            text += f"     -> {operand:04d}"
+        elif op in (
+            OpCode.GET_UPVALUE,
+            OpCode.SET_UPVALUE,
+            OpCode.CALL,
+            OpCode.CALL_METHOD,
+            OpCode.ASSERT_FAIL,
+        ):
+            text += f"{operand:4d}"
+        lines.append(text.rstrip())
+
+    for function in nested:
+        lines.append("")
+        lines.append(disassemble(function))
+    return "\n".join(lines)
+
+
+def constant_repr(constant: object) -> str:
+    if isinstance(constant, str):
+        return f"'{constant}'"
+    if constant is None:
+        return "nil"
+    if isinstance(constant, bool):
+        return "true" if constant else "false"
+    return str(constant)
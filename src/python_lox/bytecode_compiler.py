@@ -0,0 +1,606 @@
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Dict, List, Tuple, override
+
+from .ast import expr as Expr
+from .ast import stmt as Stmt
+from .bytecode import ClassTemplate, CodeObject, OpCode
+from .lox_class import PropertyCache
+from .position import SourceTable
+from .token import Token, TokenType
+
+"""
+Compiles a resolved program into bytecode for the virtual machine (see vm.py)
+
+Variables declared at the top level of the script are globals, and are looked up by name. All other variables
+are stored in the slots of their function's frame. When a local is captured by a closure, it is stored in a
+Cell instead, so that the closure and the frame share the variable. Since a variable can be captured after
+instructions that access it have been emitted, the compiler remembers where every local is accessed, and
+patches those instructions to their *_CELL variant when the local gets captured.
+"""
+
+BINARY_OPCODES: Dict[TokenType, OpCode] = {
+    TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+    TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+    TokenType.PLUS: OpCode.ADD,
+    TokenType.MINUS: OpCode.SUBTRACT,
+    TokenType.STAR: OpCode.MULTIPLY,
+    TokenType.SLASH: OpCode.DIVIDE,
+    TokenType.PERCENTAGE: OpCode.MODULO,
+    TokenType.GREATER: OpCode.GREATER,
+    TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+    TokenType.LESS: OpCode.LESS,
+    TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+}
+
+UNARY_OPCODES: Dict[TokenType, OpCode] = {
+    TokenType.MINUS: OpCode.NEGATE,
+    TokenType.BANG: OpCode.NOT,
+    TokenType.NOT: OpCode.NOT,
+    TokenType.TYPEOF: OpCode.TYPEOF,
+}
+
+CELL_OPCODES: Dict[int, OpCode] = {
+    OpCode.GET_LOCAL: OpCode.GET_CELL,
+    OpCode.SET_LOCAL: OpCode.SET_CELL,
+    OpCode.DEFINE_LOCAL: OpCode.DEFINE_CELL,
+    OpCode.DECLARE_LOCAL: OpCode.DECLARE_CELL,
+}
+
+
+class FunctionKind(Enum):
+    SCRIPT = auto()
+    FUNCTION = auto()
+    METHOD = auto()
+    INITIALIZER = auto()
+
+
+@dataclass
+class Local:
+    name: str
+    depth: int
+    slot: int
+    is_param: bool = False
+    captured: bool = False
+    # Offsets of the instructions which access this local
+    accesses: List[int] = field(default_factory=list)
+
+
+@dataclass
+class Loop:
+    # Offset to jump to on continue, or -1 if it is not yet known (for loops)
+    continue_target: int = -1
+    continue_jumps: List[int] = field(default_factory=list)
+    break_jumps: List[int] = field(default_factory=list)
+
+
+class FunctionState:
+    def __init__(
+        self, code: CodeObject, kind: FunctionKind, enclosing: "FunctionState | None"
+    ) -> None:
+        self.code = code
+        self.kind = kind
+        self.enclosing = enclosing
+        self.locals: List[Local] = []
+        self.scope_depth = 0
+        self.loops: List[Loop] = []
+
+
+class BytecodeCompiler(Expr.Visitor[None], Stmt.Visitor[None]):
+    def __init__(self, sources: SourceTable) -> None:
+        # For the tokens of the positions in the AST, which the bytecode keeps to report errors
+        self.sources = sources
+        self.state = FunctionState(
+            CodeObject(name="<script>"), FunctionKind.SCRIPT, None
+        )
+        self.line = 0
+
+    def compile(self, statements: List[Stmt.Stmt]) -> CodeObject:
+        """
+        Compiles the statements of a script into a code object which takes no arguments
+        """
+        self.state = FunctionState(
+            CodeObject(name="<script>"), FunctionKind.SCRIPT, None
+        )
+        for statement in statements:
+            statement.accept(self)
+        self.emit(OpCode.CONSTANT, self.constant(None))
+        self.emit(OpCode.RETURN)
+        return self.state.code
+
+    # Helpers for emitting code
+
+    def emit(self, op: OpCode, operand: int = 0, token: Token | None = None) -> int:
+        """
+        Appends an instruction to the current function, and returns its offset
+        """
+        code = self.state.code
+        offset = len(code.code)
+        if token is not None:
+            if token.line:
+                self.line = token.line
+            code.tokens[offset] = token
+        code.code.append(op)
+        code.code.append(operand)
+        code.lines.append(self.line)
+        return offset
+
+    def emit_property(self, op: OpCode, name: Token) -> None:
+        """
+        Emits an instruction which accesses the property name, with its inline cache
+        """
+        offset = self.emit(op, self.constant(name.string_repr), name)
+        self.state.code.property_caches[offset] = PropertyCache(name.string_repr)
+
+    def emit_jump(self, op: OpCode) -> int:
+        return self.emit(op, -1)
+
+    def patch_jump(self, offset: int, target: int | None = None) -> None:
+        """
+        Sets the target of the jump at offset to the next instruction, or to target if given
+        """
+        code = self.state.code.code
+        code[offset + 1] = len(code) if target is None else target
+
+    def here(self) -> int:
+        return len(self.state.code.code)
+
+    def constant(self, value: object) -> int:
+        constants = self.state.code.constants
+        for i, existing in enumerate(constants):
+            if type(existing) is type(value) and existing == value:
+                if not isinstance(value, (CodeObject, ClassTemplate)):
+                    return i
+        constants.append(value)
+        return len(constants) - 1
+
+    # Scopes and variables
+
+    def begin_scope(self) -> None:
+        self.state.scope_depth += 1
+
+    def end_scope(self) -> None:
+        self.state.scope_depth -= 1
+        locals_ = self.state.locals
+        while locals_ and locals_[-1].depth > self.state.scope_depth:
+            locals_.pop()
+
+    def is_global_scope(self) -> bool:
+        return self.state.kind == FunctionKind.SCRIPT and self.state.scope_depth == 0
+
+    def add_local(self, name: str, is_param: bool = False) -> Local:
+        state = self.state
+        local = Local(
+            name=name,
+            depth=state.scope_depth,
+            slot=len(state.locals),
+            is_param=is_param,
+        )
+        state.locals.append(local)
+        state.code.num_slots = max(state.code.num_slots, len(state.locals))
+        names = state.code.slot_names
+        if local.slot in names and name not in names[local.slot].split("/"):
+            names[local.slot] += f"/{name}"
+        else:
+            names[local.slot] = name
+        return local
+
+    def emit_local(self, op: OpCode, local: Local, token: Token | None = None) -> None:
+        if local.captured:
+            op = CELL_OPCODES[op]
+        local.accesses.append(self.emit(op, local.slot, token))
+
+    def capture(self, state: FunctionState, local: Local) -> None:
+        """
+        Moves local to a cell, and patches all the instructions that have already been emitted for it
+        """
+        if local.captured:
+            return
+        local.captured = True
+        code = state.code.code
+        for offset in local.accesses:
+            code[offset] = CELL_OPCODES[code[offset]]
+        if local.is_param:
+            state.code.cell_params.append(local.slot)
+
+    def resolve_local(self, state: FunctionState, name: str) -> Local | None:
+        for local in reversed(state.locals):
+            if local.name == name:
+                return local
+        return None
+
+    def resolve_upvalue(self, state: FunctionState, name: str) -> int | None:
+        if state.enclosing is None:
+            return None
+        local = self.resolve_local(state.enclosing, name)
+        if local is not None:
+            self.capture(state.enclosing, local)
+            return self.add_upvalue(state, True, local.slot)
+        index = self.resolve_upvalue(state.enclosing, name)
+        if index is not None:
+            return self.add_upvalue(state, False, index)
+        return None
+
+    def add_upvalue(self, state: FunctionState, is_local: bool, index: int) -> int:
+        captures = state.code.captures
+        capture: Tuple[bool, int] = (is_local, index)
+        if capture in captures:
+            return captures.index(capture)
+        captures.append(capture)
+        return len(captures) - 1
+
+    def load_variable(self, name: str, token: Token) -> None:
+        local = self.resolve_local(self.state, name)
+        if local is not None:
+            self.emit_local(OpCode.GET_LOCAL, local, token)
+            return
+        upvalue = self.resolve_upvalue(self.state, name)
+        if upvalue is not None:
+            self.emit(OpCode.GET_UPVALUE, upvalue, token)
+            return
+        self.emit(OpCode.GET_GLOBAL, self.constant(name), token)
+
+    def store_variable(self, name: str, token: Token) -> None:
+        """
+        Assigns the value on top of the stack to the variable, and leaves the value on the stack
+        """
+        local = self.resolve_local(self.state, name)
+        if local is not None:
+            self.emit_local(OpCode.SET_LOCAL, local, token)
+            return
+        upvalue = self.resolve_upvalue(self.state, name)
+        if upvalue is not None:
+            self.emit(OpCode.SET_UPVALUE, upvalue, token)
+            return
+        self.emit(OpCode.SET_GLOBAL, self.constant(name), token)
+
+    def define_variable(self, name: Token) -> None:
+        """
+        Declares a new variable in the current scope, and initializes it with the value on top of the stack
+        """
+        if self.is_global_scope():
+            self.emit(OpCode.DEFINE_GLOBAL, self.constant(name.string_repr), name)
+            return
+        local = self.add_local(name.string_repr)
+        self.emit_local(OpCode.DEFINE_LOCAL, local, name)
+
+    def declare_variable(self, name: Token) -> Local | None:
+        """
+        Declares a variable which can be referenced before it is initialized (by functions and classes that
+        refer to themselves). The variable is initialized later with initialize_variable
+        """
+        if self.is_global_scope():
+            return None
+        local = self.add_local(name.string_repr)
+        self.emit_local(OpCode.DECLARE_LOCAL, local, name)
+        return local
+
+    def initialize_variable(self, name: Token, local: Local | None) -> None:
+        if local is None:
+            self.emit(OpCode.DEFINE_GLOBAL, self.constant(name.string_repr), name)
+            return
+        self.emit_local(OpCode.SET_LOCAL, local, name)
+        self.emit(OpCode.POP)
+
+    def function(
+        self,
+        name: str,
+        params: List[Token],
+        body: List[Stmt.Stmt],
+        kind: FunctionKind,
+    ) -> None:
+        """
+        Compiles a function, and emits an instruction which creates a closure of it
+        """
+        code = CodeObject(
+            name=name,
+            arity=len(params),
+            is_method=kind in (FunctionKind.METHOD, FunctionKind.INITIALIZER),
+            is_initializer=kind == FunctionKind.INITIALIZER,
+        )
+        self.state = FunctionState(code, kind, self.state)
+        self.begin_scope()
+        if code.is_method:
+            self.add_local("this", is_param=True)
+        for param in params:
+            self.add_local(param.string_repr, is_param=True)
+
+        for statement in body:
+            statement.accept(self)
+        self.emit_return(None)
+
+        enclosing = self.state.enclosing
+        assert enclosing is not None
+        self.state = enclosing
+        self.emit(OpCode.CLOSURE, self.constant(code))
+
+    def emit_return(self, token: Token | None) -> None:
+        if self.state.kind == FunctionKind.INITIALIZER:
+            local = self.resolve_local(self.state, "this")
+            assert local is not None
+            self.emit_local(OpCode.GET_LOCAL, local, token)
+        else:
+            self.emit(OpCode.CONSTANT, self.constant(None), token)
+        self.emit(OpCode.RETURN)
+
+    # Expressions
+
+    @override
+    def visit_literal_expr(self, expr: Expr.Literal) -> None:
+        self.emit(OpCode.CONSTANT, self.constant(expr.value))
+
+    @override
+    def visit_grouping_expr(self, expr: Expr.Grouping) -> None:
+        expr.expression.accept(self)
+
+    @override
+    def visit_unary_expr(self, expr: Expr.Unary) -> None:
+        expr.right.accept(self)
+        self.emit(UNARY_OPCODES[expr.operator.token_type], token=expr.operator)
+
+    @override
+    def visit_binary_expr(self, expr: Expr.Binary) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+        self.emit(BINARY_OPCODES[expr.operator.token_type], token=expr.operator)
+
+    @override
+    def visit_comma_expr(self, expr: Expr.Comma) -> None:
+        expr.left.accept(self)
+        self.emit(OpCode.POP)
+        expr.right.accept(self)
+
+    @override
+    def visit_logical_expr(self, expr: Expr.Logical) -> None:
+        expr.left.accept(self)
+        if expr.operator.token_type == TokenType.OR:
+            jump = self.emit_jump(OpCode.JUMP_IF_TRUE_OR_POP)
+        else:
+            jump = self.emit_jump(OpCode.JUMP_IF_FALSE_OR_POP)
+        expr.right.accept(self)
+        self.patch_jump(jump)
+
+    @override
+    def visit_ternary_expr(self, expr: Expr.Ternary) -> None:
+        expr.condition.accept(self)
+        else_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+        expr.if_branch.accept(self)
+        end_jump = self.emit_jump(OpCode.JUMP)
+        self.patch_jump(else_jump)
+        expr.else_branch.accept(self)
+        self.patch_jump(end_jump)
+
+    @override
+    def visit_variable_expr(self, expr: Expr.Variable) -> None:
+        self.load_variable(expr.name.string_repr, expr.name)
+
+    @override
+    def visit_assign_expr(self, expr: Expr.Assign) -> None:
+        expr.value.accept(self)
+        self.store_variable(expr.name.string_repr, expr.name)
+
+    @override
+    def visit_call_expr(self, expr: Expr.Call) -> None:
+        if isinstance(expr.callee, Expr.Get):
+            expr.callee.obj.accept(self)
+            name = expr.callee.name
+            self.emit_property(OpCode.GET_METHOD, name)
+            for arg in expr.args:
+                arg.accept(self)
+            self.emit(
+                OpCode.CALL_METHOD, len(expr.args), self.sources.token_at(expr.paren)
+            )
+            return
+        expr.callee.accept(self)
+        for arg in expr.args:
+            arg.accept(self)
+        self.emit(OpCode.CALL, len(expr.args), self.sources.token_at(expr.paren))
+
+    @override
+    def visit_arrow_expr(self, expr: Expr.Arrow) -> None:
+        self.function("<arrow function>", expr.params, expr.body, FunctionKind.FUNCTION)
+
+    @override
+    def visit_get_expr(self, expr: Expr.Get) -> None:
+        expr.obj.accept(self)
+        self.emit_property(OpCode.GET_PROPERTY, expr.name)
+
+    @override
+    def visit_set_expr(self, expr: Expr.Set) -> None:
+        expr.obj.accept(self)
+        expr.value.accept(self)
+        self.emit_property(OpCode.SET_PROPERTY, expr.name)
+
+    @override
+    def visit_this_expr(self, expr: Expr.This) -> None:
+        self.load_variable("this", expr.keyword)
+
+    @override
+    def visit_super_expr(self, expr: Expr.Super) -> None:
+        self.load_variable("this", expr.keyword)
+        self.load_variable("super", expr.keyword)
+        self.emit(OpCode.SUPER, token=expr.keyword)
+
+    # Statements
+
+    @override
+    def visit_expression_stmt(self, stmt: Stmt.Expression) -> None:
+        stmt.expression.accept(self)
+        self.emit(OpCode.POP)
+
+    @override
+    def visit_print_stmt(self, stmt: Stmt.Print) -> None:
+        stmt.expression.accept(self)
+        self.emit(OpCode.PRINT)
+
+    @override
+    def visit_println_stmt(self, stmt: Stmt.Println) -> None:
+        stmt.expression.accept(self)
+        self.emit(OpCode.PRINTLN)
+
+    @override
+    def visit_var_stmt(self, stmt: Stmt.Var) -> None:
+        self.line = stmt.name.line
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+        else:
+            self.emit(OpCode.CONSTANT, self.constant(None))
+        self.define_variable(stmt.name)
+
+    @override
+    def visit_const_stmt(self, stmt: Stmt.Const) -> None:
+        self.line = stmt.name.line
+        stmt.initializer.accept(self)
+        self.define_variable(stmt.name)
+
+    @override
+    def visit_block_stmt(self, stmt: Stmt.Block) -> None:
+        self.begin_scope()
+        for statement in stmt.statements:
+            statement.accept(self)
+        self.end_scope()
+
+    @override
+    def visit_if_stmt(self, stmt: Stmt.If) -> None:
+        stmt.condition.accept(self)
+        else_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+        stmt.if_branch.accept(self)
+        if stmt.else_branch is None:
+            self.patch_jump(else_jump)
+            return
+        end_jump = self.emit_jump(OpCode.JUMP)
+        self.patch_jump(else_jump)
+        stmt.else_branch.accept(self)
+        self.patch_jump(end_jump)
+
+    @override
+    def visit_while_stmt(self, stmt: Stmt.While) -> None:
+        loop_start = self.here()
+        stmt.condition.accept(self)
+        exit_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+
+        loop = Loop(continue_target=loop_start)
+        self.state.loops.append(loop)
+        stmt.body.accept(self)
+        self.state.loops.pop()
+
+        self.emit(OpCode.JUMP, loop_start)
+        self.patch_jump(exit_jump)
+        for jump in loop.break_jumps:
+            self.patch_jump(jump)
+
+    @override
+    def visit_for_stmt(self, stmt: Stmt.For) -> None:
+        self.begin_scope()
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+
+        loop_start = self.here()
+        exit_jump = None
+        if stmt.condition is not None:
+            stmt.condition.accept(self)
+            exit_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+
+        loop = Loop()
+        self.state.loops.append(loop)
+        stmt.body.accept(self)
+        self.state.loops.pop()
+
+        for jump in loop.continue_jumps:
+            self.patch_jump(jump)
+        if stmt.update is not None:
+            stmt.update.accept(self)
+            self.emit(OpCode.POP)
+        self.emit(OpCode.JUMP, loop_start)
+
+        if exit_jump is not None:
+            self.patch_jump(exit_jump)
+        for jump in loop.break_jumps:
+            self.patch_jump(jump)
+        self.end_scope()
+
+    @override
+    def visit_break_stmt(self, stmt: Stmt.Break) -> None:
+        self.state.loops[-1].break_jumps.append(self.emit_jump(OpCode.JUMP))
+
+    @override
+    def visit_continue_stmt(self, stmt: Stmt.Continue) -> None:
+        loop = self.state.loops[-1]
+        if loop.continue_target >= 0:
+            self.emit(OpCode.JUMP, loop.continue_target)
+        else:
+            loop.continue_jumps.append(self.emit_jump(OpCode.JUMP))
+
+    @override
+    def visit_assert_stmt(self, stmt: Stmt.Assert) -> None:
+        stmt.expression.accept(self)
+        end_jump = self.emit_jump(OpCode.JUMP_IF_TRUE)
+        if stmt.message_expression is not None:
+            stmt.message_expression.accept(self)
+            self.emit(OpCode.ASSERT_FAIL, 1)
+        else:
+            self.emit(OpCode.ASSERT_FAIL, 0)
+        self.patch_jump(end_jump)
+
+    @override
+    def visit_function_stmt(self, stmt: Stmt.Function) -> None:
+        self.line = stmt.name.line
+        local = self.declare_variable(stmt.name)
+        self.function(
+            stmt.name.string_repr, stmt.params, stmt.body, FunctionKind.FUNCTION
+        )
+        self.initialize_variable(stmt.name, local)
+
+    @override
+    def visit_return_stmt(self, stmt: Stmt.Return) -> None:
+        keyword = self.sources.token_at(stmt.keyword)
+        self.line = keyword.line
+        if stmt.value is None:
+            self.emit_return(keyword)
+            return
+        stmt.value.accept(self)
+        self.emit(OpCode.RETURN, token=keyword)
+
+    @override
+    def visit_class_stmt(self, stmt: Stmt.Class) -> None:
+        self.line = stmt.name.line
+        local = self.declare_variable(stmt.name)
+        if stmt.base_class is not None:
+            # The base class is kept in a local named super, which the methods capture, so that super
+            # refers to the base class the class was created with
+            self.begin_scope()
+            stmt.base_class.accept(self)
+            super_local = self.add_local("super")
+            self.emit_local(OpCode.DEFINE_LOCAL, super_local, stmt.base_class.name)
+            self.emit_local(OpCode.GET_LOCAL, super_local)
+        else:
+            self.emit(OpCode.CONSTANT, self.constant(None))
+
+        for method in stmt.methods:
+            kind = FunctionKind.METHOD
+            if method.name.string_repr == "init":
+                kind = FunctionKind.INITIALIZER
+            self.function(method.name.string_repr, method.params, method.body, kind)
+        for getter in stmt.getters:
+            self.function(
+                getter.name.string_repr, getter.params, getter.body, FunctionKind.METHOD
+            )
+        for static_method in stmt.static_methods:
+            self.function(
+                static_method.name.string_repr,
+                static_method.params,
+                static_method.body,
+                FunctionKind.FUNCTION,
+            )
+
+        template = ClassTemplate(
+            name=stmt.name,
+            methods=[method.name.string_repr for method in stmt.methods],
+            getters=[getter.name.string_repr for getter in stmt.getters],
+            static_methods=[method.name.string_repr for method in stmt.static_methods],
+            base_class=stmt.base_class.name if stmt.base_class is not None else None,
+        )
+        self.emit(OpCode.CLASS, self.constant(template), stmt.name)
+        if stmt.base_class is not None:
+            self.end_scope()
+        self.initialize_variable(stmt.name, local)
@@ -2,13 +2,11 @@ from abc import ABC, abstractmethod
 from typing import TYPE_CHECKING, Final, List, override
 
 from .ast import expr, stmt
-from .environment import Environment
-from .exceptions import ReturnException
-from .token import Token, TokenType
+from .environment import Cell, Environment
 
 if TYPE_CHECKING:
     from .interpreter import Interpreter
-    from .lox_class import LoxInstance
+    from .lox_class import LoxClass, LoxInstance
 
 
 class Callable(ABC):
@@ -25,16 +23,79 @@ class Callable(ABC):
         pass
 
 
-class LoxFunction(Callable):
+class Method(Callable):
+    """
+    A callable which can be bound to an instance, so that it can be used as a method of a class
+    """
+
+    @abstractmethod
+    def bind(self, instance: "LoxInstance") -> "Method":
+        pass
+
+    def call_method(
+        self, interpreter: "Interpreter", this: "LoxInstance", args: List[object]
+    ) -> object:
+        """
+        Calls the method with this as the instance, without creating a bound method if possible
+        """
+        return self.bind(this).call(interpreter, args)
+
+
+class TailCall:
+    """
+    Returned by the body of a function in place of its value, when the function ends with a call in tail
+    position (see Resolver.visit_return_stmt). The call is made by the caller of the function, after the
+    frame of the function has been dropped, so tail recursion runs in constant python stack
+    """
+
+    __slots__ = ("function", "args")
+
+    def __init__(self, function: "LoxFunction | ArrowFunction", args: List[object]):
+        self.function = function
+        self.args = args
+
+
+def run_tail_calls(result: object, interpreter: "Interpreter") -> object:
+    """
+    Makes the pending tail calls in result, until a function returns a value
+    """
+    while isinstance(result, TailCall):
+        result = result.function.invoke(interpreter, result.args)
+    return result
+
+
+def new_frame(
+    declaration: stmt.Function | expr.Arrow, upvalues: List[Cell], values: List[object]
+) -> Environment:
+    """
+    Creates the environment of a call, whose first slots are the parameters in values. The parameters
+    captured by closures are moved to cells
+    """
+    for slot in declaration.cell_params:
+        values[slot] = Cell(values[slot])
+    return Environment(values=values, upvalues=upvalues)
+
+
+class LoxFunction(Method):
     def __init__(
         self,
         declaration: stmt.Function,
-        closure: Environment,
+        upvalues: List[Cell],
         is_initializer: bool = False,
+        super_class: "LoxClass | None" = None,
+        is_method: bool = False,
+        receiver: "LoxInstance | None" = None,
     ) -> None:
         self.declaration: Final[stmt.Function] = declaration
-        self.closure: Final[Environment] = closure
+        # Cells of the variables of enclosing functions which are used by the function
+        self.upvalues: Final[List[Cell]] = upvalues
         self.is_initializer = is_initializer
+        # Base class of the class which defines the method, "super" refers to it
+        self.super_class = super_class
+        # A method takes "this" (and "super" if the class has a base class) before its parameters
+        self.is_method = is_method
+        # Instance the method is bound to
+        self.receiver = receiver
 
     @override
     def name(self) -> str:
@@ -49,42 +110,69 @@ class LoxFunction(Callable):
 
     @override
     def call(self, interpreter: "Interpreter", args: List[object]) -> object:
-        environment = Environment(parent=self.closure)
-        for i in range(len(args)):
-            environment.declare(self.declaration.params[i])
-            environment.define(self.declaration.params[i], args[i])
-        try:
-            interpreter.execute_multiple_statements(self.declaration.body, environment)
-        except ReturnException as e:
-            if self.is_initializer:
-                tok = Token()
-                tok.token_type = TokenType.THIS
-                tok.string_repr = "this"
-                return self.closure.get_at(0, tok)
-            return e.value
+        return run_tail_calls(self.invoke(interpreter, args), interpreter)
+
+    @override
+    def call_method(
+        self, interpreter: "Interpreter", this: "LoxInstance", args: List[object]
+    ) -> object:
+        return run_tail_calls(self.invoke_method(interpreter, this, args), interpreter)
+
+    def invoke(self, interpreter: "Interpreter", args: List[object]) -> object:
+        """
+        Executes the body of the function once, the result may be a TailCall
+        """
+        if self.is_method:
+            assert self.receiver is not None, "Logic error: Calling an unbound method"
+            return self.invoke_method(interpreter, self.receiver, args)
+        # Parameters occupy the first slots of the function's scope
+        return self.run(interpreter, new_frame(self.declaration, self.upvalues, args))
+
+    def invoke_method(
+        self, interpreter: "Interpreter", this: "LoxInstance", args: List[object]
+    ) -> object:
+        """
+        Executes the body of the method once with this as the instance, see invoke
+        """
+        if self.super_class is None:
+            values = [this, *args]
+        else:
+            values = [this, self.super_class, *args]
+        result = self.run(
+            interpreter, new_frame(self.declaration, self.upvalues, values)
+        )
         if self.is_initializer:
-            tok = Token()
-            tok.token_type = TokenType.THIS
-            tok.string_repr = "this"
-            return self.closure.get_at(0, tok)
+            return this
+        return result
+
+    def run(self, interpreter: "Interpreter", environment: Environment) -> object:
+        """
+        Runs the body in the environment of the call, and returns the return value
+        """
+        # Break and continue cannot escape the body, so any completion is a return
+        completion = interpreter.execute_multiple_statements(
+            self.declaration.body, environment
+        )
+        if completion is not None:
+            return interpreter.return_value
         return None
 
+    @override
     def bind(self, instance: "LoxInstance") -> "LoxFunction":
-        environment = Environment(parent=self.closure)
-        environment.define("this", instance)
-        if instance.base_class_instance is not None:
-            environment.define("super", instance.base_class_instance)
         return LoxFunction(
             declaration=self.declaration,
-            closure=environment,
+            upvalues=self.upvalues,
             is_initializer=self.is_initializer,
+            super_class=self.super_class,
+            is_method=self.is_method,
+            receiver=instance,
         )
 
 
 class ArrowFunction(Callable):
-    def __init__(self, declaration: expr.Arrow, closure: Environment) -> None:
+    def __init__(self, declaration: expr.Arrow, upvalues: List[Cell]) -> None:
         self.declaration: Final[expr.Arrow] = declaration
-        self.closure: Final[Environment] = closure
+        self.upvalues: Final[List[Cell]] = upvalues
 
     @override
     def name(self) -> str:
@@ -99,12 +187,13 @@ class ArrowFunction(Callable):
 
     @override
     def call(self, interpreter: "Interpreter", args: List[object]) -> object:
-        environment = Environment(parent=self.closure)
-        for i in range(len(args)):
-            environment.declare(self.declaration.params[i])
-            environment.define(self.declaration.params[i], args[i])
-        try:
-            interpreter.execute_multiple_statements(self.declaration.body, environment)
-        except ReturnException as e:
-            return e.value
+        return run_tail_calls(self.invoke(interpreter, args), interpreter)
+
+    def invoke(self, interpreter: "Interpreter", args: List[object]) -> object:
+        environment = new_frame(self.declaration, self.upvalues, args)
+        completion = interpreter.execute_multiple_statements(
+            self.declaration.body, environment
+        )
+        if completion is not None:
+            return interpreter.return_value
         return None
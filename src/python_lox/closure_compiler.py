@@ -0,0 +1,759 @@
+import operator
+import sys
+import typing
+from typing import Dict, List, TextIO, override
+
+from .ast import expr as Expr
+from .ast import stmt as Stmt
+from .callable import ArrowFunction, LoxFunction, TailCall, new_frame
+from .environment import CELL, LOCAL, UPVALUE, Cell, Environment
+from .error_reporter import ErrorReporter
+from .exceptions import RuntimeException
+from .interpreter import Completion, Interpreter
+from .lox_class import LoxClass, LoxInstance, PropertyCache, SuperInstance
+from .token import TokenType
+
+"""
+The closure backend compiles every statement and expression of the resolved program once, into a tree of
+nested python closures. Each closure takes the current environment, and directly calls the closures of its
+children, so there is no visitor double dispatch, and no matching on the operator at run time.
+
+Runtime values (functions, classes, instances, environments) are shared with the tree walking interpreter,
+so the output of both backends is identical.
+"""
+
+ExprCode = typing.Callable[[Environment], object]
+# Statements return their completion, like Interpreter.execute
+StmtCode = typing.Callable[[Environment], Completion | None]
+
+NUMBERS = (int, float)
+
+# Operators that can be directly applied if both the operands are numbers
+NUMERIC_OPERATORS: Dict[
+    TokenType, typing.Callable[[typing.Any, typing.Any], object]
+] = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.PERCENTAGE: operator.mod,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+}
+
+
+class CompiledFunction(LoxFunction):
+    def __init__(
+        self,
+        declaration: Stmt.Function,
+        upvalues: List[Cell],
+        body: StmtCode,
+        is_initializer: bool = False,
+        super_class: LoxClass | None = None,
+        is_method: bool = False,
+        receiver: LoxInstance | None = None,
+    ) -> None:
+        super().__init__(
+            declaration, upvalues, is_initializer, super_class, is_method, receiver
+        )
+        self.body = body
+
+    @override
+    def run(self, interpreter: "Interpreter", environment: Environment) -> object:
+        if self.body(environment) is not None:
+            return interpreter.return_value
+        return None
+
+    @override
+    def bind(self, instance: LoxInstance) -> LoxFunction:
+        return CompiledFunction(
+            declaration=self.declaration,
+            upvalues=self.upvalues,
+            body=self.body,
+            is_initializer=self.is_initializer,
+            super_class=self.super_class,
+            is_method=self.is_method,
+            receiver=instance,
+        )
+
+
+class CompiledArrowFunction(ArrowFunction):
+    def __init__(
+        self, declaration: Expr.Arrow, upvalues: List[Cell], body: StmtCode
+    ) -> None:
+        super().__init__(declaration, upvalues)
+        self.body = body
+
+    @override
+    def invoke(self, interpreter: "Interpreter", args: List[object]) -> object:
+        if self.body(new_frame(self.declaration, self.upvalues, args)) is not None:
+            return interpreter.return_value
+        return None
+
+
+class ClosureCompiler(Expr.Visitor[ExprCode], Stmt.Visitor[StmtCode]):
+    def __init__(self, interpreter: "ClosureInterpreter") -> None:
+        self.interpreter = interpreter
+
+    def compile_expr(self, expr: Expr.Expr) -> ExprCode:
+        return expr.accept(self)
+
+    def compile_stmt(self, stmt: Stmt.Stmt) -> StmtCode:
+        return stmt.accept(self)
+
+    def compile_statements(self, stmts: List[Stmt.Stmt]) -> StmtCode:
+        """
+        Compiles a list of statements into a single closure which executes them in order
+        """
+        codes = tuple(self.compile_stmt(statement) for statement in stmts)
+        if len(codes) == 1:
+            return codes[0]
+
+        def statements(env: Environment) -> Completion | None:
+            for code in codes:
+                completion = code(env)
+                if completion is not None:
+                    return completion
+            return None
+
+        return statements
+
+    @override
+    def visit_literal_expr(self, expr: Expr.Literal) -> ExprCode:
+        value = expr.value
+
+        def literal(env: Environment) -> object:
+            return value
+
+        return literal
+
+    @override
+    def visit_grouping_expr(self, expr: Expr.Grouping) -> ExprCode:
+        return self.compile_expr(expr.expression)
+
+    @override
+    def visit_unary_expr(self, expr: Expr.Unary) -> ExprCode:
+        right = self.compile_expr(expr.right)
+        op = expr.operator
+        unary_operation = self.interpreter.unary_operation
+
+        def unary(env: Environment) -> object:
+            return unary_operation(op, right(env))
+
+        return unary
+
+    @override
+    def visit_not_expr(self, expr: Expr.Not) -> ExprCode:
+        right = self.compile_expr(expr.right)
+        is_truthy = self.interpreter.is_truthy
+
+        def negation(env: Environment) -> object:
+            return not is_truthy(right(env))
+
+        return negation
+
+    @override
+    def visit_negate_expr(self, expr: Expr.Negate) -> ExprCode:
+        right = self.compile_expr(expr.right)
+        op = expr.operator
+        unary_operation = self.interpreter.unary_operation
+
+        def minus(env: Environment) -> object:
+            value = right(env)
+            if type(value) in NUMBERS:
+                return -value  # type: ignore
+            return unary_operation(op, value)
+
+        return minus
+
+    @override
+    def visit_binary_expr(self, expr: Expr.Binary) -> ExprCode:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        op = expr.operator
+        binary_operation = self.interpreter.binary_operation
+
+        fast_operator = NUMERIC_OPERATORS.get(op.token_type)
+        if fast_operator is not None:
+
+            def numeric(env: Environment) -> object:
+                a = left(env)
+                b = right(env)
+                if type(a) in NUMBERS and type(b) in NUMBERS:
+                    return fast_operator(a, b)
+                return binary_operation(op, a, b)
+
+            return numeric
+
+        def binary(env: Environment) -> object:
+            return binary_operation(op, left(env), right(env))
+
+        return binary
+
+    @override
+    def visit_comma_expr(self, expr: Expr.Comma) -> ExprCode:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+
+        def comma(env: Environment) -> object:
+            left(env)
+            return right(env)
+
+        return comma
+
+    @override
+    def visit_equal_expr(self, expr: Expr.Equal) -> ExprCode:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        is_equal = self.interpreter.is_equal
+
+        def equal(env: Environment) -> object:
+            return is_equal(left(env), right(env))
+
+        return equal
+
+    @override
+    def visit_not_equal_expr(self, expr: Expr.NotEqual) -> ExprCode:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        is_equal = self.interpreter.is_equal
+
+        def not_equal(env: Environment) -> object:
+            return not is_equal(left(env), right(env))
+
+        return not_equal
+
+    @override
+    def visit_logical_expr(self, expr: Expr.Logical) -> ExprCode:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        is_truthy = self.interpreter.is_truthy
+
+        if expr.operator.token_type == TokenType.OR:
+
+            def logical_or(env: Environment) -> object:
+                value = left(env)
+                if is_truthy(value):
+                    return value
+                return right(env)
+
+            return logical_or
+
+        def logical_and(env: Environment) -> object:
+            value = left(env)
+            if not is_truthy(value):
+                return value
+            return right(env)
+
+        return logical_and
+
+    @override
+    def visit_ternary_expr(self, expr: Expr.Ternary) -> ExprCode:
+        condition = self.compile_expr(expr.condition)
+        if_branch = self.compile_expr(expr.if_branch)
+        else_branch = self.compile_expr(expr.else_branch)
+        is_truthy = self.interpreter.is_truthy
+
+        def ternary(env: Environment) -> object:
+            if is_truthy(condition(env)):
+                return if_branch(env)
+            return else_branch(env)
+
+        return ternary
+
+    @override
+    def visit_variable_expr(self, expr: Expr.Variable) -> ExprCode:
+        return self.variable(expr)
+
+    def variable(self, expr: Expr.Variable | Expr.This | Expr.Super) -> ExprCode:
+        slot = expr.slot
+
+        if expr.access == LOCAL:
+
+            def local_variable(env: Environment) -> object:
+                return env.values[slot]
+
+            return local_variable
+
+        if expr.access == CELL:
+
+            def cell_variable(env: Environment) -> object:
+                return env.values[slot].value  # type: ignore
+
+            return cell_variable
+
+        if expr.access == UPVALUE:
+
+            def upvalue(env: Environment) -> object:
+                return env.upvalues[slot].value
+
+            return upvalue
+
+        # The global environments do not change, only their values grow
+        values = self.interpreter.program_environment.ancestor(expr.depth).values
+
+        def global_variable(env: Environment) -> object:
+            return values[slot]
+
+        return global_variable
+
+    @override
+    def visit_assign_expr(self, expr: Expr.Assign) -> ExprCode:
+        slot = expr.slot
+        value_code = self.compile_expr(expr.value)
+
+        if expr.access == LOCAL:
+
+            def assign_local(env: Environment) -> object:
+                value = env.values[slot] = value_code(env)
+                return value
+
+            return assign_local
+
+        if expr.access == CELL:
+
+            def assign_cell(env: Environment) -> object:
+                value = env.values[slot].value = value_code(env)  # type: ignore
+                return value
+
+            return assign_cell
+
+        if expr.access == UPVALUE:
+
+            def assign_upvalue(env: Environment) -> object:
+                value = env.upvalues[slot].value = value_code(env)
+                return value
+
+            return assign_upvalue
+
+        values = self.interpreter.program_environment.ancestor(expr.depth).values
+
+        def assign_global(env: Environment) -> object:
+            value = values[slot] = value_code(env)
+            return value
+
+        return assign_global
+
+    @override
+    def visit_call_expr(self, expr: Expr.Call) -> ExprCode:
+        if isinstance(expr.callee, Expr.Get):
+            return self.method_call(expr, expr.callee)
+        callee = self.compile_expr(expr.callee)
+        args = tuple(self.compile_expr(arg) for arg in expr.args)
+        paren = expr.paren
+        call_function = self.interpreter.call_function
+
+        def call(env: Environment) -> object:
+            function = callee(env)
+            return call_function(function, [arg(env) for arg in args], paren)
+
+        return call
+
+    def method_call(self, expr: Expr.Call, callee: Expr.Get) -> ExprCode:
+        """
+        Compiles a call of a property, a method is called with the instance as this without binding it
+        """
+        obj_code = self.compile_expr(callee.obj)
+        name = callee.name
+        key = name.string_repr
+        args = tuple(self.compile_expr(arg) for arg in expr.args)
+        paren = expr.paren
+        interpreter = self.interpreter
+        check_instance = interpreter.check_instance
+        check_call = interpreter.check_call
+        call_function = interpreter.call_function
+        cache = PropertyCache(key)
+
+        def method_call(env: Environment) -> object:
+            instance = check_instance(obj_code(env), name)
+            method = instance.find_method_cached(cache)
+            if method is None:
+                function = instance.get_cached(name, interpreter, cache)
+                return call_function(function, [arg(env) for arg in args], paren)
+            values = [arg(env) for arg in args]
+            check_call(method, values, paren)
+            return method.call_method(interpreter, instance, values)
+
+        return method_call
+
+    @override
+    def visit_arrow_expr(self, expr: Expr.Arrow) -> ExprCode:
+        body = self.compile_statements(expr.body)
+
+        captures = expr.captures
+
+        def arrow(env: Environment) -> object:
+            return CompiledArrowFunction(expr, env.capture(captures), body)
+
+        return arrow
+
+    @override
+    def visit_get_expr(self, expr: Expr.Get) -> ExprCode:
+        obj_code = self.compile_expr(expr.obj)
+        name = expr.name
+        interpreter = self.interpreter
+
+        check_instance = interpreter.check_instance
+        cache = PropertyCache(name.string_repr)
+
+        def get(env: Environment) -> object:
+            return check_instance(obj_code(env), name).get_cached(
+                name, interpreter, cache
+            )
+
+        return get
+
+    @override
+    def visit_set_expr(self, expr: Expr.Set) -> ExprCode:
+        obj_code = self.compile_expr(expr.obj)
+        value_code = self.compile_expr(expr.value)
+        name = expr.name
+        cache = PropertyCache(name.string_repr)
+
+        def set_(env: Environment) -> object:
+            obj = obj_code(env)
+            if not isinstance(obj, LoxInstance):
+                raise RuntimeException(
+                    "Only instances of class have fields", token=name
+                )
+            value = value_code(env)
+            obj.set_cached(name, value, cache)
+            return value
+
+        return set_
+
+    @override
+    def visit_this_expr(self, expr: Expr.This) -> ExprCode:
+        return self.variable(expr)
+
+    @override
+    def visit_super_expr(self, expr: Expr.Super) -> ExprCode:
+        # See Interpreter.visit_super_expr
+        assert expr.this is not None, "Logic error: super is not resolved"
+        this = self.variable(expr.this)
+        base_class = self.variable(expr)
+
+        def super_(env: Environment) -> object:
+            return SuperInstance(this(env), base_class(env))  # type: ignore
+
+        return super_
+
+    @override
+    def visit_expression_stmt(self, stmt: Stmt.Expression) -> StmtCode:
+        expression = self.compile_expr(stmt.expression)
+
+        def expression_statement(env: Environment) -> None:
+            expression(env)
+
+        return expression_statement
+
+    @override
+    def visit_print_stmt(self, stmt: Stmt.Print) -> StmtCode:
+        expression = self.compile_expr(stmt.expression)
+        interpreter = self.interpreter
+
+        def print_statement(env: Environment) -> None:
+            result = interpreter.stringify(expression(env))
+            print(result, file=interpreter.stdout, end="")
+
+        return print_statement
+
+    @override
+    def visit_println_stmt(self, stmt: Stmt.Println) -> StmtCode:
+        expression = self.compile_expr(stmt.expression)
+        interpreter = self.interpreter
+
+        def println_statement(env: Environment) -> None:
+            result = interpreter.stringify(expression(env))
+            print(result, file=interpreter.stdout)
+
+        return println_statement
+
+    @override
+    def visit_var_stmt(self, stmt: Stmt.Var) -> StmtCode:
+        slot = stmt.slot
+        if stmt.initializer is None:
+            is_cell = stmt.is_cell
+
+            def declaration(env: Environment) -> None:
+                env.define(slot, Cell() if is_cell else None)
+
+            return declaration
+
+        return self.definition(slot, stmt.is_cell, self.compile_expr(stmt.initializer))
+
+    def definition(self, slot: int, is_cell: bool, initializer: ExprCode) -> StmtCode:
+        if is_cell:
+
+            def cell_definition(env: Environment) -> None:
+                env.define(slot, Cell(initializer(env)))
+
+            return cell_definition
+
+        def definition(env: Environment) -> None:
+            env.define(slot, initializer(env))
+
+        return definition
+
+    @override
+    def visit_const_stmt(self, stmt: Stmt.Const) -> StmtCode:
+        return self.definition(
+            stmt.slot, stmt.is_cell, self.compile_expr(stmt.initializer)
+        )
+
+    @override
+    def visit_block_stmt(self, stmt: Stmt.Block) -> StmtCode:
+        # The variables of the block are stored in the environment of the function
+        return self.compile_statements(stmt.statements)
+
+    @override
+    def visit_if_stmt(self, stmt: Stmt.If) -> StmtCode:
+        condition = self.compile_expr(stmt.condition)
+        if_branch = self.compile_stmt(stmt.if_branch)
+        is_truthy = self.interpreter.is_truthy
+
+        if stmt.else_branch is None:
+
+            def if_statement(env: Environment) -> Completion | None:
+                if is_truthy(condition(env)):
+                    return if_branch(env)
+                return None
+
+            return if_statement
+
+        else_branch = self.compile_stmt(stmt.else_branch)
+
+        def if_else_statement(env: Environment) -> Completion | None:
+            if is_truthy(condition(env)):
+                return if_branch(env)
+            return else_branch(env)
+
+        return if_else_statement
+
+    @override
+    def visit_while_stmt(self, stmt: Stmt.While) -> StmtCode:
+        condition = self.compile_expr(stmt.condition)
+        body = self.compile_stmt(stmt.body)
+        is_truthy = self.interpreter.is_truthy
+
+        def while_statement(env: Environment) -> Completion | None:
+            while is_truthy(condition(env)):
+                completion = body(env)
+                if completion is Completion.BREAK:
+                    break
+                if completion is Completion.RETURN:
+                    return completion
+            return None
+
+        return while_statement
+
+    @override
+    def visit_for_stmt(self, stmt: Stmt.For) -> StmtCode:
+        initializer = self.compile_stmt(stmt.initializer) if stmt.initializer else None
+        condition = self.compile_expr(stmt.condition) if stmt.condition else None
+        update = self.compile_expr(stmt.update) if stmt.update else None
+        body = self.compile_stmt(stmt.body)
+        is_truthy = self.interpreter.is_truthy
+
+        def for_statement(env: Environment) -> Completion | None:
+            if initializer is not None:
+                initializer(env)
+            while condition is None or is_truthy(condition(env)):
+                completion = body(env)
+                if completion is Completion.BREAK:
+                    break
+                if completion is Completion.RETURN:
+                    return completion
+                if update is not None:
+                    update(env)
+            return None
+
+        return for_statement
+
+    @override
+    def visit_break_stmt(self, stmt: Stmt.Break) -> StmtCode:
+        def break_statement(env: Environment) -> Completion | None:
+            return Completion.BREAK
+
+        return break_statement
+
+    @override
+    def visit_continue_stmt(self, stmt: Stmt.Continue) -> StmtCode:
+        def continue_statement(env: Environment) -> Completion | None:
+            return Completion.CONTINUE
+
+        return continue_statement
+
+    @override
+    def visit_assert_stmt(self, stmt: Stmt.Assert) -> StmtCode:
+        expression = self.compile_expr(stmt.expression)
+        message = (
+            self.compile_expr(stmt.message_expression)
+            if stmt.message_expression
+            else None
+        )
+        is_truthy = self.interpreter.is_truthy
+
+        def assert_statement(env: Environment) -> None:
+            if not is_truthy(expression(env)):
+                if message is not None:
+                    raise RuntimeException(
+                        f"Assertion Error: {message(env)}", exp=stmt.expression
+                    )
+                raise RuntimeException("Assertion Error: ", exp=stmt.expression)
+
+        return assert_statement
+
+    @override
+    def visit_function_stmt(self, stmt: Stmt.Function) -> StmtCode:
+        slot = stmt.slot
+        body = self.compile_statements(stmt.body)
+        captures = stmt.captures
+
+        if stmt.is_cell:
+
+            def cell_function(env: Environment) -> None:
+                # The cell is created first, since the function can capture itself
+                cell = Cell()
+                env.define(slot, cell)
+                cell.value = CompiledFunction(stmt, env.capture(captures), body)
+
+            return cell_function
+
+        def function(env: Environment) -> None:
+            env.define(slot, CompiledFunction(stmt, env.capture(captures), body))
+
+        return function
+
+    @override
+    def visit_return_stmt(self, stmt: Stmt.Return) -> StmtCode:
+        interpreter = self.interpreter
+        if stmt.value is None:
+
+            def return_nil(env: Environment) -> Completion | None:
+                interpreter.return_value = None
+                return Completion.RETURN
+
+            return return_nil
+
+        if stmt.is_tail_call:
+            assert isinstance(stmt.value, Expr.Call)
+            return self.compile_tail_call(stmt.value)
+
+        value = self.compile_expr(stmt.value)
+
+        def return_statement(env: Environment) -> Completion | None:
+            interpreter.return_value = value(env)
+            return Completion.RETURN
+
+        return return_statement
+
+    def compile_tail_call(self, expr: Expr.Call) -> StmtCode:
+        """
+        Compiles "return f(...)", see Interpreter.tail_call
+        """
+        interpreter = self.interpreter
+        callee = self.compile_expr(expr.callee)
+        args = tuple(self.compile_expr(arg) for arg in expr.args)
+        paren = expr.paren
+        check_call = interpreter.check_call
+
+        def tail_call(env: Environment) -> Completion | None:
+            function = callee(env)
+            values = [arg(env) for arg in args]
+            function = check_call(function, values, paren)
+            if isinstance(function, (LoxFunction, ArrowFunction)):
+                interpreter.return_value = TailCall(function, values)
+            else:
+                interpreter.return_value = function.call(interpreter, values)
+            return Completion.RETURN
+
+        return tail_call
+
+    @override
+    def visit_class_stmt(self, stmt: Stmt.Class) -> StmtCode:
+        name = stmt.name
+        base_class_code = (
+            self.compile_expr(stmt.base_class) if stmt.base_class is not None else None
+        )
+        methods = [(m, self.compile_statements(m.body)) for m in stmt.methods]
+        static_methods = [
+            (m, self.compile_statements(m.body)) for m in stmt.static_methods
+        ]
+        getters = [(m, self.compile_statements(m.body)) for m in stmt.getters]
+        slot = stmt.slot
+        is_cell = stmt.is_cell
+
+        def class_statement(env: Environment) -> None:
+            # The methods can capture the class
+            cell = Cell() if is_cell else None
+            env.define(slot, cell)
+            base_class: LoxClass | None = None
+            if base_class_code is not None and stmt.base_class is not None:
+                cls = base_class_code(env)
+                if not isinstance(cls, LoxClass):
+                    raise RuntimeException(
+                        f'Error: class "{name.string_repr}" cannot derive from "{stmt.base_class.name.string_repr}" since "{stmt.base_class.name.string_repr}" is not a class',
+                        token=name,
+                    )
+                base_class = cls
+
+            classobj = LoxClass(
+                name.string_repr,
+                {
+                    m.name.string_repr: CompiledFunction(
+                        m,
+                        env.capture(m.captures),
+                        body,
+                        is_initializer=(m.name.string_repr == "init"),
+                        super_class=base_class,
+                        is_method=True,
+                    )
+                    for m, body in methods
+                },
+                getters={
+                    m.name.string_repr: CompiledFunction(
+                        m,
+                        env.capture(m.captures),
+                        body,
+                        super_class=base_class,
+                        is_method=True,
+                    )
+                    for m, body in getters
+                },
+                base_class=base_class,
+                static_methods={
+                    m.name.string_repr: CompiledFunction(
+                        m, env.capture(m.captures), body
+                    )
+                    for m, body in static_methods
+                },
+            )
+            if cell is None:
+                env.define(slot, classobj)
+            else:
+                cell.value = classobj
+
+        return class_statement
+
+
+class ClosureInterpreter(Interpreter):
+    """
+    Interpreter which compiles each statement into closures (see ClosureCompiler) before running it
+    """
+
+    def __init__(
+        self, error_reporter: ErrorReporter | None = None, stdout: TextIO = sys.stdout
+    ) -> None:
+        super().__init__(error_reporter=error_reporter, stdout=stdout)
+        self.compiler = ClosureCompiler(self)
+
+    @override
+    def execute(self, statement: Stmt.Stmt) -> Completion | None:
+        return self.compiler.compile_stmt(statement)(self.environment)
+
+    @override
+    def supports_deep_expressions(self) -> bool:
+        # The compiler, and the closures it creates, recurse into expressions
+        return False
@@ -0,0 +1,523 @@
+import math
+from typing import Any, Callable, Dict, List, Tuple, override
+
+from .ast import expr as Expr
+from .ast import stmt as Stmt
+from .error_reporter import ErrorReporter
+from .exceptions import TypeException
+from .interpreter import Interpreter
+from .token import Token, TokenType
+
+"""
+The constant folder runs on the resolved program, before it is executed. It evaluates the operators whose
+operands are literals, replaces the uses of constants declared with a literal value by that value, and
+removes the branches of if and while statements whose condition is known.
+
+Operators are evaluated with the interpreter, so a folded expression has the same value as it would have at
+run time. An operator whose literal operands are of types it does not support (for example 1 + "a") is
+reported as an error through the error reporter, and the program is not run. Other errors, such as division
+by zero, are left to run time.
+"""
+
+
+class ConstantFolder(Expr.Visitor[Expr.Expr], Stmt.Visitor[Stmt.Stmt | None]):
+    def __init__(
+        self, interpreter: Interpreter, error_reporter: ErrorReporter | None = None
+    ) -> None:
+        self.interpreter = interpreter
+        self.error_reporter = error_reporter
+        # For every name declared in a scope, its value if it is a constant with a literal value, or None.
+        # Uses of names which are not found are left as they are
+        self.scopes: List[Dict[str, Expr.Literal | None]] = [{}]
+
+    def fold(self, statements: List[Stmt.Stmt]) -> List[Stmt.Stmt]:
+        """
+        Folds the statements of a resolved program, the declarations are kept for the next call (REPL)
+        """
+        return self.fold_statements(statements)
+
+    def fold_statements(self, statements: List[Stmt.Stmt]) -> List[Stmt.Stmt]:
+        folded: List[Stmt.Stmt] = []
+        for statement in statements:
+            result = statement.accept(self)
+            if result is not None:
+                folded.append(result)
+        return folded
+
+    def fold_expr(self, expr: Expr.Expr) -> Expr.Expr:
+        return expr.accept(self)
+
+    def fold_block(self, block: Stmt.Block) -> Stmt.Block:
+        self.begin_scope()
+        block.statements = self.fold_statements(block.statements)
+        self.end_scope()
+        return block
+
+    def begin_scope(self) -> None:
+        self.scopes.append({})
+
+    def end_scope(self) -> None:
+        self.scopes.pop()
+
+    def declare(self, name: Token, value: Expr.Literal | None = None) -> None:
+        self.scopes[-1][name.string_repr] = value
+
+    def fold_function(
+        self, params: List[Token], body: List[Stmt.Stmt]
+    ) -> List[Stmt.Stmt]:
+        self.begin_scope()
+        for param in params:
+            self.declare(param)
+        folded = self.fold_statements(body)
+        self.end_scope()
+        return folded
+
+    def apply(
+        self, expr: Expr.Unary | Expr.Binary, operation: Callable[[Any], object]
+    ) -> Expr.Literal | None:
+        """
+        Evaluates an operator whose operands are literals with operation, the visit method of the interpreter
+        for the operator, and returns the result as a literal. Returns None if the operation cannot be done at
+        compile time
+        """
+        try:
+            value = operation(expr)
+        except TypeException as e:
+            # The operator fails whenever it is run. The message is labelled as a run time error, the label
+            # is replaced since it is reported before the program runs
+            if self.error_reporter is not None:
+                message = str(e).split(": ", 1)[-1]
+                self.error_reporter.report(
+                    "error", f"Type Error: {message}", token=e.token
+                )
+            return None
+        except Exception:
+            # For example, division by zero, which is left to fail at run time, if the code is reached
+            return None
+        # Infinity and nan cannot be written as literals
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return Expr.Literal(value=value)
+
+    @override
+    def visit_literal_expr(self, expr: Expr.Literal) -> Expr.Expr:
+        return expr
+
+    # fold_grouping, fold_operation and fold_comma fold an expression whose operands are already folded
+    def fold_grouping(self, expr: Expr.Grouping) -> Expr.Expr:
+        if isinstance(expr.expression, Expr.Literal):
+            return expr.expression
+        return expr
+
+    def fold_operation(
+        self, expr: Expr.Unary | Expr.Binary, operation: Callable[[Any], object]
+    ) -> Expr.Expr:
+        if isinstance(expr, Expr.Unary):
+            if not isinstance(expr.right, Expr.Literal):
+                return expr
+        elif not isinstance(expr.left, Expr.Literal) or not isinstance(
+            expr.right, Expr.Literal
+        ):
+            return expr
+        return self.apply(expr, operation) or expr
+
+    def fold_comma(self, expr: Expr.Comma) -> Expr.Expr:
+        if isinstance(expr.left, Expr.Literal):
+            # Evaluating a literal has no side effects
+            return expr.right
+        return expr
+
+    def fold_unary(
+        self, expr: Expr.Unary, operation: Callable[[Any], object]
+    ) -> Expr.Expr:
+        expr.right = self.fold_expr(expr.right)
+        return self.fold_operation(expr, operation)
+
+    def fold_binary(
+        self, expr: Expr.Binary, operation: Callable[[Any], object]
+    ) -> Expr.Expr:
+        expr.left = self.fold_expr(expr.left)
+        expr.right = self.fold_expr(expr.right)
+        return self.fold_operation(expr, operation)
+
+    def decides(self, expr: Expr.Logical, left: Expr.Literal) -> bool:
+        """
+        Returns True if the value of the logical expression is its left operand, the right one is not evaluated
+        """
+        is_truthy = self.interpreter.is_truthy(left.value)
+        return is_truthy == (expr.operator.token_type == TokenType.OR)
+
+    def fold_iteratively(self, expr: Expr.Expr) -> Expr.Expr:
+        """
+        Folds an expression with a stack of the expressions left to fold, and a stack of the folded
+        expressions, instead of recursing into the operands, so that the expressions marked Deep are folded
+        too. Each expression is folded as by its visit method
+        """
+        # An expression is pushed with step 0 to be folded. It pushes itself back with a later step, below
+        # its operands, to use them once they are folded
+        work: List[Tuple[Expr.Expr, int]] = [(expr, 0)]
+        folded: List[Expr.Expr] = []
+        while work:
+            expr, step = work.pop()
+            match expr:
+                case Expr.Grouping():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.expression, 0))
+                    else:
+                        expr.expression = folded[-1]
+                        folded[-1] = self.fold_grouping(expr)
+                case Expr.Unary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.right, 0))
+                    else:
+                        expr.right = folded[-1]
+                        # Evaluated with the visit method of the interpreter for the operator
+                        folded[-1] = self.fold_operation(
+                            expr, self.interpreter.evaluate
+                        )
+                case Expr.Binary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.right, 0))
+                        work.append((expr.left, 0))
+                    else:
+                        expr.right = folded.pop()
+                        expr.left = folded[-1]
+                        if isinstance(expr, Expr.Comma):
+                            folded[-1] = self.fold_comma(expr)
+                        else:
+                            folded[-1] = self.fold_operation(
+                                expr, self.interpreter.evaluate
+                            )
+                case Expr.Logical():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.left, 0))
+                    elif step == 1:
+                        expr.left = folded[-1]
+                        if not isinstance(expr.left, Expr.Literal):
+                            work.append((expr, 2))
+                            work.append((expr.right, 0))
+                        elif not self.decides(expr, expr.left):
+                            # The value is the right operand, which replaces the left one
+                            folded.pop()
+                            work.append((expr.right, 0))
+                    else:
+                        expr.right = folded.pop()
+                        folded[-1] = expr
+                case Expr.Ternary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.condition, 0))
+                    elif step == 1:
+                        expr.condition = folded.pop()
+                        if not isinstance(expr.condition, Expr.Literal):
+                            work.append((expr, 2))
+                            work.append((expr.else_branch, 0))
+                            work.append((expr.if_branch, 0))
+                        elif self.interpreter.is_truthy(expr.condition.value):
+                            work.append((expr.if_branch, 0))
+                        else:
+                            work.append((expr.else_branch, 0))
+                    else:
+                        expr.else_branch = folded.pop()
+                        expr.if_branch = folded[-1]
+                        folded[-1] = expr
+                case Expr.Call():
+                    if step == 0:
+                        work.append((expr, 1))
+                        for arg in reversed(expr.args):
+                            work.append((arg, 0))
+                        work.append((expr.callee, 0))
+                    else:
+                        start = len(folded) - len(expr.args)
+                        expr.args = folded[start:]
+                        del folded[start:]
+                        expr.callee = folded[-1]
+                        folded[-1] = expr
+                case Expr.Get():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.obj, 0))
+                    else:
+                        expr.obj = folded[-1]
+                        folded[-1] = expr
+                case Expr.Set():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.value, 0))
+                        work.append((expr.obj, 0))
+                    else:
+                        expr.value = folded.pop()
+                        expr.obj = folded[-1]
+                        folded[-1] = expr
+                case Expr.Assign():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.value, 0))
+                    else:
+                        expr.value = folded[-1]
+                        folded[-1] = expr
+                case _:
+                    folded.append(expr.accept(self))
+        return folded.pop()
+
+    @override
+    def visit_grouping_expr(self, expr: Expr.Grouping) -> Expr.Expr:
+        expr.expression = self.fold_expr(expr.expression)
+        return self.fold_grouping(expr)
+
+    @override
+    def visit_deep_expr(self, expr: Expr.Deep) -> Expr.Expr:
+        expr.expression = self.fold_iteratively(expr.expression)
+        if isinstance(expr.expression, Expr.Literal):
+            return expr.expression
+        return expr
+
+    # Each operator is evaluated with the visit method of the interpreter for it
+
+    @override
+    def visit_unary_expr(self, expr: Expr.Unary) -> Expr.Expr:
+        return self.fold_unary(expr, self.interpreter.visit_unary_expr)
+
+    @override
+    def visit_negate_expr(self, expr: Expr.Negate) -> Expr.Expr:
+        return self.fold_unary(expr, self.interpreter.visit_negate_expr)
+
+    @override
+    def visit_not_expr(self, expr: Expr.Not) -> Expr.Expr:
+        return self.fold_unary(expr, self.interpreter.visit_not_expr)
+
+    @override
+    def visit_binary_expr(self, expr: Expr.Binary) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_binary_expr)
+
+    @override
+    def visit_add_expr(self, expr: Expr.Add) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_add_expr)
+
+    @override
+    def visit_subtract_expr(self, expr: Expr.Subtract) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_subtract_expr)
+
+    @override
+    def visit_multiply_expr(self, expr: Expr.Multiply) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_multiply_expr)
+
+    @override
+    def visit_divide_expr(self, expr: Expr.Divide) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_divide_expr)
+
+    @override
+    def visit_modulo_expr(self, expr: Expr.Modulo) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_modulo_expr)
+
+    @override
+    def visit_less_expr(self, expr: Expr.Less) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_less_expr)
+
+    @override
+    def visit_less_equal_expr(self, expr: Expr.LessEqual) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_less_equal_expr)
+
+    @override
+    def visit_greater_expr(self, expr: Expr.Greater) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_greater_expr)
+
+    @override
+    def visit_greater_equal_expr(self, expr: Expr.GreaterEqual) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_greater_equal_expr)
+
+    @override
+    def visit_equal_expr(self, expr: Expr.Equal) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_equal_expr)
+
+    @override
+    def visit_not_equal_expr(self, expr: Expr.NotEqual) -> Expr.Expr:
+        return self.fold_binary(expr, self.interpreter.visit_not_equal_expr)
+
+    @override
+    def visit_comma_expr(self, expr: Expr.Comma) -> Expr.Expr:
+        expr.left = self.fold_expr(expr.left)
+        expr.right = self.fold_expr(expr.right)
+        return self.fold_comma(expr)
+
+    @override
+    def visit_logical_expr(self, expr: Expr.Logical) -> Expr.Expr:
+        # An operand which is never evaluated is not folded, so its errors are not reported, as for the
+        # branches removed from an if statement
+        expr.left = self.fold_expr(expr.left)
+        if isinstance(expr.left, Expr.Literal):
+            if self.decides(expr, expr.left):
+                return expr.left
+            return self.fold_expr(expr.right)
+        expr.right = self.fold_expr(expr.right)
+        return expr
+
+    @override
+    def visit_ternary_expr(self, expr: Expr.Ternary) -> Expr.Expr:
+        expr.condition = self.fold_expr(expr.condition)
+        if isinstance(expr.condition, Expr.Literal):
+            if self.interpreter.is_truthy(expr.condition.value):
+                return self.fold_expr(expr.if_branch)
+            return self.fold_expr(expr.else_branch)
+        expr.if_branch = self.fold_expr(expr.if_branch)
+        expr.else_branch = self.fold_expr(expr.else_branch)
+        return expr
+
+    @override
+    def visit_variable_expr(self, expr: Expr.Variable) -> Expr.Expr:
+        for scope in reversed(self.scopes):
+            if expr.name.string_repr in scope:
+                value = scope[expr.name.string_repr]
+                if value is None:
+                    return expr
+                return Expr.Literal(value=value.value)
+        return expr
+
+    @override
+    def visit_assign_expr(self, expr: Expr.Assign) -> Expr.Expr:
+        expr.value = self.fold_expr(expr.value)
+        return expr
+
+    @override
+    def visit_call_expr(self, expr: Expr.Call) -> Expr.Expr:
+        expr.callee = self.fold_expr(expr.callee)
+        expr.args = [self.fold_expr(arg) for arg in expr.args]
+        return expr
+
+    @override
+    def visit_arrow_expr(self, expr: Expr.Arrow) -> Expr.Expr:
+        expr.body = self.fold_function(expr.params, expr.body)
+        return expr
+
+    @override
+    def visit_get_expr(self, expr: Expr.Get) -> Expr.Expr:
+        expr.obj = self.fold_expr(expr.obj)
+        return expr
+
+    @override
+    def visit_set_expr(self, expr: Expr.Set) -> Expr.Expr:
+        expr.obj = self.fold_expr(expr.obj)
+        expr.value = self.fold_expr(expr.value)
+        return expr
+
+    @override
+    def visit_this_expr(self, expr: Expr.This) -> Expr.Expr:
+        return expr
+
+    @override
+    def visit_super_expr(self, expr: Expr.Super) -> Expr.Expr:
+        return expr
+
+    @override
+    def visit_expression_stmt(self, stmt: Stmt.Expression) -> Stmt.Stmt | None:
+        stmt.expression = self.fold_expr(stmt.expression)
+        return stmt
+
+    @override
+    def visit_print_stmt(self, stmt: Stmt.Print) -> Stmt.Stmt | None:
+        stmt.expression = self.fold_expr(stmt.expression)
+        return stmt
+
+    @override
+    def visit_println_stmt(self, stmt: Stmt.Println) -> Stmt.Stmt | None:
+        stmt.expression = self.fold_expr(stmt.expression)
+        return stmt
+
+    @override
+    def visit_var_stmt(self, stmt: Stmt.Var) -> Stmt.Stmt | None:
+        if stmt.initializer is not None:
+            stmt.initializer = self.fold_expr(stmt.initializer)
+        self.declare(stmt.name)
+        return stmt
+
+    @override
+    def visit_const_stmt(self, stmt: Stmt.Const) -> Stmt.Stmt | None:
+        stmt.initializer = self.fold_expr(stmt.initializer)
+        # The declaration is kept, since the constant may be used from the REPL
+        if isinstance(stmt.initializer, Expr.Literal):
+            self.declare(stmt.name, stmt.initializer)
+        else:
+            self.declare(stmt.name)
+        return stmt
+
+    @override
+    def visit_block_stmt(self, stmt: Stmt.Block) -> Stmt.Stmt | None:
+        return self.fold_block(stmt)
+
+    @override
+    def visit_if_stmt(self, stmt: Stmt.If) -> Stmt.Stmt | None:
+        stmt.condition = self.fold_expr(stmt.condition)
+        if isinstance(stmt.condition, Expr.Literal):
+            # Only the branch which is taken is kept, the other one is not checked for errors
+            if self.interpreter.is_truthy(stmt.condition.value):
+                return self.fold_block(stmt.if_branch)
+            if stmt.else_branch is not None:
+                return self.fold_block(stmt.else_branch)
+            return None
+
+        stmt.if_branch = self.fold_block(stmt.if_branch)
+        if stmt.else_branch is not None:
+            stmt.else_branch = self.fold_block(stmt.else_branch)
+        return stmt
+
+    @override
+    def visit_while_stmt(self, stmt: Stmt.While) -> Stmt.Stmt | None:
+        stmt.condition = self.fold_expr(stmt.condition)
+        if isinstance(stmt.condition, Expr.Literal) and not self.interpreter.is_truthy(
+            stmt.condition.value
+        ):
+            return None
+        stmt.body = self.fold_block(stmt.body)
+        return stmt
+
+    @override
+    def visit_for_stmt(self, stmt: Stmt.For) -> Stmt.Stmt | None:
+        self.begin_scope()
+        if stmt.initializer is not None:
+            stmt.initializer = stmt.initializer.accept(self)
+        if stmt.condition is not None:
+            stmt.condition = self.fold_expr(stmt.condition)
+        if stmt.update is not None:
+            stmt.update = self.fold_expr(stmt.update)
+        stmt.body = self.fold_block(stmt.body)
+        self.end_scope()
+        return stmt
+
+    @override
+    def visit_break_stmt(self, stmt: Stmt.Break) -> Stmt.Stmt | None:
+        return stmt
+
+    @override
+    def visit_continue_stmt(self, stmt: Stmt.Continue) -> Stmt.Stmt | None:
+        return stmt
+
+    @override
+    def visit_assert_stmt(self, stmt: Stmt.Assert) -> Stmt.Stmt | None:
+        stmt.expression = self.fold_expr(stmt.expression)
+        if stmt.message_expression is not None:
+            stmt.message_expression = self.fold_expr(stmt.message_expression)
+        return stmt
+
+    @override
+    def visit_function_stmt(self, stmt: Stmt.Function) -> Stmt.Stmt | None:
+        # Declared before the body is folded, since the function can call itself
+        self.declare(stmt.name)
+        stmt.body = self.fold_function(stmt.params, stmt.body)
+        return stmt
+
+    @override
+    def visit_return_stmt(self, stmt: Stmt.Return) -> Stmt.Stmt | None:
+        if stmt.value is not None:
+            stmt.value = self.fold_expr(stmt.value)
+        return stmt
+
+    @override
+    def visit_class_stmt(self, stmt: Stmt.Class) -> Stmt.Stmt | None:
+        self.declare(stmt.name)
+        for method in [*stmt.methods, *stmt.static_methods, *stmt.getters]:
+            method.body = self.fold_function(method.params, method.body)
+        return stmt
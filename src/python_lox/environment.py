@@ -1,63 +1,87 @@
-from typing import Dict
+from typing import List, Tuple
 
-from .token import Token
+# How a resolved use of a variable reads and writes it, see Resolver.resolve_access
+# The variable is in a slot of the environment of the running function
+LOCAL = 0
+# The variable is in a slot of the environment of the running function, boxed in a Cell since a closure
+# captures it
+CELL = 1
+# The variable belongs to an enclosing function, its Cell is at an index of the upvalues of the running
+# function
+UPVALUE = 2
+# The variable is declared in the global scope, it is at a depth from the environment of the program
+GLOBAL = 3
+
+
+class Cell:
+    """
+    Box for a local variable which is shared between a frame and the closures that capture it
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: object = None) -> None:
+        self.value = value
 
 
 class Environment:
-    class UNSET:
-        pass
+    """
+    Holds the values of the variables of one call of a function, or of the global scope. The resolver
+    assigns every variable a slot in the environment of the function which declares it, the variables of
+    the blocks inside the function included. A closure does not keep the environment it was created in,
+    only the cells of the variables it uses from enclosing functions, which are the upvalues of its calls.
+    So a lookup is an index into a list, with no hashing of variable names and no walk of parents.
 
-    def __init__(self, parent: "Environment | None" = None) -> None:
+    Only the global scopes are chained through parent, since a declaration in the REPL can be used by a
+    later input
+    """
+
+    __slots__ = ("parent", "values", "upvalues")
+
+    def __init__(
+        self,
+        parent: "Environment | None" = None,
+        values: List[object] | None = None,
+        upvalues: List[Cell] | None = None,
+    ) -> None:
         self.parent: Environment | None = parent
-        self.values: Dict[str, object] = {}
+        self.values: List[object] = [] if values is None else values
+        self.upvalues: List[Cell] = [] if upvalues is None else upvalues
 
-    def is_declared(self, name: Token | str) -> bool:
+    def define(self, slot: int, value: object) -> None:
+        values = self.values
+        if slot == len(values):
+            values.append(value)
+        else:
+            self.reserve(slot + 1)
+            values[slot] = value
+
+    def reserve(self, size: int) -> None:
         """
-        Returns true if "name" is declared in the current scope
-        Note: This method does not check all preceding environments, only the current one
+        Makes sure that the environment has at least size slots, unused slots are nil
         """
-        if isinstance(name, Token):
-            return name.string_repr in self.values
-        return name in self.values
-
-    def assign(self, token: Token, value: object) -> None:
-        if self.is_declared(token):
-            self.values[token.string_repr] = value
-        elif self.parent is not None:
-            self.parent.assign(token, value)
-        else:
-            raise ValueError("Logic Error: This should not be thrown")
+        if size > len(self.values):
+            self.values.extend([None] * (size - len(self.values)))
 
-    def declare(self, token: Token | str) -> None:
-        if isinstance(token, Token):
-            self.values[token.string_repr] = None
-        else:
-            self.values[token] = None
+    def capture(self, captures: List[Tuple[bool, int]]) -> List[Cell]:
+        """
+        Collects the cells that a closure created in this environment keeps, see Stmt.Function.captures
+        """
+        return [
+            self.values[index] if is_local else self.upvalues[index]  # type: ignore
+            for is_local, index in captures
+        ]
 
-    def define(self, token: Token | str, value: object) -> None:
-        if isinstance(token, Token):
-            self.values[token.string_repr] = value
-        else:
-            self.values[token] = value
-
-    def get(self, token: Token) -> object:
-        v = self.values.get(token.string_repr)
-        if v is not None:
-            return v
-        elif self.parent is not None:
-            return self.parent.get(token)
-        return None
-
-    def ancestor(self, nesting: int) -> "Environment":
-        environment: Environment = self
-        for _ in range(nesting):
-            if not environment.parent:
-                break
-            environment = environment.parent
+    def ancestor(self, depth: int) -> "Environment":
+        environment = self
+        for _ in range(depth):
+            parent = environment.parent
+            assert parent is not None, "Logic error: Environment nested too shallow"
+            environment = parent
         return environment
 
-    def get_at(self, nesting: int, token: Token) -> object:
-        return self.ancestor(nesting).get(token)
+    def get_at(self, depth: int, slot: int) -> object:
+        return self.ancestor(depth).values[slot]
 
-    def assign_at(self, nesting: int, token: Token, value: object) -> None:
-        self.ancestor(nesting).assign(token, value)
+    def assign_at(self, depth: int, slot: int, value: object) -> None:
+        self.ancestor(depth).values[slot] = value
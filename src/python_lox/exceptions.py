@@ -26,18 +26,10 @@ class RuntimeException(Exception):
         self.token = token
 
 
-class ContinueException(Exception):
-    pass
-
-
-class BreakException(Exception):
-    pass
-
-
-class ReturnException(Exception):
-    def __init__(self, value: object | None = None) -> None:
-        super().__init__()
-        self.value = value
+class TypeException(RuntimeException):
+    """
+    Raised by an operator whose operands are of types which it does not support
+    """
 
 
 class NameException(Exception):
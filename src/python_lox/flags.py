@@ -1,12 +1,22 @@
 """
 For now hardcode this dictionary, in the future accept these flags as command line args or from a config file
+finline-functions: Replace calls of small functions by their body, see Inliner
+finline-limit: Maximum number of nodes in the returned expression of a function that is inlined
 """
 
 from typing import Any, Dict
 
-values: Dict[str, Any] = {"Wunused": True, "Wshadow": True}
+values: Dict[str, Any] = {
+    "Wunused": True,
+    "Wshadow": True,
+    "finline-functions": True,
+    "finline-limit": 12,
+}
 
 
 class Flags:
     def get_bool(self, key: str) -> bool:
         return values.get(key, False)  # type: ignore
+
+    def get_int(self, key: str) -> int:
+        return values.get(key, 0)  # type: ignore
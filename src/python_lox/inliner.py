@@ -0,0 +1,541 @@
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, override
+
+from .ast import expr as Expr
+from .ast import stmt as Stmt
+from .token import Token
+
+"""
+The inliner runs on the resolved program, before the constant folder. It replaces a call of a small function
+by the expression that the function returns, with the arguments in place of the parameters, so that the call
+does not build a list of arguments, check the arity, or create an environment. The constant folder can then
+fold the result, for example double(21) becomes 42.
+
+A function is inlined if
+- It is declared in the global scope, with fun, or with const and an arrow function, so that its name always
+  refers to it, and the name is not shadowed at the call
+- Its body is a single return of an expression of at most finline-limit nodes, which only reads variables
+  and applies operators. So the function cannot be recursive, and the expression has no side effects
+- The call passes as many arguments as the function has parameters
+
+The nodes of the inlined expression keep their tokens, so an error is reported at the same line as in a
+call. The arguments are still evaluated once, in order: only one argument can be other than a literal or a
+variable. It must be used once by the expression, before any operator is applied, and after reading only
+the previous arguments.
+"""
+
+# Expressions which can be inlined, they have no side effects
+PURE_EXPRESSIONS = (
+    Expr.Literal,
+    Expr.Variable,
+    Expr.Grouping,
+    Expr.Unary,
+    Expr.Binary,
+    Expr.Logical,
+    Expr.Ternary,
+)
+
+
+@dataclass
+class InlineFunction:
+    params: List[str]
+    # Expression returned by the function
+    expression: Expr.Expr
+
+
+def operands(expr: Expr.Expr) -> List[Expr.Expr]:
+    """
+    Returns the operands of a pure expression, in the order in which they are evaluated
+    """
+    match expr:
+        case Expr.Grouping():
+            return [expr.expression]
+        case Expr.Unary():
+            return [expr.right]
+        case Expr.Binary() | Expr.Logical():
+            return [expr.left, expr.right]
+        case Expr.Ternary():
+            return [expr.condition, expr.if_branch, expr.else_branch]
+    return []
+
+
+def is_pure(expr: Expr.Expr) -> bool:
+    return isinstance(expr, PURE_EXPRESSIONS) and all(
+        is_pure(operand) for operand in operands(expr)
+    )
+
+
+def size(expr: Expr.Expr) -> int:
+    return 1 + sum(size(operand) for operand in operands(expr))
+
+
+def variables(expr: Expr.Expr) -> List[Expr.Variable]:
+    """
+    Returns the variables read by a pure expression, in the order in which they appear
+    """
+    if isinstance(expr, Expr.Variable):
+        return [expr]
+    return [variable for operand in operands(expr) for variable in variables(operand)]
+
+
+def reads_before(expr: Expr.Expr, target: Expr.Expr) -> List[Expr.Expr] | None:
+    """
+    Returns the literals and variables that a pure expression reads before target, if target is always
+    evaluated, before any operator is applied. Otherwise returns None
+    """
+    if expr is target:
+        return []
+    match expr:
+        case Expr.Grouping():
+            return reads_before(expr.expression, target)
+        case Expr.Unary():
+            return reads_before(expr.right, target)
+        case Expr.Logical():
+            return reads_before(expr.left, target)
+        case Expr.Ternary():
+            return reads_before(expr.condition, target)
+        case Expr.Binary():
+            reads = reads_before(expr.left, target)
+            if reads is None and isinstance(expr.left, (Expr.Literal, Expr.Variable)):
+                reads = reads_before(expr.right, target)
+                if reads is not None:
+                    reads.insert(0, expr.left)
+            return reads
+    return None
+
+
+def substitute(expr: Expr.Expr, args: Dict[str, Expr.Expr]) -> Expr.Expr:
+    """
+    Copies a pure expression, with the variables named in args replaced by their value. Literals and the
+    other variables are shared with the original expression
+    """
+    match expr:
+        case Expr.Variable() if expr.name.string_repr in args:
+            return args[expr.name.string_repr]
+        case Expr.Grouping():
+            return Expr.Grouping(substitute(expr.expression, args))
+        case Expr.Unary():
+            return type(expr)(expr.operator, substitute(expr.right, args))
+        case Expr.Binary():
+            return type(expr)(
+                substitute(expr.left, args),
+                expr.operator,
+                substitute(expr.right, args),
+            )
+        case Expr.Logical():
+            return Expr.Logical(
+                substitute(expr.left, args),
+                expr.operator,
+                substitute(expr.right, args),
+            )
+        case Expr.Ternary():
+            return Expr.Ternary(
+                substitute(expr.condition, args),
+                substitute(expr.if_branch, args),
+                substitute(expr.else_branch, args),
+            )
+    return expr
+
+
+class Inliner(Expr.Visitor[Expr.Expr], Stmt.Visitor[Stmt.Stmt]):
+    def __init__(self, inline_functions: bool, inline_limit: int) -> None:
+        # For every name declared in a scope, the function it refers to if it can be inlined, or None. The
+        # global scope is kept for the next call (REPL)
+        self.scopes: List[Dict[str, InlineFunction | None]] = [{}]
+        # The finline-functions and finline-limit flags
+        self.inline_functions = inline_functions
+        self.inline_limit = inline_limit
+
+    def inline(self, statements: List[Stmt.Stmt]) -> List[Stmt.Stmt]:
+        """
+        Inlines the calls in the statements of a resolved program
+        """
+        if not self.inline_functions:
+            return statements
+        return self.inline_statements(statements)
+
+    def inline_statements(self, statements: List[Stmt.Stmt]) -> List[Stmt.Stmt]:
+        return [statement.accept(self) for statement in statements]
+
+    def inline_expr(self, expr: Expr.Expr) -> Expr.Expr:
+        return expr.accept(self)
+
+    def inline_block(self, block: Stmt.Block) -> Stmt.Block:
+        self.begin_scope()
+        block.statements = self.inline_statements(block.statements)
+        self.end_scope()
+        return block
+
+    def inline_function(
+        self, params: List[Token], body: List[Stmt.Stmt]
+    ) -> List[Stmt.Stmt]:
+        self.begin_scope()
+        for param in params:
+            self.declare(param)
+        inlined = self.inline_statements(body)
+        self.end_scope()
+        return inlined
+
+    def begin_scope(self) -> None:
+        self.scopes.append({})
+
+    def end_scope(self) -> None:
+        self.scopes.pop()
+
+    def declare(self, name: Token, function: InlineFunction | None = None) -> None:
+        self.scopes[-1][name.string_repr] = function
+
+    def declare_function(
+        self, name: Token, params: List[Token], body: List[Stmt.Stmt]
+    ) -> None:
+        """
+        Declares name, and records the function if it is global, and small enough to be inlined
+        """
+        if len(self.scopes) > 1:
+            self.declare(name)
+            return
+        function = None
+        if len(body) == 1 and isinstance(body[0], Stmt.Return):
+            expression = body[0].value
+            if (
+                expression is not None
+                and not isinstance(expression, Expr.Deep)
+                and is_pure(expression)
+                and size(expression) <= self.inline_limit
+            ):
+                function = InlineFunction([p.string_repr for p in params], expression)
+        self.declare(name, function)
+
+    def look_up(self, name: str) -> InlineFunction | None:
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def is_global(self, name: str) -> bool:
+        """
+        Returns True if name is not declared by any scope other than the global scope
+        """
+        return not any(name in scope for scope in self.scopes[1:])
+
+    def expand(
+        self, function: InlineFunction, args: List[Expr.Expr]
+    ) -> Expr.Expr | None:
+        """
+        Returns the expression of the function with the arguments in place of the parameters, or None if
+        the call cannot be replaced
+        """
+        expression = function.expression
+        uses = variables(expression)
+        # The other variables of the expression are globals, they must refer to the same declarations
+        if not all(
+            v.name.string_repr in function.params or self.is_global(v.name.string_repr)
+            for v in uses
+        ):
+            return None
+        evaluated = [
+            i
+            for i, arg in enumerate(args)
+            if not isinstance(arg, (Expr.Literal, Expr.Variable))
+        ]
+        if len(evaluated) > 1:
+            return None
+        if evaluated:
+            param = function.params[evaluated[0]]
+            param_uses = [v for v in uses if v.name.string_repr == param]
+            if len(param_uses) != 1:
+                return None
+            reads = reads_before(expression, param_uses[0])
+            if reads is None:
+                return None
+            # Only the parameters of the previous arguments are read before the argument, as in a call. And
+            # they are not read after it, since the argument can change the variables passed to them
+            previous = function.params[: evaluated[0]]
+            if any(
+                isinstance(read, Expr.Variable)
+                and read.name.string_repr not in previous
+                for read in reads
+            ) or any(
+                v.name.string_repr in previous and not any(v is read for read in reads)
+                for v in uses
+            ):
+                return None
+        return substitute(expression, dict(zip(function.params, args)))
+
+    def inline_call(self, expr: Expr.Call) -> Expr.Expr:
+        """
+        Replaces a call whose callee and arguments are already inlined, if it calls a function which can be
+        inlined
+        """
+        if not isinstance(expr.callee, Expr.Variable):
+            return expr
+        function = self.look_up(expr.callee.name.string_repr)
+        if function is None or len(function.params) != len(expr.args):
+            return expr
+        return self.expand(function, expr.args) or expr
+
+    def inline_iteratively(self, expr: Expr.Expr) -> Expr.Expr:
+        """
+        Inlines the calls of an expression with a stack of the expressions left to inline, and a stack of the
+        inlined expressions, instead of recursing into the operands, so that the expressions marked Deep are
+        inlined too
+        """
+        # An expression is pushed with step 0 to be inlined, and pushed back with step 1, below its operands,
+        # to replace them once they are inlined
+        work: List[Tuple[Expr.Expr, int]] = [(expr, 0)]
+        inlined: List[Expr.Expr] = []
+        while work:
+            expr, step = work.pop()
+            match expr:
+                case Expr.Grouping():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.expression, 0))
+                    else:
+                        expr.expression = inlined[-1]
+                        inlined[-1] = expr
+                case Expr.Unary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.right, 0))
+                    else:
+                        expr.right = inlined[-1]
+                        inlined[-1] = expr
+                case Expr.Binary() | Expr.Logical():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.right, 0))
+                        work.append((expr.left, 0))
+                    else:
+                        expr.right = inlined.pop()
+                        expr.left = inlined[-1]
+                        inlined[-1] = expr
+                case Expr.Ternary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.else_branch, 0))
+                        work.append((expr.if_branch, 0))
+                        work.append((expr.condition, 0))
+                    else:
+                        expr.else_branch = inlined.pop()
+                        expr.if_branch = inlined.pop()
+                        expr.condition = inlined[-1]
+                        inlined[-1] = expr
+                case Expr.Call():
+                    if step == 0:
+                        work.append((expr, 1))
+                        for arg in reversed(expr.args):
+                            work.append((arg, 0))
+                        work.append((expr.callee, 0))
+                    else:
+                        start = len(inlined) - len(expr.args)
+                        expr.args = inlined[start:]
+                        del inlined[start:]
+                        expr.callee = inlined[-1]
+                        inlined[-1] = self.inline_call(expr)
+                case Expr.Get():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.obj, 0))
+                    else:
+                        expr.obj = inlined[-1]
+                        inlined[-1] = expr
+                case Expr.Set():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.value, 0))
+                        work.append((expr.obj, 0))
+                    else:
+                        expr.value = inlined.pop()
+                        expr.obj = inlined[-1]
+                        inlined[-1] = expr
+                case Expr.Assign():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.value, 0))
+                    else:
+                        expr.value = inlined[-1]
+                        inlined[-1] = expr
+                case _:
+                    inlined.append(expr.accept(self))
+        return inlined.pop()
+
+    @override
+    def visit_literal_expr(self, expr: Expr.Literal) -> Expr.Expr:
+        return expr
+
+    @override
+    def visit_grouping_expr(self, expr: Expr.Grouping) -> Expr.Expr:
+        expr.expression = self.inline_expr(expr.expression)
+        return expr
+
+    @override
+    def visit_deep_expr(self, expr: Expr.Deep) -> Expr.Expr:
+        expr.expression = self.inline_iteratively(expr.expression)
+        return expr
+
+    @override
+    def visit_unary_expr(self, expr: Expr.Unary) -> Expr.Expr:
+        expr.right = self.inline_expr(expr.right)
+        return expr
+
+    @override
+    def visit_binary_expr(self, expr: Expr.Binary) -> Expr.Expr:
+        expr.left = self.inline_expr(expr.left)
+        expr.right = self.inline_expr(expr.right)
+        return expr
+
+    @override
+    def visit_logical_expr(self, expr: Expr.Logical) -> Expr.Expr:
+        expr.left = self.inline_expr(expr.left)
+        expr.right = self.inline_expr(expr.right)
+        return expr
+
+    @override
+    def visit_ternary_expr(self, expr: Expr.Ternary) -> Expr.Expr:
+        expr.condition = self.inline_expr(expr.condition)
+        expr.if_branch = self.inline_expr(expr.if_branch)
+        expr.else_branch = self.inline_expr(expr.else_branch)
+        return expr
+
+    @override
+    def visit_variable_expr(self, expr: Expr.Variable) -> Expr.Expr:
+        return expr
+
+    @override
+    def visit_assign_expr(self, expr: Expr.Assign) -> Expr.Expr:
+        expr.value = self.inline_expr(expr.value)
+        return expr
+
+    @override
+    def visit_call_expr(self, expr: Expr.Call) -> Expr.Expr:
+        expr.callee = self.inline_expr(expr.callee)
+        expr.args = [self.inline_expr(arg) for arg in expr.args]
+        return self.inline_call(expr)
+
+    @override
+    def visit_arrow_expr(self, expr: Expr.Arrow) -> Expr.Expr:
+        expr.body = self.inline_function(expr.params, expr.body)
+        return expr
+
+    @override
+    def visit_get_expr(self, expr: Expr.Get) -> Expr.Expr:
+        expr.obj = self.inline_expr(expr.obj)
+        return expr
+
+    @override
+    def visit_set_expr(self, expr: Expr.Set) -> Expr.Expr:
+        expr.obj = self.inline_expr(expr.obj)
+        expr.value = self.inline_expr(expr.value)
+        return expr
+
+    @override
+    def visit_this_expr(self, expr: Expr.This) -> Expr.Expr:
+        return expr
+
+    @override
+    def visit_super_expr(self, expr: Expr.Super) -> Expr.Expr:
+        return expr
+
+    @override
+    def visit_expression_stmt(self, stmt: Stmt.Expression) -> Stmt.Stmt:
+        stmt.expression = self.inline_expr(stmt.expression)
+        return stmt
+
+    @override
+    def visit_print_stmt(self, stmt: Stmt.Print) -> Stmt.Stmt:
+        stmt.expression = self.inline_expr(stmt.expression)
+        return stmt
+
+    @override
+    def visit_println_stmt(self, stmt: Stmt.Println) -> Stmt.Stmt:
+        stmt.expression = self.inline_expr(stmt.expression)
+        return stmt
+
+    @override
+    def visit_var_stmt(self, stmt: Stmt.Var) -> Stmt.Stmt:
+        if stmt.initializer is not None:
+            stmt.initializer = self.inline_expr(stmt.initializer)
+        # A variable can be reassigned, so its value is never inlined
+        self.declare(stmt.name)
+        return stmt
+
+    @override
+    def visit_const_stmt(self, stmt: Stmt.Const) -> Stmt.Stmt:
+        stmt.initializer = self.inline_expr(stmt.initializer)
+        if isinstance(stmt.initializer, Expr.Arrow):
+            self.declare_function(
+                stmt.name, stmt.initializer.params, stmt.initializer.body
+            )
+        else:
+            self.declare(stmt.name)
+        return stmt
+
+    @override
+    def visit_block_stmt(self, stmt: Stmt.Block) -> Stmt.Stmt:
+        return self.inline_block(stmt)
+
+    @override
+    def visit_if_stmt(self, stmt: Stmt.If) -> Stmt.Stmt:
+        stmt.condition = self.inline_expr(stmt.condition)
+        stmt.if_branch = self.inline_block(stmt.if_branch)
+        if stmt.else_branch is not None:
+            stmt.else_branch = self.inline_block(stmt.else_branch)
+        return stmt
+
+    @override
+    def visit_while_stmt(self, stmt: Stmt.While) -> Stmt.Stmt:
+        stmt.condition = self.inline_expr(stmt.condition)
+        stmt.body = self.inline_block(stmt.body)
+        return stmt
+
+    @override
+    def visit_for_stmt(self, stmt: Stmt.For) -> Stmt.Stmt:
+        self.begin_scope()
+        if stmt.initializer is not None:
+            stmt.initializer = stmt.initializer.accept(self)
+        if stmt.condition is not None:
+            stmt.condition = self.inline_expr(stmt.condition)
+        if stmt.update is not None:
+            stmt.update = self.inline_expr(stmt.update)
+        stmt.body = self.inline_block(stmt.body)
+        self.end_scope()
+        return stmt
+
+    @override
+    def visit_break_stmt(self, stmt: Stmt.Break) -> Stmt.Stmt:
+        return stmt
+
+    @override
+    def visit_continue_stmt(self, stmt: Stmt.Continue) -> Stmt.Stmt:
+        return stmt
+
+    @override
+    def visit_assert_stmt(self, stmt: Stmt.Assert) -> Stmt.Stmt:
+        stmt.expression = self.inline_expr(stmt.expression)
+        if stmt.message_expression is not None:
+            stmt.message_expression = self.inline_expr(stmt.message_expression)
+        return stmt
+
+    @override
+    def visit_function_stmt(self, stmt: Stmt.Function) -> Stmt.Stmt:
+        # The body is inlined first, the function is not yet known inside it, so a recursive call stays a call
+        self.declare(stmt.name)
+        stmt.body = self.inline_function(stmt.params, stmt.body)
+        self.declare_function(stmt.name, stmt.params, stmt.body)
+        return stmt
+
+    @override
+    def visit_return_stmt(self, stmt: Stmt.Return) -> Stmt.Stmt:
+        if stmt.value is not None:
+            stmt.value = self.inline_expr(stmt.value)
+            # An inlined call is no longer a tail call
+            stmt.is_tail_call = stmt.is_tail_call and isinstance(stmt.value, Expr.Call)
+        return stmt
+
+    @override
+    def visit_class_stmt(self, stmt: Stmt.Class) -> Stmt.Stmt:
+        self.declare(stmt.name)
+        for method in [*stmt.methods, *stmt.static_methods, *stmt.getters]:
+            method.body = self.inline_function(method.params, method.body)
+        return stmt
@@ -1,19 +1,17 @@
 import sys
-from typing import Dict, Final, List, TextIO, TypeGuard, override
+from enum import Enum, auto
+from typing import Any, Dict, Final, List, TextIO, Tuple, TypeGuard, override
 
 from .ast import expr as Expr
 from .ast import stmt as Stmt
-from .callable import ArrowFunction, Callable, LoxFunction
-from .environment import Environment
+from .callable import ArrowFunction, Callable, LoxFunction, Method, TailCall
+from .environment import CELL, LOCAL, UPVALUE, Cell, Environment
 from .error_reporter import ErrorReporter
-from .exceptions import (
-    BreakException,
-    ContinueException,
-    ReturnException,
-    RuntimeException,
-)
-from .lox_class import LoxClass, LoxInstance
+from .exceptions import RuntimeException, TypeException
+from .lox_class import LoxClass, LoxInstance, PropertyCache, SuperInstance
 from .native_functions import native_functions
+from .operators import BINARY_OPERATIONS, lookup
+from .position import Position, SourceTable
 from .token import Token, TokenType
 
 """
@@ -25,20 +23,41 @@ NOTES:
 """
 
 
-class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
+# A binary expression whose specialization failed this many times is no longer specialized
+MAX_DEOPTS = 4
+
+# Maximum number of nested Lox calls, for backends which keep their own call stack
+DEFAULT_MAX_DEPTH = 100000
+
+
+class Completion(Enum):
+    """
+    Returned by a statement which did not complete normally, and is passed up through the enclosing
+    statements until it reaches the loop or function which handles it. Statements that complete normally
+    return None. The value of a return statement is stored in Interpreter.return_value
+    """
+
+    BREAK = auto()
+    CONTINUE = auto()
+    RETURN = auto()
+
+
+class Interpreter(Expr.Visitor[object], Stmt.Visitor[Completion | None]):
     def __init__(
         self, error_reporter: ErrorReporter | None = None, stdout: TextIO = sys.stdout
     ) -> None:
         super().__init__()
         self.error_reporter = error_reporter
         self.stdout = stdout
-        self.globals: Final = Environment()
-        self.environment = self.globals
-        self.nesting: Dict[int, int] = {}
-
-        for function in native_functions:
-            self.globals.declare(function.name())
-            self.globals.define(function.name(), function)
+        # Native functions are in the outermost scope, the program runs in a scope nested in it
+        self.globals: Final = Environment(values=list(native_functions))
+        self.program_environment: Final = Environment(parent=self.globals)
+        # Environment of the running function, or of the program
+        self.environment = self.program_environment
+        self.return_value: object = None
+        self.max_depth = DEFAULT_MAX_DEPTH
+        # Sources of the positions in the programs run by the interpreter
+        self.sources = SourceTable()
 
     @override
     def visit_literal_expr(self, expr: Expr.Literal) -> object:
@@ -48,17 +67,34 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
     def visit_grouping_expr(self, expr: Expr.Grouping) -> object:
         return self.evaluate(expr.expression)
 
+    @override
+    def visit_deep_expr(self, expr: Expr.Deep) -> object:
+        return self.evaluate_iteratively(expr.expression)
+
     @override
     def visit_unary_expr(self, expr: Expr.Unary) -> object:
         right = self.evaluate(expr.right)
+        return self.unary_operation(expr.operator, right)
+
+    @override
+    def visit_negate_expr(self, expr: Expr.Negate) -> object:
+        right = self.evaluate(expr.right)
+        if type(right) is int or type(right) is float:
+            return -right
+        return self.unary_operation(expr.operator, right)
+
+    @override
+    def visit_not_expr(self, expr: Expr.Not) -> object:
+        return not self.is_truthy(self.evaluate(expr.right))
 
-        match expr.operator.token_type:
+    def unary_operation(self, operator: Token, right: object) -> object:
+        match operator.token_type:
             case TokenType.MINUS:
                 if self.is_numeric(right):
                     return -right
-                raise RuntimeException(
+                raise TypeException(
                     'Syntax Error: Invalid unary operator "-" for type',
-                    token=expr.operator,
+                    token=operator,
                 )
             case TokenType.BANG:
                 return not self.is_truthy(right)
@@ -71,7 +107,7 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
                     return "number"
                 if isinstance(right, str):
                     return "str"
-                if isinstance(right, LoxFunction) or isinstance(right, ArrowFunction):
+                if isinstance(right, Callable) and not isinstance(right, LoxInstance):
                     return "function"
                 if right is None:
                     return "nil"
@@ -83,79 +119,153 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
 
     @override
     def visit_binary_expr(self, expr: Expr.Binary) -> object:
-        if expr.operator.token_type == TokenType.COMMA:
-            self.evaluate(expr.left)
-            return self.evaluate(expr.right)
-
         left = self.evaluate(expr.left)
         right = self.evaluate(expr.right)
+        quickened = expr.quickened
+        if (
+            quickened is not None
+            and type(left) is expr.quickened_type
+            and type(right) is expr.quickened_type
+        ):
+            try:
+                return quickened(left, right)
+            except RuntimeException as e:
+                e.token = expr.operator
+                raise
+        return self.specialize(expr, left, right)
+
+    def specialize(self, expr: Expr.Binary, left: object, right: object) -> object:
+        """
+        Applies the operator of a binary expression to operands which are not of the type it is specialized
+        for. The expression is deoptimized, and specialized again if both operands are of the same type
+        """
+        if expr.quickened is not None:
+            expr.quickened = None
+            expr.quickened_type = None
+            expr.deopts += 1
+
+        result = self.binary_operation(expr.operator, left, right)
+        if type(left) is type(right) and expr.deopts < MAX_DEOPTS:
+            expr.quickened_type = type(left)
+            expr.quickened = BINARY_OPERATIONS.get(
+                (expr.operator.token_type, type(left), type(left))
+            )
+        return result
 
-        match expr.operator.token_type:
-            case TokenType.BANG_EQUAL:
-                return not self.is_equal(left, right)
-            case TokenType.EQUAL_EQUAL:
-                return self.is_equal(left, right)
-            case _:
-                pass
+    # Each operator applies its python operator directly to operands of the type its expression is specialized
+    # for. An expression is only specialized once its operator succeeded on two operands of that type, and the
+    # implementation for them is the python operator (divide also checks for zero). Other operands go through
+    # specialize
 
-        if not self.is_same_type(left, right):
-            raise RuntimeException(
-                f"Runtime Error: Operator {expr.operator.string_repr} not supported between different types",
-                token=expr.operator,
-            )
+    @override
+    def visit_add_expr(self, expr: Expr.Add) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left + right
+        return self.specialize(expr, left, right)
 
-        match expr.operator.token_type:
-            case TokenType.MINUS:
-                if self.is_numeric(left):
-                    return left - right  # type: ignore
-                raise RuntimeException(
-                    'Type Error: Operator "-" not valid between the operands',
-                    token=expr.operator,
-                )
-            case TokenType.STAR:
-                if self.is_numeric(left):
-                    return left * right  # type: ignore
-                raise RuntimeException(
-                    'Type Error: Operator "*" not valid between the operands',
-                    token=expr.operator,
-                )
-            case TokenType.SLASH:
-                if self.is_numeric(left):
-                    try:
-                        return left / right  # type: ignore
-                    except ZeroDivisionError:
-                        raise RuntimeException(
-                            "Runtime Error: Divide by Zero Error: division by zero",
-                            token=expr.operator,
-                        )
+    @override
+    def visit_subtract_expr(self, expr: Expr.Subtract) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left - right
+        return self.specialize(expr, left, right)
 
-                raise RuntimeException(
-                    'Type Error: Operator "/" not valid between the operands',
-                    token=expr.operator,
-                )
-            case TokenType.PERCENTAGE:
-                return left % right  # type: ignore
-            case TokenType.PLUS:
-                return left + right  # type: ignore
-            case TokenType.GREATER:
-                return left > right  # type: ignore
-            case TokenType.GREATER_EQUAL:
-                return left >= right  # type: ignore
-            case TokenType.LESS:
-                return left < right  # type: ignore
-            case TokenType.LESS_EQUAL:
-                return left <= right  # type: ignore
-            case _:
-                raise RuntimeException(
-                    f'Syntax Error: Invalid operator "{expr.operator.string_repr}"',
-                    token=expr.operator,
-                )
+    @override
+    def visit_multiply_expr(self, expr: Expr.Multiply) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left * right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_divide_expr(self, expr: Expr.Divide) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        # Division by zero is reported by specialize
+        if (
+            type(left) is expr.quickened_type
+            and type(right) is expr.quickened_type
+            and right
+        ):
+            return left / right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_modulo_expr(self, expr: Expr.Modulo) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left % right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_less_expr(self, expr: Expr.Less) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left < right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_less_equal_expr(self, expr: Expr.LessEqual) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left <= right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_greater_expr(self, expr: Expr.Greater) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left > right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_greater_equal_expr(self, expr: Expr.GreaterEqual) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left >= right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_equal_expr(self, expr: Expr.Equal) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left == right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_not_equal_expr(self, expr: Expr.NotEqual) -> object:
+        left: Any = self.evaluate(expr.left)
+        right: Any = self.evaluate(expr.right)
+        if type(left) is expr.quickened_type and type(right) is expr.quickened_type:
+            return left != right
+        return self.specialize(expr, left, right)
+
+    @override
+    def visit_comma_expr(self, expr: Expr.Comma) -> object:
+        self.evaluate(expr.left)
+        return self.evaluate(expr.right)
+
+    def binary_operation(self, operator: Token, left: object, right: object) -> object:
+        try:
+            return lookup(operator.token_type, left, right)(left, right)
+        except RuntimeException as e:
+            e.token = operator
+            raise
 
     @override
     def visit_assign_expr(self, expr: Expr.Assign) -> object:
-        nesting = self.nesting[id(expr)]
         value = self.evaluate(expr.value)
-        self.environment.assign_at(nesting, expr.name, value)
+        self.assign_variable(expr, value)
         return value
 
     @override
@@ -176,29 +286,150 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
         return True
 
     def is_equal(self, obj1: object, obj2: object) -> bool:
-        if obj1 is None and obj2 is None:
-            return True
-        if obj1 is None:
-            return False
-        if obj2 is None:
-            return False
-
-        # Similar to python, return False if the type of objects are different
-        if not self.is_same_type(obj1, obj2):
-            return False
-        if self.is_numeric(obj1) and self.is_numeric(obj2):
-            if obj1.is_integer() and obj2.is_integer():
-                return int(obj1) == int(obj2)
-        return obj1 == obj2
+        return lookup(TokenType.EQUAL_EQUAL, obj1, obj2)(obj1, obj2)  # type: ignore
 
     def evaluate(self, expr: Expr.Expr) -> object:
         return expr.accept(self)
 
-    def is_same_type(self, obj1: object, obj2: object) -> bool:
-        # Treat int and float as numeric, just the internal representation is different
-        if self.is_numeric(obj1) and self.is_numeric(obj2):
-            return True
-        return type(obj1) is type(obj2)
+    def supports_deep_expressions(self) -> bool:
+        """
+        Returns False if the backend cannot run the expressions that the resolver marked Deep
+        """
+        return True
+
+    def evaluate_iteratively(self, expr: Expr.Expr) -> object:
+        """
+        Evaluates an expression with a stack of the expressions left to evaluate, and a stack of their
+        values, instead of recursing into the operands, so that expressions can be nested to any depth. The
+        operands are evaluated in the same order, and with the same errors, as the visit methods
+        """
+        # An expression is pushed with step 0 to be evaluated. It pushes itself back with a later step,
+        # below its operands, to use their values once they are on the value stack
+        work: List[Tuple[Expr.Expr, int]] = [(expr, 0)]
+        values: List[object] = []
+        while work:
+            expr, step = work.pop()
+            match expr:
+                case Expr.Grouping():
+                    work.append((expr.expression, 0))
+                case Expr.Unary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.right, 0))
+                    else:
+                        values[-1] = self.unary_operation(expr.operator, values[-1])
+                case Expr.Binary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.right, 0))
+                        work.append((expr.left, 0))
+                    else:
+                        right = values.pop()
+                        if isinstance(expr, Expr.Comma):
+                            values[-1] = right
+                        else:
+                            values[-1] = self.binary_operation(
+                                expr.operator, values[-1], right
+                            )
+                case Expr.Logical():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.left, 0))
+                    elif self.is_truthy(values[-1]) != (
+                        expr.operator.token_type == TokenType.OR
+                    ):
+                        # The left operand does not decide the value, which is the right operand
+                        values.pop()
+                        work.append((expr.right, 0))
+                case Expr.Ternary():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.condition, 0))
+                    elif self.is_truthy(values.pop()):
+                        work.append((expr.if_branch, 0))
+                    else:
+                        work.append((expr.else_branch, 0))
+                case Expr.Assign():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.value, 0))
+                    else:
+                        self.assign_variable(expr, values[-1])
+                case Expr.Get():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.obj, 0))
+                    else:
+                        instance = self.check_instance(values[-1], expr.name)
+                        values[-1] = instance.get_cached(
+                            expr.name, self, self.property_cache(expr)
+                        )
+                case Expr.Set():
+                    if step == 0:
+                        work.append((expr, 1))
+                        work.append((expr.obj, 0))
+                    elif step == 1:
+                        # The object is checked before the value is evaluated
+                        self.check_instance(values[-1], expr.name)
+                        work.append((expr, 2))
+                        work.append((expr.value, 0))
+                    else:
+                        value = values.pop()
+                        obj = values[-1]
+                        assert isinstance(obj, LoxInstance)
+                        obj.set_cached(expr.name, value, self.property_cache(expr))
+                        values[-1] = value
+                case Expr.Call():
+                    self.evaluate_call_step(expr, step, work, values)
+                case _:
+                    values.append(expr.accept(self))
+        return values.pop()
+
+    def evaluate_call_step(
+        self,
+        expr: Expr.Call,
+        step: int,
+        work: List[Tuple[Expr.Expr, int]],
+        values: List[object],
+    ) -> None:
+        """
+        A step of evaluate_iteratively for a call. A method is called with its instance, as in
+        visit_call_expr: the instance and the method are kept on the value stack below the arguments
+        """
+        if step == 0:
+            if isinstance(expr.callee, Expr.Get):
+                work.append((expr, 1))
+                work.append((expr.callee.obj, 0))
+                return
+            work.append((expr, 3))
+            work.extend((arg, 0) for arg in reversed(expr.args))
+            work.append((expr.callee, 0))
+        elif step == 1:
+            assert isinstance(expr.callee, Expr.Get)
+            name = expr.callee.name
+            cache = self.property_cache(expr.callee)
+            instance = self.check_instance(values.pop(), name)
+            method = instance.find_method_cached(cache)
+            if method is not None:
+                values.append(instance)
+                values.append(method)
+                work.append((expr, 2))
+            else:
+                values.append(instance.get_cached(name, self, cache))
+                work.append((expr, 3))
+            work.extend((arg, 0) for arg in reversed(expr.args))
+        else:
+            start = len(values) - len(expr.args)
+            args = values[start:]
+            del values[start:]
+            callee = values.pop()
+            if step == 2:
+                receiver = values.pop()
+                assert isinstance(callee, Method) and isinstance(receiver, LoxInstance)
+                self.check_call(callee, args, expr.paren)
+                values.append(callee.call_method(self, receiver, args))
+            else:
+                values.append(self.call_function(callee, args, expr.paren))
 
     def is_numeric(self, obj: object) -> TypeGuard[float | int]:
         return isinstance(obj, int) or isinstance(obj, float)
@@ -218,92 +449,129 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
         return str(obj)
 
     @override
-    def visit_expression_stmt(self, stmt: Stmt.Expression) -> None:
+    def visit_expression_stmt(self, stmt: Stmt.Expression) -> Completion | None:
         self.evaluate(stmt.expression)
+        return None
 
     @override
-    def visit_print_stmt(self, stmt: Stmt.Print) -> None:
+    def visit_print_stmt(self, stmt: Stmt.Print) -> Completion | None:
         result = self.evaluate(stmt.expression)
         print(self.stringify(result), file=self.stdout, end="")
+        return None
 
     @override
-    def visit_println_stmt(self, stmt: Stmt.Println) -> None:
+    def visit_println_stmt(self, stmt: Stmt.Println) -> Completion | None:
         result = self.evaluate(stmt.expression)
         print(self.stringify(result), file=self.stdout)
+        return None
 
     @override
-    def visit_var_stmt(self, stmt: Stmt.Var) -> None:
-        self.environment.declare(stmt.name)
+    def visit_var_stmt(self, stmt: Stmt.Var) -> Completion | None:
+        result = None
         if stmt.initializer:
             result = self.evaluate(stmt.initializer)
-            self.environment.define(stmt.name, result)
+        self.environment.define(stmt.slot, Cell(result) if stmt.is_cell else result)
+        return None
 
     @override
     def visit_variable_expr(self, expr: Expr.Variable) -> object:
-        return self.lookup_variable(expr.name, expr)
+        return self.look_up_variable(expr)
+
+    def look_up_variable(self, expr: Expr.Variable | Expr.This | Expr.Super) -> object:
+        access = expr.access
+        if access == LOCAL:
+            return self.environment.values[expr.slot]
+        if access == CELL:
+            return self.environment.values[expr.slot].value  # type: ignore
+        if access == UPVALUE:
+            return self.environment.upvalues[expr.slot].value
+        return self.program_environment.get_at(expr.depth, expr.slot)
+
+    def assign_variable(self, expr: Expr.Assign, value: object) -> None:
+        access = expr.access
+        if access == LOCAL:
+            self.environment.values[expr.slot] = value
+        elif access == CELL:
+            self.environment.values[expr.slot].value = value  # type: ignore
+        elif access == UPVALUE:
+            self.environment.upvalues[expr.slot].value = value
+        else:
+            self.program_environment.assign_at(expr.depth, expr.slot, value)
 
     @override
-    def visit_block_stmt(self, stmt: Stmt.Block) -> None:
-        env = Environment(parent=self.environment)
-        self.execute_multiple_statements(stmt.statements, env)
+    def visit_block_stmt(self, stmt: Stmt.Block) -> Completion | None:
+        # The variables of the block are stored in the current environment
+        for statement in stmt.statements:
+            completion = self.execute(statement)
+            if completion is not None:
+                return completion
+        return None
 
     def execute_multiple_statements(
         self, stmts: List[Stmt.Stmt], env: Environment
-    ) -> None:
+    ) -> Completion | None:
+        """
+        Executes stmts in env, and stops at the first statement which does not complete normally,
+        returning its completion
+        """
         previous_env = self.environment
         try:
             self.environment = env
             for statement in stmts:
-                self.execute(statement=statement)
+                completion = self.execute(statement=statement)
+                if completion is not None:
+                    return completion
+            return None
         finally:
             self.environment = previous_env
 
     @override
-    def visit_const_stmt(self, stmt: Stmt.Const) -> None:
-        self.environment.declare(stmt.name)
-        self.environment.define(stmt.name, self.evaluate(stmt.initializer))
+    def visit_const_stmt(self, stmt: Stmt.Const) -> Completion | None:
+        value = self.evaluate(stmt.initializer)
+        self.environment.define(stmt.slot, Cell(value) if stmt.is_cell else value)
+        return None
 
     @override
-    def visit_if_stmt(self, stmt: Stmt.If) -> None:
+    def visit_if_stmt(self, stmt: Stmt.If) -> Completion | None:
         result = self.evaluate(stmt.condition)
         if self.is_truthy(result):
-            self.execute(stmt.if_branch)
+            return self.execute(stmt.if_branch)
         elif stmt.else_branch:
-            self.execute(stmt.else_branch)
+            return self.execute(stmt.else_branch)
+        return None
 
     @override
-    def visit_while_stmt(self, stmt: Stmt.While) -> None:
+    def visit_while_stmt(self, stmt: Stmt.While) -> Completion | None:
         while self.is_truthy(self.evaluate(stmt.condition)):
-            try:
-                self.execute(stmt.body)
-            except BreakException:
+            completion = self.execute(stmt.body)
+            if completion is Completion.BREAK:
                 break
-            except ContinueException:
-                continue
+            if completion is Completion.RETURN:
+                return completion
+        return None
 
     @override
-    def visit_for_stmt(self, stmt: Stmt.For) -> None:
+    def visit_for_stmt(self, stmt: Stmt.For) -> Completion | None:
         if stmt.initializer:
             self.execute(stmt.initializer)
         while self.is_truthy(self.evaluate(stmt.condition) if stmt.condition else True):
-            try:
-                self.execute(stmt.body)
-                if stmt.update:
-                    self.evaluate(stmt.update)
-            except BreakException:
+            completion = self.execute(stmt.body)
+            if completion is Completion.BREAK:
                 break
-            except ContinueException:
-                if stmt.update:
-                    self.evaluate(stmt.update)
-                continue
+            if completion is Completion.RETURN:
+                return completion
+            # A continue still runs the update
+            if stmt.update:
+                self.evaluate(stmt.update)
+        return None
 
     @override
-    def visit_break_stmt(self, stmt: Stmt.Break) -> None:
-        raise BreakException()
+    def visit_break_stmt(self, stmt: Stmt.Break) -> Completion | None:
+        return Completion.BREAK
 
     @override
-    def visit_continue_stmt(self, stmt: Stmt.Continue) -> None:
-        raise ContinueException()
+    def visit_continue_stmt(self, stmt: Stmt.Continue) -> Completion | None:
+        return Completion.CONTINUE
 
     @override
     def visit_logical_expr(self, expr: Expr.Logical) -> object:
@@ -320,7 +588,7 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
         return self.evaluate(expr.right)
 
     @override
-    def visit_assert_stmt(self, stmt: Stmt.Assert) -> None:
+    def visit_assert_stmt(self, stmt: Stmt.Assert) -> Completion | None:
         if not self.is_truthy(self.evaluate(stmt.expression)):
             if stmt.message_expression:
                 raise RuntimeException(
@@ -329,17 +597,47 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
                 )
             else:
                 raise RuntimeException("Assertion Error: ", exp=stmt.expression)
+        return None
 
     @override
     def visit_call_expr(self, expr: Expr.Call) -> object:
-        callee = self.evaluate(expr.callee)
+        if isinstance(expr.callee, Expr.Get):
+            cache = expr.callee.cache
+            if cache is None:
+                cache = self.property_cache(expr.callee)
+            instance = self.check_instance(
+                self.evaluate(expr.callee.obj), expr.callee.name
+            )
+            method = instance.find_method_cached(cache)
+            if method is not None:
+                # The instance is passed to the method, instead of creating a bound method
+                method_args = [self.evaluate(arg) for arg in expr.args]
+                self.check_call(method, method_args, expr.paren)
+                return method.call_method(self, instance, method_args)
+            callee = instance.get_cached(expr.callee.name, self, cache)
+        else:
+            callee = self.evaluate(expr.callee)
         args: List[object] = []
         for arg in expr.args:
             args.append(self.evaluate(arg))
+        return self.call_function(callee, args, expr.paren)
+
+    def call_function(
+        self, callee: object, args: List[object], paren: Position | Token
+    ) -> object:
+        """
+        Checks that callee can be called with args, and calls it. paren, or its position, is used for error
+        reporting
+        """
+        return self.check_call(callee, args, paren).call(self, args)
+
+    def check_call(
+        self, callee: object, args: List[object], paren: Position | Token
+    ) -> Callable:
         if not isinstance(callee, Callable):
             raise RuntimeException(
                 f'Runtime Exception: Can only call functions and classes, but got "{type(callee).__name__}"',
-                token=expr.paren,
+                token=self.sources.token_at(paren),
             )
         if len(args) != callee.arity():
             message = ""
@@ -349,34 +647,58 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
                 message = "Too many arguments"
             raise RuntimeException(
                 f"Runtime Exception: {message}. Expected {callee.arity()} arguments, got {len(args)} arguments",
-                token=expr.paren,
+                token=self.sources.token_at(paren),
             )
-        return callee.call(self, args)
+        return callee
 
     @override
-    def visit_function_stmt(self, stmt: Stmt.Function) -> None:
-        function = LoxFunction(declaration=stmt, closure=self.environment)
-        self.environment.declare(stmt.name)
-        self.environment.define(stmt.name, function)
+    def visit_function_stmt(self, stmt: Stmt.Function) -> Completion | None:
+        if not stmt.is_cell:
+            upvalues = self.environment.capture(stmt.captures)
+            self.environment.define(stmt.slot, LoxFunction(stmt, upvalues))
+            return None
+        # The cell is created first, since the function can capture itself
+        cell = Cell()
+        self.environment.define(stmt.slot, cell)
+        cell.value = LoxFunction(stmt, self.environment.capture(stmt.captures))
+        return None
 
     @override
     def visit_arrow_expr(self, expr: Expr.Arrow) -> object:
-        return ArrowFunction(declaration=expr, closure=self.environment)
+        return ArrowFunction(expr, self.environment.capture(expr.captures))
 
     @override
-    def visit_return_stmt(self, stmt: Stmt.Return) -> None:
+    def visit_return_stmt(self, stmt: Stmt.Return) -> Completion | None:
         value = None
-        if stmt.value:
+        if stmt.is_tail_call:
+            assert isinstance(stmt.value, Expr.Call)
+            value = self.tail_call(stmt.value)
+        elif stmt.value:
             value = self.evaluate(stmt.value)
-        raise ReturnException(value=value)
+        self.return_value = value
+        return Completion.RETURN
+
+    def tail_call(self, expr: Expr.Call) -> object:
+        """
+        Evaluates the callee and arguments of a call in tail position. Calls to Lox functions are returned
+        as a TailCall, to be made by the caller of the current function (see run_tail_calls)
+        """
+        callee = self.evaluate(expr.callee)
+        args = [self.evaluate(arg) for arg in expr.args]
+        function = self.check_call(callee, args, expr.paren)
+        if isinstance(function, (LoxFunction, ArrowFunction)):
+            return TailCall(function, args)
+        return function.call(self, args)
 
     @override
-    def visit_class_stmt(self, stmt: Stmt.Class) -> None:
-        self.environment.declare(stmt.name)
-
-        methods: Dict[str, LoxFunction] = {}
-        static_methods: Dict[str, LoxFunction] = {}
-        getters: Dict[str, LoxFunction] = {}
+    def visit_class_stmt(self, stmt: Stmt.Class) -> Completion | None:
+        # The methods can capture the class
+        cell = Cell() if stmt.is_cell else None
+        self.environment.define(stmt.slot, cell)
+
+        methods: Dict[str, Method] = {}
+        static_methods: Dict[str, Method] = {}
+        getters: Dict[str, Method] = {}
         base_class: LoxClass | None = None
 
         if stmt.base_class is not None:
@@ -390,43 +712,67 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
 
         for method in stmt.methods:
             function = LoxFunction(
-                closure=self.environment,
                 declaration=method,
+                upvalues=self.environment.capture(method.captures),
                 is_initializer=(method.name.string_repr == "init"),
+                super_class=base_class,
+                is_method=True,
             )
             methods[method.name.string_repr] = function
 
         for static_method in stmt.static_methods:
             function = LoxFunction(
-                closure=self.environment,
                 declaration=static_method,
+                upvalues=self.environment.capture(static_method.captures),
                 is_initializer=False,
             )
             static_methods[static_method.name.string_repr] = function
 
         for getter in stmt.getters:
             function = LoxFunction(
-                closure=self.environment,
                 declaration=getter,
+                upvalues=self.environment.capture(getter.captures),
                 is_initializer=False,
+                super_class=base_class,
+                is_method=True,
             )
             getters[getter.name.string_repr] = function
 
         classobj = LoxClass(
-            stmt.name.string_repr, methods, getters=getters, base_class=base_class
+            stmt.name.string_repr,
+            methods,
+            getters=getters,
+            base_class=base_class,
+            static_methods=static_methods,
         )
-        classobj.class_.methods = static_methods
-        self.environment.define(stmt.name, classobj)
+        if cell is None:
+            self.environment.define(stmt.slot, classobj)
+        else:
+            cell.value = classobj
+        return None
 
     @override
     def visit_get_expr(self, expr: Expr.Get) -> object:
-        obj = self.evaluate(expr.obj)
-        if not isinstance(obj, LoxInstance):
-            raise RuntimeException(
-                "Only instances of class have fields", token=expr.name
-            )
+        cache = expr.cache
+        if cache is None:
+            cache = self.property_cache(expr)
+        return self.check_instance(self.evaluate(expr.obj), expr.name).get_cached(
+            expr.name, self, cache
+        )
+
+    def property_cache(self, expr: Expr.Get | Expr.Set) -> PropertyCache:
+        """
+        Returns the inline cache of a property access, which is created on the first access
+        """
+        cache = expr.cache
+        if cache is None:
+            cache = expr.cache = PropertyCache(expr.name.string_repr)
+        return cache
 
-        return obj.get(expr.name, self)
+    def check_instance(self, obj: object, name: Token) -> LoxInstance:
+        if not isinstance(obj, LoxInstance):
+            raise RuntimeException("Only instances of class have fields", token=name)
+        return obj
 
     @override
     def visit_set_expr(self, expr: Expr.Set) -> object:
@@ -436,33 +782,47 @@ class Interpreter(Expr.Visitor[object], Stmt.Visitor[None]):
                 "Only instances of class have fields", token=expr.name
             )
         value = self.evaluate(expr.value)
-        obj.set(expr.name, value)
+        cache = expr.cache
+        if cache is None:
+            cache = self.property_cache(expr)
+        obj.set_cached(expr.name, value, cache)
         return value
 
     @override
     def visit_this_expr(self, expr: Expr.This) -> object:
-        return self.lookup_variable(expr.keyword, expr)
+        return self.look_up_variable(expr)
 
     @override
     def visit_super_expr(self, expr: Expr.Super) -> object:
-        return self.lookup_variable(expr.keyword, expr)
+        # super holds the base class of the class which defines the method
+        assert expr.this is not None, "Logic error: super is not resolved"
+        instance = self.look_up_variable(expr.this)
+        base_class = self.look_up_variable(expr)
+        assert isinstance(instance, LoxInstance) and isinstance(base_class, LoxClass)
+        return SuperInstance(instance, base_class)
 
-    def execute(self, statement: Stmt.Stmt) -> None:
-        statement.accept(self)
+    def execute(self, statement: Stmt.Stmt) -> Completion | None:
+        return statement.accept(self)
 
     def interpret(self, statements: List[Stmt.Stmt]) -> None:
         try:
             for statement in statements:
                 self.execute(statement)
 
+        except RecursionError:
+            self.report_runtime_error(self.python_stack_overflow())
         except RuntimeException as e:
-            if self.error_reporter is None:
-                raise e
-            self.error_reporter.report("error", f"{e}", token=e.token)
-
-    def resolve(self, expr: Expr.Expr, nesting: int) -> None:
-        self.nesting[id(expr)] = nesting
-
-    def lookup_variable(self, name: Token, expr: Expr.Expr) -> object:
-        nesting = self.nesting[id(expr)]
-        return self.environment.get_at(nesting, name)
+            self.report_runtime_error(e)
+
+    def report_runtime_error(self, e: RuntimeException) -> None:
+        if self.error_reporter is None:
+            raise e
+        self.error_reporter.report("error", f"{e}", token=e.token)
+
+    def python_stack_overflow(self) -> RuntimeException:
+        """
+        Error for a program which recursed deeper than the python stack allows
+        """
+        return RuntimeException(
+            "Runtime Exception: Stack overflow, the program recursed too deeply. The vm backend keeps its own call stack, and supports deeper recursion"
+        )
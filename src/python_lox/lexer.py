@@ -1,13 +1,149 @@
-from typing import List
+import re
+from array import array
+from sys import intern
+from typing import Dict, Iterator, List, Sequence, TextIO, overload
 
 from .error_reporter import ErrorReporter
 from .exceptions import LexerException
 from .token import Token, TokenType, double_char_tokens, keywords, single_char_tokens
 
+"""
+The lexer scans the source with one regular expression, MASTER_PATTERN, which matches a whole lexeme
+at a time. The pattern only matches the common, valid forms of lexemes, at any other character, matched by
+the group "other", the lexer falls back to find_token, which lexes the token one character at a time, and reports errors. So the
+tokens, lines and errors are those of find_token: for example, identifiers and numbers next to a non
+ASCII character are left to find_token, since str.isalpha and str.isdigit accept some of them
+
+The tokens are stored in a compact TokenBuffer. Lexer.process returns all the tokens of the source in one
+buffer. Lexer.tokens lexes the source into a buffer a batch of tokens at a time, and yields each token as the
+parser reaches it, so that a file can be lexed a chunk at a time, into a buffer for each chunk. Lox runs
+programs this way, the parser only keeps the tokens of the declaration it is parsing
+"""
+
+OPERATORS = {**double_char_tokens, **single_char_tokens, "/": TokenType.SLASH}
+
+MASTER_PATTERN = re.compile(
+    rf"""
+    (?P<skip>(?:[ \t\r\n]+|//[^\n]*|/\*[\s\S]*?\*/)+)
+    |(?P<identifier>[A-Za-z_][A-Za-z0-9_]*+)(?![^\x00-\x7f])
+    |(?P<operator>{"|".join(re.escape(lexeme) for lexeme in sorted(OPERATORS, key=len, reverse=True) if lexeme != "/")}|/(?![/*]))
+    |(?P<number>[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)(?![\w.])
+    |(?P<string>"[^"]*")
+    |(?P<hexadecimal>0[xX][0-9a-fA-F]+)(?![\w.])
+    |(?P<binary>0[bB][01]+)(?![\w.])
+    |(?P<octal>0[oO][0-7]+)(?![\w.])
+    |(?P<other>[\s\S])
+    """,
+    re.VERBOSE,
+)
+
+BASES = {"hexadecimal": 16, "binary": 2, "octal": 8}
+
+# Token types by their index in the types column of a TokenBuffer
+TOKEN_TYPES = list(TokenType)
+TYPE_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+KEYWORD_CODES = {
+    lexeme: TYPE_CODES[token_type] for lexeme, token_type in keywords.items()
+}
+OPERATOR_CODES = {
+    lexeme: TYPE_CODES[token_type] for lexeme, token_type in OPERATORS.items()
+}
+IDENTIFIER_CODE = TYPE_CODES[TokenType.IDENTIFIER]
+NUMBER_CODE = TYPE_CODES[TokenType.NUMBER]
+STRING_CODE = TYPE_CODES[TokenType.STRING]
+
+# Number of tokens lexed by Lexer.tokens before the parser reads them
+BATCH_SIZE = 4096
+
+# Number of characters read from a file at a time, a chunk is then extended to the end of its last line
+CHUNK_SIZE = 1 << 16
+
+
+class TokenBuffer(Sequence[Token]):
+    """
+    The tokens of a source, stored as columns of integers, the type, line, start and end of each token, and
+    a table of the literals of numbers and strings. A Token is created when it is read, with its lexeme
+    sliced from the source. Identifiers are interned, so all their tokens share one string
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.types = array("i")
+        self.lines = array("i")
+        self.starts = array("i")
+        self.ends = array("i")
+        self.literals: Dict[int, int | float | str] = {}
+
+    def append(self, token: Token) -> None:
+        if token.literal is not None and token.token_type is not TokenType.IDENTIFIER:
+            self.literals[len(self.types)] = token.literal
+        self.types.append(TYPE_CODES[token.token_type])
+        self.lines.append(token.line)
+        self.starts.append(token.start)
+        self.ends.append(token.end)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @overload
+    def __getitem__(self, index: int) -> Token: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Token]: ...
+
+    def __getitem__(self, index: int | slice) -> Token | List[Token]:
+        if isinstance(index, slice):
+            return list(self.read(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Token index out of range")
+        return next(self.read(index, index + 1))
+
+    def __iter__(self) -> Iterator[Token]:
+        return self.read(0, len(self))
+
+    def read(self, start: int, stop: int, step: int = 1) -> Iterator[Token]:
+        """
+        Yields the tokens from start to stop
+        """
+        source = self.source
+        types, lines, starts, ends = self.types, self.lines, self.starts, self.ends
+        literals = self.literals
+        for index in range(start, stop, step):
+            token_type = TOKEN_TYPES[types[index]]
+            if token_type is TokenType.EOF:
+                yield Token(token_type=TokenType.EOF)
+                continue
+            token_start, token_end = starts[index], ends[index]
+            string_repr = source[token_start:token_end]
+            literal: int | float | str | None
+            if token_type is TokenType.IDENTIFIER:
+                literal = string_repr = intern(string_repr)
+            else:
+                literal = literals.get(index)
+            yield Token(
+                token_type,
+                lines[index],
+                literal,
+                string_repr,
+                token_start,
+                token_end,
+                source,
+            )
+
 
 class Lexer:
-    def __init__(self, source: str, error_reporter: ErrorReporter | None = None):
-        self.source = source
+    def __init__(
+        self, source: str | TextIO, error_reporter: ErrorReporter | None = None
+    ):
+        # A file is lexed a chunk of lines at a time, source then holds the current chunk
+        self.file: TextIO | None = None
+        if isinstance(source, str):
+            self.source = source
+        else:
+            self.file = source
+            self.source = ""
         # Index of the first character of the current token
         self.index = 0
         # Current character to be consumed
@@ -262,7 +398,7 @@ class Lexer:
             self.advance()
 
         token = self.create_token(TokenType.IDENTIFIER)
-        token.literal = self.source[self.index : self.current]
+        token.literal = token.string_repr = intern(token.string_repr)
 
         keyword = keywords.get(token.literal)
         if keyword is not None:
@@ -321,29 +457,136 @@ class Lexer:
                     )
         return None
 
-    def process(self) -> List[Token]:
-        tokens: List[Token] = []
+    def process(self) -> TokenBuffer:
+        """
+        Returns all the tokens of the source, followed by an EOF token
+        """
+        if self.file is not None:
+            # Every token is kept, so the file is read at once
+            self.source = self.file.read()
+            self.file = None
+        tokens = TokenBuffer(self.source)
+        for _ in self.scan(tokens):
+            pass
+        tokens.append(Token(token_type=TokenType.EOF))
+        return tokens
 
-        while self.current < len(self.source):
-            self.index = self.current
-            try:
-                token = self.find_token()
-                if token is None:
-                    continue
-                tokens.append(token)
-            except LexerException as e:
-                if self.error_reporter is None:
-                    raise e
-                self.error_reporter.report("error", f"{str(e)} at line {e.line_no}")
-                while self.current < len(self.source):
-                    if (
-                        self.lookahead() == "\n"
-                        or self.lookahead() == "{"
-                        or self.lookahead() == "}"
-                    ):
-                        break
-                    self.advance()
+    def tokens(self) -> Iterator[Token]:
+        """
+        Yields the tokens of the source as the parser reaches them, followed by an EOF token. They are lexed a
+        batch at a time into a TokenBuffer. A file is read in chunks of whole lines, each lexed into a buffer of
+        its own, when the tokens lexed from the previous chunk run out
+        """
+        while True:
+            tokens = TokenBuffer(self.source)
+            read = 0
+            for _ in self.scan(tokens):
+                yield from tokens.read(read, len(tokens))
+                read = len(tokens)
+            yield from tokens.read(read, len(tokens))
+            if self.file is None:
+                break
+            chunk = self.file.read(CHUNK_SIZE)
+            if chunk:
+                chunk += self.file.readline()
+            else:
+                # The rest of the source can no longer be completed by another chunk, lex it as is
+                self.file = None
+            # A string or block comment which was not closed in the previous chunk is lexed again from its start
+            self.source = self.source[self.current :] + chunk
+            self.index = self.current = 0
 
         # Add an EOF token, so that parsing becomes easier
-        tokens.append(Token(token_type=TokenType.EOF))
-        return tokens
+        yield Token(token_type=TokenType.EOF)
+
+    def scan(self, tokens: TokenBuffer) -> Iterator[None]:
+        """
+        Lexes the tokens from current to the end of the source into the buffer. Pauses after every BATCH_SIZE
+        tokens, and before a lexeme which is lexed one character at a time, since it may report an error, which
+        comes after the errors of the tokens before it. While the file has more chunks, stops at a string or
+        block comment which is not closed in the source
+        """
+        source = self.source
+        current = self.current
+        line = self.line
+        types = tokens.types
+        add_type, add_line = types.append, tokens.lines.append
+        add_start, add_end = tokens.starts.append, tokens.ends.append
+        literals = tokens.literals
+        pause = len(types) + BATCH_SIZE
+
+        while current < len(source):
+            # Every character is matched, so each lexeme starts where the previous one ends
+            for lexeme in MASTER_PATTERN.finditer(source, current):
+                kind = lexeme.lastgroup
+                text = lexeme[0]
+                end = current + len(text)
+                if kind == "identifier":
+                    add_type(KEYWORD_CODES.get(text, IDENTIFIER_CODE))
+                elif kind == "skip":
+                    line += text.count("\n")
+                    current = end
+                    continue
+                elif kind == "operator":
+                    add_type(OPERATOR_CODES[text])
+                elif kind == "number":
+                    literals[len(types)] = int(text) if text.isdigit() else float(text)
+                    add_type(NUMBER_CODE)
+                elif kind == "string":
+                    # A string can span lines, its token is on the line where it ends
+                    line += text.count("\n")
+                    literals[len(types)] = text[1:-1]
+                    add_type(STRING_CODE)
+                elif kind == "other":
+                    self.index = self.current = current
+                    self.line = line
+                    if self.file is not None and (
+                        text == '"' or source.startswith("/*", current)
+                    ):
+                        # The string or comment may be closed in the next chunk of the file
+                        return
+                    yield
+                    # Lex this token one character at a time, and match again from where it ends
+                    scanned: List[Token] = []
+                    self.scan_token(scanned)
+                    for token in scanned:
+                        tokens.append(token)
+                    current = self.current
+                    line = self.line
+                    pause = len(types) + BATCH_SIZE
+                    break
+                else:
+                    literals[len(types)] = int(text, base=BASES[kind])  # type: ignore
+                    add_type(NUMBER_CODE)
+                add_line(line)
+                add_start(current)
+                add_end(end)
+                current = end
+                if len(types) >= pause:
+                    yield
+                    pause = len(types) + BATCH_SIZE
+
+        self.index = self.current = current
+        self.line = line
+
+    def scan_token(self, tokens: List[Token]) -> None:
+        """
+        Lexes the token at current one character at a time, or reports the error and skips the rest of the
+        line, up to the next brace
+        """
+        try:
+            token = self.find_token()
+            if token is not None:
+                tokens.append(token)
+        except LexerException as e:
+            if self.error_reporter is None:
+                raise e
+            self.error_reporter.report("error", f"{str(e)} at line {e.line_no}")
+            while self.current < len(self.source):
+                if (
+                    self.lookahead() == "\n"
+                    or self.lookahead() == "{"
+                    or self.lookahead() == "}"
+                ):
+                    break
+                self.advance()
@@ -1,36 +1,107 @@
+import sys
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, TextIO, Type
+
+from .ast import stmt as Stmt
+from .bytecode import disassemble
+from .bytecode_compiler import BytecodeCompiler
+from .closure_compiler import ClosureInterpreter
+from .constant_folder import ConstantFolder
 from .error_reporter import ErrorReporter
-from .interpreter import Interpreter
+from .flags import Flags
+from .inliner import Inliner
+from .interpreter import DEFAULT_MAX_DEPTH, Interpreter
 from .lexer import Lexer
-from .parser import Parser
-from .resolver import IdentifierState, Resolver
+from .native_functions import native_functions
+from .parser import MAX_NESTING, Parser
+from .resolver import MAX_EXPRESSION_DEPTH, IdentifierState, Resolver
+from .transpiler import PythonInterpreter, PythonTranspiler
+from .vm import VirtualMachine
+
+"""
+Execution engines which can run a resolved program
+tree: Walks the AST, and evaluates each node using the visitor pattern
+closure: Compiles the AST into nested python closures, and runs them
+vm: Compiles the AST into bytecode, and runs it on a stack based virtual machine
+python: Transpiles the AST into python source code, and runs it with exec
+"""
+backends: Dict[str, Type[Interpreter]] = {
+    "tree": Interpreter,
+    "closure": ClosureInterpreter,
+    "vm": VirtualMachine,
+    "python": PythonInterpreter,
+}
+
+# Python frames used by the passes and the backends, which recurse into statements, for each level of
+# nested blocks and functions
+FRAMES_PER_NESTING = 15
+# Python frames used by the passes and the backends which recurse into expressions, for each level of nesting
+FRAMES_PER_EXPRESSION = 5
+
+
+@contextmanager
+def python_stack() -> Iterator[None]:
+    """
+    Raises the python recursion limit while a program is compiled and run, so that the MAX_NESTING levels of
+    blocks that the parser accepts, and expressions up to MAX_EXPRESSION_DEPTH levels, fit on the stack above
+    the frames of the caller
+    """
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(
+        limit
+        + MAX_NESTING * FRAMES_PER_NESTING
+        + MAX_EXPRESSION_DEPTH * FRAMES_PER_EXPRESSION
+    )
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
 
 
 class Lox:
     version = "0.1.0"
     build_date = "12 April 2025 17:01:30"
 
-    def __init__(self, error_reporter: ErrorReporter) -> None:
+    def __init__(
+        self,
+        error_reporter: ErrorReporter,
+        backend: str = "tree",
+        stdout: TextIO = sys.stdout,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ) -> None:
+        if backend not in backends:
+            raise ValueError(f'Unknown backend "{backend}"')
         self.error_reporter = error_reporter
-        self.interpreter = Interpreter(error_reporter=error_reporter)
+        self.backend = backend
+        self.interpreter = backends[backend](
+            error_reporter=error_reporter, stdout=stdout
+        )
+        self.interpreter.max_depth = max_depth
         self.resolver = Resolver(self.interpreter, self.error_reporter)
+        flags = Flags()
+        self.inliner = Inliner(
+            flags.get_bool("finline-functions"), flags.get_int("finline-limit")
+        )
+        self.constant_folder = ConstantFolder(self.interpreter, self.error_reporter)
         self.error_reporter.is_error = False
         self.error_reporter.messages.clear()
-        self.resolver.scopes = []
-        self.resolver.scopes.append({})
-        for global_value in self.interpreter.globals.values.keys():
-            self.resolver.scopes[0][global_value] = IdentifierState(
-                is_init=True, is_defined=True, is_mutable=True
+        self.resolver.begin_scope()
+        for function in native_functions:
+            self.resolver.add_identifier(
+                function.name(),
+                IdentifierState(is_init=True, is_defined=True, is_mutable=True),
             )
 
         self.resolver.begin_scope()
 
-    def run(self, source: str, repl: bool = False) -> int:
+    @python_stack()
+    def run(self, source: str | TextIO, repl: bool = False) -> int:
         """
-        Execute the source program
+        Execute the source program, which is either a string or a file read in chunks
         """
+        # The lexer fills a TokenBuffer a batch of tokens at a time, as the parser reaches them
         lexer = Lexer(source, self.error_reporter)
-        tokens = lexer.process()
-        parser = Parser(tokens, self.error_reporter)
+        parser = Parser(lexer.tokens(), self.error_reporter, self.interpreter.sources)
         statements = parser.parse(repl)
         if statements is None:
             return 1
@@ -38,14 +109,89 @@ class Lox:
         """
         Create a scope for the entire program
         """
+        self.resolver.deep_expressions = 0
         self.resolver.resolve(statements)
+        if self.error_reporter.is_error:
+            return 1
 
+        if (
+            self.resolver.deep_expressions
+            and not self.interpreter.supports_deep_expressions()
+        ):
+            self.report_deep_expressions(self.backend)
+            return 1
+        statements = self.optimize(statements)
         if self.error_reporter.is_error:
             return 1
 
+        # In the REPL, a declaration on a previous line may have been resolved, but never executed
+        self.interpreter.environment.reserve(self.resolver.scope_sizes[-1])
         self.interpreter.interpret(statements)
 
         return 0
 
+    @python_stack()
+    def parse_and_resolve(self, source: str | TextIO) -> List[Stmt.Stmt] | None:
+        """
+        Parse and resolve the source program without running it. Returns None if there are any errors
+        """
+        # The lexer fills a TokenBuffer a batch of tokens at a time, as the parser reaches them
+        lexer = Lexer(source, self.error_reporter)
+        parser = Parser(lexer.tokens(), self.error_reporter, self.interpreter.sources)
+        statements = parser.parse()
+        if statements is None:
+            return None
+
+        self.resolver.deep_expressions = 0
+        self.resolver.resolve(statements)
+        if self.error_reporter.is_error:
+            return None
+
+        statements = self.optimize(statements)
+        if self.error_reporter.is_error:
+            return None
+        return statements
+
+    def optimize(self, statements: List[Stmt.Stmt]) -> List[Stmt.Stmt]:
+        """
+        Inlines and folds the resolved statements
+        """
+        statements = self.inliner.inline(statements)
+        return self.constant_folder.fold(statements)
+
+    def report_deep_expressions(self, backend: str) -> None:
+        self.error_reporter.report(
+            "error",
+            f"Error: Expression nested too deeply, the {backend} backend supports at most {MAX_EXPRESSION_DEPTH} levels of nesting. Use the tree backend",
+        )
+
+    @python_stack()
+    def disassemble(self, source: str) -> str | None:
+        """
+        Compile the source program to bytecode, and return the disassembled listing without running it
+        """
+        statements = self.parse_and_resolve(source)
+        if statements is None:
+            return None
+        if self.resolver.deep_expressions:
+            self.report_deep_expressions("vm")
+            return None
+        return disassemble(
+            BytecodeCompiler(self.interpreter.sources).compile(statements)
+        )
+
+    @python_stack()
+    def emit_python(self, source: str) -> str | None:
+        """
+        Transpile the source program to python, and return the generated module without running it
+        """
+        statements = self.parse_and_resolve(source)
+        if statements is None:
+            return None
+        if self.resolver.deep_expressions:
+            self.report_deep_expressions("python")
+            return None
+        return PythonTranspiler([], self.interpreter.sources).transpile(statements)
+
     def close(self) -> None:
         self.resolver.end_scope()
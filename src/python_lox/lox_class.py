@@ -1,78 +1,308 @@
-from typing import TYPE_CHECKING, Dict, List, override
+from typing import TYPE_CHECKING, Dict, List, Tuple, override
 
 from .exceptions import RuntimeException
 from .token import Token
 
 if TYPE_CHECKING:
     from python_lox.interpreter import Interpreter
-from .callable import Callable, LoxFunction
+from .callable import Callable, Method
+
+# Kinds of the entries of the method table of a class
+METHOD = 0
+GETTER = 1
+STATIC_METHOD = 2
+
+"""
+Method table of a class, maps the name of every method, getter and static method that an instance of the
+class can use (including the inherited ones) to its kind, and the method. It is built when the class is
+created, from the table of the base class and the methods of the class, so finding a method is one lookup
+"""
+MethodEntry = Tuple[int, Method]
+MethodTable = Dict[str, MethodEntry]
+
+# Number of shapes, and of classes, that a property cache remembers after the first one. A site which sees
+# more of them looks up the property without the cache for the rest
+POLYMORPHIC_CACHE_SIZE = 4
+
+
+class Shape:
+    """
+    Layout of the fields of an instance, maps the name of each field to its index in the values of the
+    instance. Instances which had the same fields added in the same order share a shape. Adding a field moves
+    an instance to the next shape, which is created once and then reused
+    """
+
+    __slots__ = ("slots", "transitions")
+
+    def __init__(self, slots: Dict[str, int]) -> None:
+        self.slots = slots
+        self.transitions: Dict[str, Shape] = {}
+
+    def add_field(self, name: str) -> "Shape":
+        shape = self.transitions.get(name)
+        if shape is None:
+            shape = Shape({**self.slots, name: len(self.slots)})
+            self.transitions[name] = shape
+        return shape
+
+
+# Shape of an instance without any fields
+EMPTY_SHAPE = Shape({})
+
+
+class PropertyCache:
+    """
+    Inline cache of a property access site, for the property key. It remembers the index of the field in
+    the shapes of the instances seen at the site (-1 if the shape does not have the field), and the entry
+    of the method table of their classes. The first shape and class are kept in attributes, which the
+    instance checks itself (monomorphic), the next ones in small dicts (polymorphic). A shape always has
+    the same fields, and the method table of a class does not change, so an entry is never invalidated
+    """
+
+    __slots__ = ("key", "shape", "index", "class_", "entry", "shapes", "classes")
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.shape: Shape | None = None
+        self.index = -1
+        self.class_: LoxClass | None = None
+        self.entry: MethodEntry | None = None
+        self.shapes: Dict[Shape, int] = {}
+        self.classes: Dict[LoxClass, MethodEntry | None] = {}
+
+    def field_index(self, shape: Shape) -> int:
+        """
+        Returns the index of the field in shape, or -1 if shape does not have the field
+        """
+        if shape is self.shape:
+            return self.index
+        index = self.shapes.get(shape)
+        if index is None:
+            index = self.add_shape(shape)
+        return index
+
+    def add_shape(self, shape: Shape) -> int:
+        """
+        Looks up the field in a shape that the cache does not have, and remembers its index if there is room
+        """
+        index = shape.slots.get(self.key, -1)
+        if self.shape is None:
+            self.shape, self.index = shape, index
+        elif len(self.shapes) < POLYMORPHIC_CACHE_SIZE:
+            self.shapes[shape] = index
+        return index
+
+    def add_class(self, class_: "LoxClass") -> MethodEntry | None:
+        """
+        Looks up the property in the method table of a class that the cache does not have, and remembers
+        the entry if there is room. Returns the entry if it is a method or a getter, or None. Static methods
+        come after the fields of the class, which can change, so they are not cached
+        """
+        entry = class_.table.get(self.key)
+        if entry is not None and entry[0] == STATIC_METHOD:
+            entry = None
+        if self.class_ is None:
+            self.class_, self.entry = class_, entry
+        elif len(self.classes) < POLYMORPHIC_CACHE_SIZE:
+            self.classes[class_] = entry
+        return entry
 
 
 class LoxInstance:
-    def __init__(
-        self, class_: "LoxClass", base_class_instance: "LoxInstance | None" = None
-    ) -> None:
+    __slots__ = ("class_", "shape", "values", "bound_methods")
+
+    def __init__(self, class_: "LoxClass") -> None:
         self.class_ = class_
-        self.fields: Dict[str, object] = {}
-        self.base_class_instance: LoxInstance | None = base_class_instance
+        self.shape = EMPTY_SHAPE
+        self.values: List[object] = []
+        # Methods of the instance which have been used as values, created on first use
+        self.bound_methods: Dict[Method, Method] | None = None
 
     def __str__(self) -> str:
         return f"<{self.class_.name()} instance at 0x{id(self):x}>"
 
     def get(self, name: Token, interpreter: "Interpreter") -> object:
-        if name.string_repr in self.fields:
-            return self.fields[name.string_repr]
-
-        if name.string_repr in self.class_.getters:
-            return (
-                self.class_.getters[name.string_repr].bind(self).call(interpreter, [])
-            )
-
-        if name.string_repr in self.class_.methods:
-            return self.class_.methods[name.string_repr].bind(self)
-
-        if name.string_repr in self.class_.fields:
-            return self.class_.fields[name.string_repr]
-
-        if name.string_repr in self.class_.class_.methods:
-            return self.class_.class_.methods[name.string_repr]
-
-        if self.base_class_instance is not None:
-            try:
-                return self.base_class_instance.get(name, interpreter)
-            except RuntimeException as r:
-                if str(r).startswith("Error: There is no attribute"):
-                    raise RuntimeException(
-                        f'Error: There is no attribute "{name.string_repr}" on an instance of class "{self.class_.name()}"',
-                        token=name,
-                    )
-                else:
-                    raise r
+        index = self.shape.slots.get(name.string_repr)
+        if index is not None:
+            return self.values[index]
+        return self.class_.get_property(self, name, interpreter)
 
-        raise RuntimeException(
-            f'Error: There is no attribute "{name.string_repr}" on an instance of class "{self.class_.name()}"',
-            token=name,
-        )
+    def get_cached(
+        self, name: Token, interpreter: "Interpreter", cache: PropertyCache
+    ) -> object:
+        """
+        Same as get, but finds the property with the inline cache of the site. The monomorphic and
+        polymorphic cases are checked here, without calling into the cache
+        """
+        shape = self.shape
+        if shape is cache.shape:
+            index = cache.index
+        else:
+            found = cache.shapes.get(shape)
+            index = cache.add_shape(shape) if found is None else found
+        if index >= 0:
+            return self.values[index]
+        class_ = self.class_
+        if class_ is cache.class_:
+            entry = cache.entry
+        else:
+            entry = cache.classes.get(class_)
+            if entry is None:
+                entry = cache.add_class(class_)
+        if entry is None:
+            return class_.get_property(self, name, interpreter)
+        kind, method = entry
+        if kind == METHOD:
+            return self.bound_method(method)
+        return method.call_method(interpreter, self, [])
+
+    def find_method(self, key: str) -> Method | None:
+        """
+        Returns the method which get would bind for key, so that a call can pass the instance to it without
+        binding it. Returns None if the property is not a method
+        """
+        if key in self.shape.slots:
+            return None
+        entry = self.class_.table.get(key)
+        if entry is None or entry[0] != METHOD:
+            return None
+        return entry[1]
+
+    def find_method_cached(self, cache: PropertyCache) -> Method | None:
+        """
+        Same as find_method, with the inline cache of the site
+        """
+        shape = self.shape
+        index = cache.index if shape is cache.shape else cache.field_index(shape)
+        if index >= 0:
+            return None
+        class_ = self.class_
+        if class_ is cache.class_:
+            entry = cache.entry
+        else:
+            entry = cache.classes.get(class_)
+            if entry is None:
+                entry = cache.add_class(class_)
+        if entry is None or entry[0] != METHOD:
+            return None
+        return entry[1]
+
+    def bound_method(self, method: Method) -> Method:
+        """
+        Returns method bound to the instance, the bound method is created once and then reused
+        """
+        bound_methods = self.bound_methods
+        if bound_methods is None:
+            bound_methods = self.bound_methods = {}
+        bound = bound_methods.get(method)
+        if bound is None:
+            bound = bound_methods[method] = method.bind(self)
+        return bound
 
     def set(self, name: Token, value: object) -> None:
-        self.fields[name.string_repr] = value
+        key = name.string_repr
+        index = self.shape.slots.get(key)
+        if index is not None:
+            self.values[index] = value
+        else:
+            self.shape = self.shape.add_field(key)
+            self.values.append(value)
+
+    def set_cached(self, name: Token, value: object, cache: PropertyCache) -> None:
+        """
+        Same as set, but finds the field with the inline cache of the site
+        """
+        shape = self.shape
+        index = cache.index if shape is cache.shape else cache.field_index(shape)
+        if index >= 0:
+            self.values[index] = value
+        else:
+            self.shape = shape.add_field(name.string_repr)
+            self.values.append(value)
+
+
+class SuperInstance(LoxInstance):
+    """
+    Value of "super" in a method: the instance the method is bound to, seen as an instance of the base class
+    of the class which defines the method. Properties are looked up in the base class, fields are the fields
+    of the instance
+    """
+
+    __slots__ = ("instance",)
+
+    def __init__(self, instance: LoxInstance, class_: "LoxClass") -> None:
+        super().__init__(class_)
+        self.instance = instance
+
+    def __str__(self) -> str:
+        return str(self.instance)
+
+    @override
+    def get(self, name: Token, interpreter: "Interpreter") -> object:
+        instance = self.instance
+        index = instance.shape.slots.get(name.string_repr)
+        if index is not None:
+            return instance.values[index]
+        return self.class_.get_property(instance, name, interpreter)
+
+    @override
+    def get_cached(
+        self, name: Token, interpreter: "Interpreter", cache: PropertyCache
+    ) -> object:
+        # The entries of the cache are for the class of the instance, not the base class
+        return self.get(name, interpreter)
+
+    @override
+    def find_method(self, key: str) -> Method | None:
+        # The method is bound with get, which passes the instance instead of this view
+        return None
+
+    @override
+    def find_method_cached(self, cache: PropertyCache) -> Method | None:
+        return None
+
+    @override
+    def set(self, name: Token, value: object) -> None:
+        self.instance.set(name, value)
+
+    @override
+    def set_cached(self, name: Token, value: object, cache: PropertyCache) -> None:
+        self.instance.set_cached(name, value, cache)
 
 
 class LoxClass(LoxInstance, Callable):
     def __init__(
         self,
         name_: str,
-        methods: Dict[str, LoxFunction],
-        getters: Dict[str, LoxFunction] = {},
+        methods: Dict[str, Method],
+        getters: Dict[str, Method] = {},
         base_class: "LoxClass | None" = None,
+        static_methods: Dict[str, Method] = {},
     ) -> None:
-        LoxInstance.__init__(self, Meta())
+        LoxInstance.__init__(self, Meta(static_methods))
         Callable.__init__(self)
         self.name_ = name_
         self.methods = methods
         self.getters = getters
         self.base_class = base_class
 
+        # Methods of the class override the ones of its base classes
+        self.table: MethodTable = {} if base_class is None else dict(base_class.table)
+        for kind, table in (
+            (STATIC_METHOD, static_methods),
+            (METHOD, methods),
+            (GETTER, getters),
+        ):
+            for key, method in table.items():
+                self.table[key] = (kind, method)
+        self.initializer = self.find_initializer()
+
+    def find_initializer(self) -> Method | None:
+        entry = self.table.get("init")
+        if entry is None or entry[0] != METHOD:
+            return None
+        return entry[1]
+
     def __str__(self) -> str:
         return f"<class {self.name_}>"
 
@@ -80,65 +310,67 @@ class LoxClass(LoxInstance, Callable):
     def name(self) -> str:
         return self.name_
 
+    def get_property(
+        self, instance: LoxInstance, name: Token, interpreter: "Interpreter"
+    ) -> object:
+        """
+        Returns the property of instance (of this class) which is not one of its fields. Methods and getters
+        come first, then the fields of the class and its base classes, and then the static methods
+        """
+        key = name.string_repr
+        entry = self.table.get(key)
+        if entry is not None:
+            kind, method = entry
+            if kind == METHOD:
+                return instance.bound_method(method)
+            if kind == GETTER:
+                return method.call_method(interpreter, instance, [])
+
+        class_: LoxClass | None = self
+        while class_ is not None:
+            index = class_.shape.slots.get(key)
+            if index is not None:
+                return class_.values[index]
+            class_ = class_.base_class
+
+        if entry is not None:
+            return entry[1]
+
+        raise RuntimeException(
+            f'Error: There is no attribute "{key}" on an instance of class "{self.name()}"',
+            token=name,
+        )
+
     @override
     def arity(self) -> int:
-        constructor = self.methods.get("init")
-        if constructor is None:
+        if self.initializer is None:
             return 0
-        return constructor.arity()
+        return self.initializer.arity()
 
     @override
-    def call(
-        self,
-        interpreter: "Interpreter",
-        args: List[object],
-        do_not_call_init: bool = False,
-    ) -> object:
-        base_class_instance: LoxInstance | None = None
-        if self.base_class:
-            base_class_instance = self.base_class.call(interpreter, [], True)  # type: ignore
-
-        instance = LoxInstance(class_=self, base_class_instance=base_class_instance)
-        if not do_not_call_init:
-            constructor = self.methods.get("init")
-            if constructor is not None:
-                constructor.bind(instance).call(interpreter, args)
+    def call(self, interpreter: "Interpreter", args: List[object]) -> object:
+        instance = LoxInstance(class_=self)
+        if self.initializer is not None:
+            self.initializer.call_method(interpreter, instance, args)
         return instance
 
 
 class Meta(LoxClass):
-    def __init__(self) -> None:
+    """
+    Class of a class object, the properties of a class are its static methods
+    """
+
+    def __init__(self, static_methods: Dict[str, Method]) -> None:
         LoxInstance.__init__(self, self)
         Callable.__init__(self)
         self.name_ = "Meta"
-        self.methods: Dict[str, LoxFunction] = {}
-        self.getters: Dict[str, LoxFunction] = {}
+        self.methods = static_methods
+        self.getters = {}
         self.base_class = None
+        self.table = {
+            key: (STATIC_METHOD, method) for key, method in static_methods.items()
+        }
+        self.initializer = self.find_initializer()
 
     def __str__(self) -> str:
         return f"<meta {self.name_}>"
-
-    @override
-    def name(self) -> str:
-        return self.name_
-
-    @override
-    def arity(self) -> int:
-        constructor = self.methods.get("init")
-        if constructor is None:
-            return 0
-        return constructor.arity()
-
-    @override
-    def call(
-        self,
-        interpreter: "Interpreter",
-        args: List[object],
-        do_not_call_init: bool = False,
-    ) -> object:
-        instance = LoxInstance(class_=self)
-        if not do_not_call_init:
-            constructor = self.methods.get("init")
-            if constructor is not None:
-                constructor.bind(instance).call(interpreter, args)
-        return instance
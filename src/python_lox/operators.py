@@ -0,0 +1,131 @@
+import operator
+import typing
+from typing import Any, Dict, Tuple
+
+from .exceptions import RuntimeException, TypeException
+from .token import TokenType, double_char_tokens, single_char_tokens
+
+"""
+Implementations of the binary operators, looked up by the operator and the types of both operands. The
+table is filled when the module is imported for every pair of the builtin types, including the pairs for
+which the operator is an error, so applying an operator is one dictionary lookup and one call. The result
+of an operation is the same on every backend, see the NOTES block of interpreter.py
+
+An implementation which raises a RuntimeException leaves its token as None, the caller sets it to the
+operator of the expression
+"""
+
+Operation = typing.Callable[[Any, Any], object]
+
+NUMBER_TYPES = (int, float, bool)
+BUILTIN_TYPES = (int, float, bool, str, type(None))
+
+ARITHMETIC_OPERATORS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.PERCENTAGE: operator.mod,
+}
+COMPARISON_OPERATORS = {
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+}
+# The operators, besides equality, which are looked up in the table
+OPERATORS = [*ARITHMETIC_OPERATORS, TokenType.SLASH, *COMPARISON_OPERATORS]
+
+LEXEMES = {
+    token_type: lexeme
+    for lexeme, token_type in {**single_char_tokens, **double_char_tokens}.items()
+}
+LEXEMES[TokenType.SLASH] = "/"
+
+
+def divide(left: Any, right: Any) -> object:
+    try:
+        return left / right
+    except ZeroDivisionError:
+        raise RuntimeException("Runtime Error: Divide by Zero Error: division by zero")
+
+
+def always_equal(left: Any, right: Any) -> bool:
+    return True
+
+
+def never_equal(left: Any, right: Any) -> bool:
+    return False
+
+
+def different_types(token_type: TokenType) -> Operation:
+    message = f"Runtime Error: Operator {LEXEMES.get(token_type, token_type.name)} not supported between different types"
+
+    def operation(left: Any, right: Any) -> object:
+        raise TypeException(message)
+
+    return operation
+
+
+def invalid_operands(token_type: TokenType) -> Operation:
+    message = f'Type Error: Operator "{LEXEMES.get(token_type, token_type.name)}" not valid between the operands'
+
+    def operation(left: Any, right: Any) -> object:
+        raise TypeException(message)
+
+    return operation
+
+
+def kind(value_type: type) -> type:
+    """
+    Returns the type an operand is checked as, the number types are all int
+    """
+    return int if value_type in NUMBER_TYPES else value_type
+
+
+def make_operation(
+    token_type: TokenType, left_type: type, right_type: type
+) -> Operation:
+    """
+    Returns the implementation of the operator for operands of the given types
+    """
+    same_type = kind(left_type) is kind(right_type)
+    if token_type == TokenType.EQUAL_EQUAL:
+        return operator.eq if same_type else never_equal
+    if token_type == TokenType.BANG_EQUAL:
+        return operator.ne if same_type else always_equal
+    if not same_type:
+        return different_types(token_type)
+    if left_type in NUMBER_TYPES:
+        if token_type == TokenType.SLASH:
+            return divide
+        if token_type in ARITHMETIC_OPERATORS:
+            return ARITHMETIC_OPERATORS[token_type]
+    if left_type in NUMBER_TYPES or left_type is str:
+        if token_type in COMPARISON_OPERATORS:
+            return COMPARISON_OPERATORS[token_type]
+    if left_type is str and token_type == TokenType.PLUS:
+        return operator.add
+    return invalid_operands(token_type)
+
+
+BINARY_OPERATIONS: Dict[Tuple[TokenType, type, type], Operation] = {
+    (token_type, left_type, right_type): make_operation(
+        token_type, left_type, right_type
+    )
+    for token_type in [*OPERATORS, TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL]
+    for left_type in BUILTIN_TYPES
+    for right_type in BUILTIN_TYPES
+}
+
+
+def lookup(token_type: TokenType, left: object, right: object) -> Operation:
+    """
+    Returns the implementation of the operator for the operands. Operands of other types, such as
+    instances and functions, are only equal to themselves, their operations are added to the table the
+    first time they are used
+    """
+    key = (token_type, type(left), type(right))
+    operation = BINARY_OPERATIONS.get(key)
+    if operation is None:
+        operation = BINARY_OPERATIONS[key] = make_operation(*key)
+    return operation
@@ -1,23 +1,159 @@
+from contextlib import contextmanager
 from copy import copy
-from typing import Final, List
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Final, Iterable, Iterator, List
 
 from .ast import expr, stmt
 from .error_reporter import ErrorReporter
 from .exceptions import ParserException
+from .position import SourceTable
 from .token import Token, TokenType
 
 MAX_ARGUMENTS: Final = 255
+MAX_NESTING: Final = 200
+
+
+class Precedence(IntEnum):
+    """
+    How tightly the infix operators bind their operands, from the loosest to the tightest
+    """
+
+    COMMA = 1
+    ASSIGNMENT = 2
+    TERNARY = 3
+    OR = 4
+    AND = 5
+    EQUALITY = 6
+    COMPARISON = 7
+    TERM = 8
+    FACTOR = 9
+    # The operand of a prefix operator
+    UNARY = 10
+
+
+BINDING_POWERS: Final = {
+    TokenType.COMMA: Precedence.COMMA,
+    TokenType.EQUAL: Precedence.ASSIGNMENT,
+    TokenType.PLUS_EQUAL: Precedence.ASSIGNMENT,
+    TokenType.MINUS_EQUAL: Precedence.ASSIGNMENT,
+    TokenType.STAR_EQUAL: Precedence.ASSIGNMENT,
+    TokenType.SLASH_EQUAL: Precedence.ASSIGNMENT,
+    TokenType.PERCENTAGE_EQUAL: Precedence.ASSIGNMENT,
+    TokenType.QUESTION_MARK: Precedence.TERNARY,
+    TokenType.OR: Precedence.OR,
+    TokenType.AND: Precedence.AND,
+    TokenType.EQUAL_EQUAL: Precedence.EQUALITY,
+    TokenType.BANG_EQUAL: Precedence.EQUALITY,
+    TokenType.GREATER: Precedence.COMPARISON,
+    TokenType.GREATER_EQUAL: Precedence.COMPARISON,
+    TokenType.LESS: Precedence.COMPARISON,
+    TokenType.LESS_EQUAL: Precedence.COMPARISON,
+    TokenType.PLUS: Precedence.TERM,
+    TokenType.MINUS: Precedence.TERM,
+    TokenType.STAR: Precedence.FACTOR,
+    TokenType.SLASH: Precedence.FACTOR,
+    TokenType.PERCENTAGE: Precedence.FACTOR,
+}
+
+# The binary operator of each augmented assignment
+AUGMENTED_OPERATORS: Final = {
+    TokenType.PLUS_EQUAL: TokenType.PLUS,
+    TokenType.MINUS_EQUAL: TokenType.MINUS,
+    TokenType.STAR_EQUAL: TokenType.STAR,
+    TokenType.SLASH_EQUAL: TokenType.SLASH,
+    TokenType.PERCENTAGE_EQUAL: TokenType.PERCENTAGE,
+}
+
+KEYWORD_LITERALS: Final = {
+    TokenType.FALSE: False,
+    TokenType.TRUE: True,
+    TokenType.NIL: None,
+}
+
+# Binary operators which are reported as missing their left hand operand at the start of an expression
+MISSING_OPERAND_OPERATORS: Final = {
+    TokenType.BANG_EQUAL,
+    TokenType.EQUAL_EQUAL,
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+    TokenType.PLUS,
+    TokenType.STAR,
+    TokenType.SLASH,
+}
+
+
+@dataclass(slots=True)
+class PendingOperator:
+    """
+    An operator whose operand on the right is being parsed, see Parser.binary
+    """
+
+    operator: Token
+    # The operand on the left, None for prefix operators and opening parentheses, or the function of a call
+    left: expr.Expr | None
+    # Precedence of the expression which the operator is part of
+    precedence: int
+    # The arguments parsed so far, for a call
+    arguments: List[expr.Expr] | None = None
+    # The if branch, for a ternary expression whose else branch is being parsed
+    if_branch: expr.Expr | None = None
+
+
+class TokenStream:
+    """
+    The tokens read by the parser, indexed from the start of the program. Tokens are taken from the
+    iterator, such as Lexer.tokens, as the parser reaches them, and the tokens before the declaration being
+    parsed are dropped, since the parser only backtracks within a declaration
+    """
+
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        self.iterator = iter(tokens)
+        self.buffer: List[Token] = []
+        # Index of the first token in the buffer
+        self.start = 0
+
+    def __getitem__(self, index: int) -> Token:
+        offset = index - self.start
+        buffer = self.buffer
+        while offset >= len(buffer):
+            token = next(self.iterator, None)
+            if token is None:
+                # The last token is EOF
+                return buffer[-1]
+            buffer.append(token)
+        return buffer[offset]
+
+    def discard(self, index: int) -> None:
+        """
+        Drops the tokens before index
+        """
+        if index > self.start:
+            del self.buffer[: index - self.start]
+            self.start = index
 
 
 class Parser:
     def __init__(
-        self, tokens: List[Token], error_reporter: ErrorReporter | None = None
+        self,
+        tokens: Iterable[Token],
+        error_reporter: ErrorReporter | None = None,
+        sources: SourceTable | None = None,
     ) -> None:
-        self.tokens = tokens
+        self.tokens = TokenStream(tokens)
         self.error_reporter = error_reporter
+        # The table of the interpreter which runs the program, for the positions in the AST
+        self.sources = sources if sources is not None else SourceTable()
 
         # Next token to be processed
         self.current: int = 0
+        # Number of blocks and functions which enclose the current token
+        self.nesting = 0
+        # Set when the nesting is too deep. The rest of the program is not parsed, since the parser would find
+        # the closing braces of the blocks it did not parse, and report them as errors
+        self.too_deep = False
 
     def match(self, token_types: List[TokenType]) -> bool:
         """
@@ -54,8 +190,6 @@ class Parser:
         return self.peek().token_type == token_type
 
     def check_next(self, token_type: TokenType) -> bool:
-        if (self.current + 1) >= len(self.tokens):
-            return False
         return self.tokens[self.current + 1].token_type == token_type
 
     def advance(self) -> Token:
@@ -73,217 +207,209 @@ class Parser:
     def previous(self) -> Token:
         return self.tokens[self.current - 1]
 
+    @contextmanager
+    def nested(self) -> Iterator[None]:
+        """
+        Parses a nested block, or function body. The parser, and the passes after it, recurse into blocks, so
+        nesting deeper than MAX_NESTING is reported as an error
+        """
+        self.nesting += 1
+        try:
+            if self.nesting > MAX_NESTING:
+                self.too_deep = True
+                raise ParserException(
+                    f"Too many nested blocks, at most {MAX_NESTING} are allowed",
+                    token=self.previous(),
+                )
+            yield
+        finally:
+            self.nesting -= 1
+
     # Code for recursive descent parser
 
     def expression(self) -> expr.Expr:
-        return self.comma()
+        return self.binary(Precedence.COMMA)
 
-    def comma(self) -> expr.Expr:
+    def binary(self, precedence: int) -> expr.Expr:
         """
-        The comma operator has the lowest precedence among all operators, and it evaluates to it's rightmost expression
-        It can be of the form comma ("," comma)*
+        Parses an expression whose infix operators bind at least as tightly as precedence. An operator waits on
+        a stack while its operand is parsed, instead of a recursive call, so that operators can be chained or
+        nested to any depth: prefix operators, parentheses, calls, and the operands on the right of infix
+        operators. The operand on the right of a left associative operator binds one level tighter than the
+        operator, the ternary and assignment operators are right associative
         """
-        exp = self.assign()
-        while self.match([TokenType.COMMA]):
-            operator = self.previous()
-            right = self.assign()
-            exp = expr.Binary(left=exp, operator=operator, right=right)
-        return exp
-
-    def assign(self) -> expr.Expr:
-        exp = self.ternary()
-        if self.match(
-            [
-                TokenType.EQUAL,
-                TokenType.PLUS_EQUAL,
-                TokenType.STAR_EQUAL,
-                TokenType.SLASH_EQUAL,
-                TokenType.PERCENTAGE_EQUAL,
-                TokenType.MINUS_EQUAL,
-            ]
-        ):
-            # Since assignment is right associative
-            operator = self.previous()
-            value = self.assign()
+        pending: List[PendingOperator] = []
+        while True:
+            # Prefix operators and opening parentheses wait for the operand after them
+            token = self.peek()
+            if token.token_type in expr.unary_classes:
+                self.advance()
+                pending.append(PendingOperator(token, None, precedence))
+                precedence = Precedence.UNARY
+                continue
+            if token.token_type == TokenType.LEFT_PAREN:
+                self.advance()
+                # It can either be an arrow function, or a grouping
+                arrow = self.arrow_function()
+                if arrow is None:
+                    pending.append(PendingOperator(token, None, precedence))
+                    precedence = Precedence.COMMA
+                    continue
+                exp: expr.Expr = arrow
+            else:
+                exp = self.primary()
 
-            op: Token = copy(operator)
-            match operator.token_type:
-                case TokenType.PLUS_EQUAL:
-                    op.token_type = TokenType.PLUS
-                    op.string_repr = "+"
-                case TokenType.MINUS_EQUAL:
-                    op.token_type = TokenType.MINUS
-                    op.string_repr = "-"
-                case TokenType.STAR_EQUAL:
-                    op.token_type = TokenType.STAR
-                    op.string_repr = "*"
-                case TokenType.SLASH_EQUAL:
-                    op.token_type = TokenType.SLASH
-                    op.string_repr = "/"
-                case TokenType.PERCENTAGE_EQUAL:
-                    op.token_type = TokenType.PERCENTAGE
-                    op.string_repr = "%"
-                case TokenType.EQUAL:
-                    pass
-                case _:
-                    raise SystemExit("Logic error")
-
-            # Perform desguaring, split augment assignment to binary + assignment
-            if op.token_type != TokenType.EQUAL:
-                value = expr.Binary(left=exp, operator=op, right=value)
-
-            if isinstance(exp, expr.Variable):
-                return expr.Assign(name=exp.name, value=value)
-            elif isinstance(exp, expr.Get):
-                return expr.Set(exp.obj, exp.name, value)
+            while True:
+                # A function call can be chained if one call returns another function
+                # For example: foo()(3, 2)(5, 6) ...
+                token = self.peek()
+                if token.token_type == TokenType.LEFT_PAREN:
+                    self.advance()
+                    if not self.match([TokenType.RIGHT_PAREN]):
+                        # Parse the first argument
+                        pending.append(PendingOperator(token, exp, precedence, []))
+                        precedence = Precedence.ASSIGNMENT
+                        break
+                    paren = self.previous()
+                    exp = expr.Call(
+                        callee=exp, paren=self.sources.position(paren), args=[]
+                    )
+                    continue
+                if token.token_type == TokenType.DOT:
+                    self.advance()
+                    self.consume(
+                        [TokenType.IDENTIFIER], 'Expected property name after "."'
+                    )
+                    exp = expr.Get(exp, self.previous())
+                    continue
 
+                binding_power = BINDING_POWERS.get(token.token_type)
+                if binding_power is not None and binding_power >= precedence:
+                    # Parse the operand on the right of the operator
+                    self.advance()
+                    pending.append(PendingOperator(token, exp, precedence))
+                    if binding_power == Precedence.TERNARY:
+                        # The if branch is a whole expression
+                        precedence = Precedence.COMMA
+                    elif binding_power == Precedence.ASSIGNMENT:
+                        # Since assignment is right associative
+                        precedence = Precedence.ASSIGNMENT
+                    else:
+                        precedence = binding_power + 1
+                    break
+
+                # The expression ends here, it is the operand of the last pending operator
+                if not pending:
+                    return exp
+                operator = pending.pop()
+                precedence = operator.precedence
+                if operator.arguments is not None:
+                    operator.arguments.append(exp)
+                    if self.match([TokenType.COMMA]):
+                        self.check_arguments(operator.arguments)
+                        pending.append(operator)
+                        precedence = Precedence.ASSIGNMENT
+                        break
+                    self.consume(
+                        [TokenType.RIGHT_PAREN], message='Expected ")" after arguments'
+                    )
+                    assert operator.left is not None
+                    paren = self.previous()
+                    exp = expr.Call(
+                        callee=operator.left,
+                        paren=self.sources.position(paren),
+                        args=operator.arguments,
+                    )
+                elif operator.left is None:
+                    exp = self.prefix(operator.operator, exp)
+                elif operator.operator.token_type == TokenType.QUESTION_MARK:
+                    if operator.if_branch is None:
+                        # There should be a mandatory :
+                        self.consume(
+                            [TokenType.COLON],
+                            "Expected : after if branch in ternary expression",
+                        )
+                        # Parse the else branch, which can contain another ternary (right associative)
+                        operator.if_branch = exp
+                        pending.append(operator)
+                        precedence = Precedence.TERNARY
+                        break
+                    exp = expr.Ternary(
+                        condition=operator.left,
+                        if_branch=operator.if_branch,
+                        else_branch=exp,
+                    )
+                else:
+                    exp = self.infix(operator.left, operator.operator, exp)
+
+    def check_arguments(self, arguments: List[expr.Expr]) -> None:
+        """
+        Reports a call with too many arguments, before the next argument is parsed
+        """
+        if len(arguments) >= MAX_ARGUMENTS:
             if self.error_reporter is not None:
                 self.error_reporter.report(
-                    "error", "Invalid assignment", token=operator
+                    "error",
+                    f"Cannot have more than {MAX_ARGUMENTS} arguments",
+                    token=self.peek(),
                 )
             else:
-                raise ParserException("Invalid assignment", token=operator)
-
-        return exp
+                raise ParserException(
+                    f"Cannot have more than ${MAX_ARGUMENTS} arguments",
+                    token=self.peek(),
+                )
 
-    def ternary(self) -> expr.Expr:
+    def prefix(self, operator: Token, right: expr.Expr) -> expr.Expr:
         """
-        https://en.cppreference.com/w/c/language/operator_precedence
-        In precedence chart, ternery operator's precedence > comma, but is less than equality
+        Returns the expression of a prefix operator, or of parentheses, around its operand
         """
-        # A ternary expression is of the form: equality?equality:ternary
-        exp = self.logical_or()
-
-        # Look for a ?
-        if self.match([TokenType.QUESTION_MARK]):
-            # It is a ternary expression
-            if_branch = self.expression()
-
-            # There should be a mandatory :
+        if operator.token_type == TokenType.LEFT_PAREN:
+            # If right parenthesis is not found, it's an error
             self.consume(
-                [TokenType.COLON], "Expected : after if branch in ternary expression"
+                [TokenType.RIGHT_PAREN],
+                "Could not find closing ')' after expression",
             )
+            return expr.Grouping(right)
+        return expr.unary_classes[operator.token_type](operator=operator, right=right)
 
-            # Recursively parse the else branch, since it can contain another ternery (right associative)
-            else_branch = self.ternary()
-            exp = expr.Ternary(
-                condition=exp, if_branch=if_branch, else_branch=else_branch
-            )
-        return exp
-
-    def logical_or(self) -> expr.Expr:
-        exp = self.logical_and()
-        while self.match([TokenType.OR]):
-            operator = self.previous()
-            right = self.logical_and()
-            exp = expr.Logical(left=exp, operator=operator, right=right)
-        return exp
-
-    def logical_and(self) -> expr.Expr:
-        exp = self.equality()
-        while self.match([TokenType.AND]):
-            operator = self.previous()
-            right = self.equality()
-            exp = expr.Logical(left=exp, operator=operator, right=right)
-        return exp
-
-    def equality(self) -> expr.Expr:
-        exp = self.comparison()
-        # A equality is of the following form: comparison (("!=" | "==") comparison) *
-        while self.match([TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL]):
-            operator = self.previous()
-            right = self.comparison()
-            exp = expr.Binary(left=exp, operator=operator, right=right)
-        return exp
-
-    def comparison(self) -> expr.Expr:
-        exp = self.term()
-        while self.match(
-            [
-                TokenType.GREATER,
-                TokenType.GREATER_EQUAL,
-                TokenType.LESS,
-                TokenType.LESS_EQUAL,
-            ]
-        ):
-            operator = self.previous()
-            right = self.term()
-            exp = expr.Binary(left=exp, operator=operator, right=right)
-        return exp
-
-    def term(self) -> expr.Expr:
-        exp = self.factor()
-        while self.match([TokenType.MINUS, TokenType.PLUS]):
-            operator = self.previous()
-            right = self.factor()
-            exp = expr.Binary(left=exp, operator=operator, right=right)
-        return exp
-
-    def factor(self) -> expr.Expr:
-        exp = self.unary()
-        while self.match([TokenType.STAR, TokenType.SLASH, TokenType.PERCENTAGE]):
-            operator = self.previous()
-            right = self.unary()
-            exp = expr.Binary(left=exp, operator=operator, right=right)
-        return exp
-
-    def unary(self) -> expr.Expr:
-        if self.match(
-            [TokenType.BANG, TokenType.NOT, TokenType.MINUS, TokenType.TYPEOF]
-        ):
-            operator = self.previous()
-            right = self.unary()
-            return expr.Unary(operator=operator, right=right)
-
-        return self.call()
-
-    def call(self) -> expr.Expr:
-        # A function call can be chained if one call returns another function
-        # For example: foo()(3, 2)(5, 6) ...
-        exp = self.primary()
+    def infix(self, left: expr.Expr, operator: Token, right: expr.Expr) -> expr.Expr:
+        """
+        Returns the expression of a binary, logical or assignment operator
+        """
+        token_type = operator.token_type
+        if BINDING_POWERS[token_type] == Precedence.ASSIGNMENT:
+            return self.assignment(left, operator, right)
+        if token_type == TokenType.OR or token_type == TokenType.AND:
+            return expr.Logical(left=left, operator=operator, right=right)
+        return expr.binary_classes[token_type](
+            left=left, operator=operator, right=right
+        )
 
-        while True:
-            if self.match([TokenType.LEFT_PAREN]):
-                args = self.function_args()
-                paren = self.previous()
-                exp = expr.Call(callee=exp, paren=paren, args=args)
-            elif self.match([TokenType.DOT]):
-                self.consume([TokenType.IDENTIFIER], 'Expected property name after "."')
-                name = self.previous()
-                exp = expr.Get(exp, name)
-            else:
-                break
-        return exp
+    def assignment(
+        self, target: expr.Expr, operator: Token, value: expr.Expr
+    ) -> expr.Expr:
+        # Perform desguaring, split augment assignment to binary + assignment
+        token_type = AUGMENTED_OPERATORS.get(operator.token_type)
+        if token_type is not None:
+            op: Token = copy(operator)
+            op.token_type = token_type
+            # The lexeme of the operator, without "="
+            op.string_repr = operator.string_repr[:-1]
+            value = expr.binary_classes[token_type](
+                left=target, operator=op, right=value
+            )
 
-    def function_args(self) -> List[expr.Expr]:
-        # Parses function args, assumes that LEFT_PAREN "(" has already been consumed
-        # Returns a list of expressions, that denote the function arguments / parameters
-        arguments: List[expr.Expr] = []
-        if self.match([TokenType.RIGHT_PAREN]):
-            # There are no args
-            return arguments
+        if isinstance(target, expr.Variable):
+            return expr.Assign(name=target.name, value=value)
+        elif isinstance(target, expr.Get):
+            return expr.Set(target.obj, target.name, value)
 
-        while True:
-            if len(arguments) >= MAX_ARGUMENTS:
-                if self.error_reporter is not None:
-                    self.error_reporter.report(
-                        "error",
-                        f"Cannot have more than {MAX_ARGUMENTS} arguments",
-                        token=self.peek(),
-                    )
-                else:
-                    raise ParserException(
-                        f"Cannot have more than ${MAX_ARGUMENTS} arguments",
-                        token=self.peek(),
-                    )
-            argument = self.assign()
-            arguments.append(argument)
-            # If there are no more commas, break
-            if not self.match([TokenType.COMMA]):
-                break
+        if self.error_reporter is not None:
+            self.error_reporter.report("error", "Invalid assignment", token=operator)
+        else:
+            raise ParserException("Invalid assignment", token=operator)
 
-        self.consume([TokenType.RIGHT_PAREN], message='Expected ")" after arguments')
-        return arguments
+        return target
 
     def parameters(self, no_errors: bool = False) -> List[Token]:
         parameters: List[Token] = []
@@ -333,76 +459,43 @@ class Parser:
             exp = self.expression()
 
         self.consume([TokenType.SEMICOLON], 'Expected ";" after return statement')
-        return stmt.Return(keyword=keyword, value=exp)
+        return stmt.Return(keyword=self.sources.position(keyword), value=exp)
 
     def primary(self) -> expr.Expr:
-        if self.match([TokenType.IDENTIFIER]):
-            return expr.Variable(name=self.previous())
+        token = self.peek()
+        token_type = token.token_type
 
-        if self.match([TokenType.FALSE]):
-            return expr.Literal(value=False)
+        if token_type == TokenType.IDENTIFIER:
+            self.advance()
+            return expr.Variable(name=token)
 
-        if self.match([TokenType.TRUE]):
-            return expr.Literal(value=True)
+        if token_type == TokenType.NUMBER or token_type == TokenType.STRING:
+            self.advance()
+            return expr.Literal(value=token.literal)
 
-        if self.match([TokenType.THIS]):
-            return expr.This(keyword=self.previous())
+        if token_type in KEYWORD_LITERALS:
+            self.advance()
+            return expr.Literal(value=KEYWORD_LITERALS[token_type])
 
-        if self.match([TokenType.SUPER]):
-            return expr.Super(keyword=self.previous())
+        if token_type == TokenType.THIS:
+            self.advance()
+            return expr.This(keyword=token)
 
-        if self.match([TokenType.NIL]):
-            return expr.Literal(value=None)
+        if token_type == TokenType.SUPER:
+            self.advance()
+            return expr.Super(keyword=token)
 
-        if self.match([TokenType.NUMBER, TokenType.STRING]):
-            return expr.Literal(value=self.previous().literal)
+        # Error productions to handle missing left hand operands, the right hand operand is parsed as
+        # if the left hand operand was there
+        if token_type in MISSING_OPERAND_OPERATORS:
+            self.advance()
+            with self.nested():
+                self.binary(BINDING_POWERS[token_type])
+            raise ParserException("Left hand operand missing", token=token)
 
-        if self.match([TokenType.LEFT_PAREN]):
-            # It can either be an arrow function, or a grouping
-            fxn = self.arrow_function()
-            if fxn is None:
-                exp = self.expression()
-                # If right parenthesis is not found, it's an error
-                self.consume(
-                    [TokenType.RIGHT_PAREN],
-                    "Could not find closing ')' after expression",
-                )
-                return expr.Grouping(exp)
-            return fxn
-
-        # Add error productions here to handle missing left hand operands
-
-        if self.match([TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL]):
-            err_token = self.previous()
-            self.equality()
-            raise ParserException("Left hand operand missing", token=err_token)
-
-        if self.match(
-            [
-                TokenType.GREATER,
-                TokenType.GREATER_EQUAL,
-                TokenType.LESS,
-                TokenType.LESS_EQUAL,
-            ]
-        ):
-            err_token = self.previous()
-            self.comparison()
-            raise ParserException("Left hand operand missing", token=err_token)
-
-        if self.match([TokenType.PLUS]):
-            err_token = self.previous()
-            self.term()
-            raise ParserException("Left hand operand missing", token=err_token)
-
-        if self.match([TokenType.STAR, TokenType.SLASH]):
-            err_token = self.previous()
-            self.factor()
-            raise ParserException("Left hand operand missing", token=err_token)
-
-        tok = self.peek()
-        if tok.token_type == TokenType.EOF:
-            tok = self.previous()
-        raise ParserException("Expected expression", token=tok)
+        if token_type == TokenType.EOF:
+            token = self.previous()
+        raise ParserException("Expected expression", token=token)
 
     def arrow_function(self) -> None | expr.Arrow:
         prev_current: int = self.current
@@ -426,8 +519,11 @@ class Parser:
 
         else:
             # Parse an expression after an arrow function
-            exp = self.expression()
-            body: List[stmt.Stmt] = [stmt.Return(keyword=self.previous(), value=exp)]
+            with self.nested():
+                exp = self.expression()
+            body: List[stmt.Stmt] = [
+                stmt.Return(keyword=self.sources.position(self.previous()), value=exp)
+            ]
             return expr.Arrow(body=body, params=params)
 
     def synchronize(self) -> None:
@@ -556,17 +652,17 @@ class Parser:
             [TokenType.SEMICOLON],
             'Expected ";" after break statement',
         )
-        return stmt.Break(self.previous())
+        return stmt.Break(self.sources.position(self.previous()))
 
     def continue_statement(self) -> stmt.Continue:
         self.consume(
             [TokenType.SEMICOLON],
             'Expected ";" after continue statement',
         )
-        return stmt.Continue(self.previous())
+        return stmt.Continue(self.sources.position(self.previous()))
 
     def assert_statement(self) -> stmt.Assert:
-        exp = self.logical_or()
+        exp = self.binary(Precedence.OR)
         message_expression = None
 
         if self.match([TokenType.COMMA]):
@@ -603,8 +699,9 @@ class Parser:
 
     def block_statement(self) -> stmt.Block:
         statements: List[stmt.Stmt] = []
-        while not self.check(TokenType.RIGHT_BRACE) and not self.is_at_end():
-            statements.append(self.declaration())
+        with self.nested():
+            while not self.check(TokenType.RIGHT_BRACE) and not self.is_at_end():
+                statements.append(self.declaration())
 
         self.consume([TokenType.RIGHT_BRACE], 'Expected "}" after block')
         return stmt.Block(statements=statements)
@@ -708,6 +805,8 @@ class Parser:
     def parse(self, repl: bool = False) -> List[stmt.Stmt] | None:
         statements: List[stmt.Stmt] = []
         while not self.is_at_end():
+            # Keep the previous token, errors at the start of a declaration are reported at it
+            self.tokens.discard(self.current - 1)
             prev_current = self.current
             try:
                 # Ignore empty statements
@@ -716,10 +815,12 @@ class Parser:
                 if not self.is_at_end():
                     statements.append(self.declaration())
             except ParserException as e:
-                if not repl:
+                if not repl or self.too_deep:
                     if self.error_reporter is None:
                         raise e
                     self.error_reporter.report("error", f"{str(e)}", token=e.token)
+                    if self.too_deep:
+                        break
                     self.synchronize()
                 else:
                     # If we are running in REPL, also try to parse an expression
@@ -0,0 +1,70 @@
+from typing import Dict, List
+
+from .token import (
+    Token,
+    TokenType,
+    double_char_tokens,
+    keywords,
+    single_char_tokens,
+)
+
+"""
+A position packs where a token is in the source code into one integer: the index of its source in a SourceTable, its line,
+its start and its length. The AST stores positions instead of the tokens which are only used to report
+errors, such as the parenthesis of a call, since a token, with its lexeme and integers, takes several
+times the memory. SourceTable.token_at creates the token back when an error is reported
+"""
+
+Position = int
+
+LENGTH_BITS = 16
+START_BITS = 32
+LINE_BITS = 32
+
+# Token types of the lexemes that tokens at a position can have
+TOKEN_TYPES = {**keywords, **single_char_tokens, **double_char_tokens}
+
+
+class SourceTable:
+    """
+    The sources which positions refer to. A source is added when a position is first made in it, and is kept
+    since errors may be reported from functions defined in it for as long as the program runs. Each
+    interpreter has its own table, which the parser fills, so the sources are released with the interpreter
+    """
+
+    def __init__(self) -> None:
+        self.sources: List[str] = []
+        self.source_indices: Dict[str, int] = {}
+
+    def position(self, token: Token) -> Position:
+        index = self.source_indices.get(token.src)
+        if index is None:
+            index = self.source_indices[token.src] = len(self.sources)
+            self.sources.append(token.src)
+        length = min(token.end - token.start, (1 << LENGTH_BITS) - 1)
+        return (
+            (((index << LINE_BITS) | token.line) << START_BITS | token.start)
+            << LENGTH_BITS
+        ) | length
+
+    def token_at(self, position: Position | Token) -> Token:
+        """
+        Returns the token at the position, backends which keep the tokens of the program pass them as is
+        """
+        if isinstance(position, Token):
+            return position
+        length = position & ((1 << LENGTH_BITS) - 1)
+        position >>= LENGTH_BITS
+        start = position & ((1 << START_BITS) - 1)
+        position >>= START_BITS
+        line = position & ((1 << LINE_BITS) - 1)
+        src = self.sources[position >> LINE_BITS]
+        string_repr = src[start : start + length]
+        return Token(
+            token_type=TOKEN_TYPES.get(string_repr, TokenType.UNKNOWN),
+            line=line,
+            string_repr=string_repr,
+            start=start,
+            end=start + length,
+            src=src,
+        )
@@ -1,18 +1,31 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from enum import Enum, auto
-from typing import TYPE_CHECKING, Dict, Final, List, override
+from typing import TYPE_CHECKING, Dict, Final, List, Tuple, override
 
 from .ast import expr as Expr
 from .ast import stmt as Stmt
+from .environment import CELL, GLOBAL, LOCAL, UPVALUE
 from .error_reporter import ErrorLevel, ErrorReporter
 from .exceptions import NameException
 from .flags import Flags
-from .token import Token
+from .token import Token, TokenType
 
 if TYPE_CHECKING:
     from .interpreter import Interpreter
 
 
+# Expressions nested deeper than this are marked Deep. The tree backend evaluates them without recursing (see
+# Interpreter.evaluate_iteratively), and so do the inliner and constant folder. The other backends recurse into
+# expressions to compile them, and do not run a program with a Deep expression. Expressions up to this depth
+# fit on the python stack, which python_stack raises by FRAMES_PER_EXPRESSION frames for each level
+MAX_EXPRESSION_DEPTH: Final = 500
+
+# Nodes which use a variable
+VariableExpr = Expr.Variable | Expr.Assign | Expr.This | Expr.Super
+# Nodes which declare a variable, a function also declares its parameters
+Declaration = Stmt.Var | Stmt.Const | Stmt.Function | Stmt.Class | Expr.Arrow
+
+
 class IdentifierType(Enum):
     VARIABLE = auto()
     FUNCTION = auto()
@@ -26,6 +39,21 @@ class IdentifierState:
     is_used: bool = False
     identifier_type: IdentifierType = IdentifierType.VARIABLE
     token: Token | None = None
+    # Index of the identifier in the environment of its function
+    slot: int = 0
+    declaration: Declaration | None = None
+    is_param: bool = False
+    # Set when a closure captures the identifier, it is then stored in a Cell
+    is_captured: bool = False
+    # Uses of the identifier resolved as LOCAL, which become CELL if it is captured later
+    accesses: List[VariableExpr] = field(default_factory=list)
+
+
+@dataclass
+class FunctionScope:
+    # Index of the scope of the parameters in Resolver.scopes
+    scope: int
+    function: Stmt.Function | Expr.Arrow
 
 
 class FunctionType(Enum):
@@ -47,10 +75,21 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
     ) -> None:
         self.interpreter: Final["Interpreter"] = interpreter
         self.scopes: List[Dict[str, IdentifierState]] = []
+        # Number of slots allocated in each scope. It can be more than the number of identifiers in the
+        # scope, since a redeclared identifier gets a new slot
+        self.scope_sizes: List[int] = []
+        # Index of the scope whose environment holds the variables of each scope. Only functions and the
+        # global scopes get an environment at run time, the variables of a block take the next free slots
+        # of the enclosing environment, and the slots are reused after the block ends
+        self.scope_homes: List[int] = []
+        # Functions being resolved, the innermost last
+        self.function_scopes: List[FunctionScope] = []
         self.error_reporter = error_reporter
         self.loop_depth = 0
         self.current_function = FunctionType.NONE
         self.current_class = ClassType.NONE
+        # Number of expressions marked Deep, which the backends that recurse into expressions cannot run
+        self.deep_expressions = 0
 
         # TODO: Later pass the flags to the resolver class through the constructor (dependency injection)
         self.flags = Flags()
@@ -59,11 +98,69 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
         if isinstance(obj, list):
             for item in obj:
                 self.resolve(item)
+        elif isinstance(obj, Expr.Expr):
+            self.resolve_expr(obj)
         else:
             obj.accept(self)
 
-    def begin_scope(self) -> None:
+    def resolve_expr(self, root: Expr.Expr) -> Expr.Expr:
+        """
+        Resolves the operands of an expression from a stack, instead of recursing into them, so that
+        expressions can be nested to any depth. The operands are resolved in the order in which they are
+        evaluated, an assignment resolves its target after its value. Returns the expression, wrapped in a
+        Deep node if it is nested deeper than MAX_EXPRESSION_DEPTH
+        """
+        # The expressions left to resolve, with their depth. An assignment is pushed again, with a depth of
+        # -1, to resolve its target
+        stack: List[Tuple[Expr.Expr, int]] = [(root, 1)]
+        max_depth = 0
+        while stack:
+            expr, depth = stack.pop()
+            if depth < 0:
+                assert isinstance(expr, Expr.Assign)
+                self.resolve_local(expr, expr.name, should_be_mutable=True)
+                continue
+            if depth > max_depth:
+                max_depth = depth
+            operands: List[Expr.Expr]
+            match expr:
+                case Expr.Grouping():
+                    operands = [expr.expression]
+                case Expr.Unary():
+                    operands = [expr.right]
+                case Expr.Binary() | Expr.Logical():
+                    operands = [expr.left, expr.right]
+                case Expr.Ternary():
+                    operands = [expr.condition, expr.if_branch, expr.else_branch]
+                case Expr.Call():
+                    operands = [expr.callee, *expr.args]
+                case Expr.Get():
+                    operands = [expr.obj]
+                case Expr.Set():
+                    operands = [expr.value, expr.obj]
+                case Expr.Assign():
+                    stack.append((expr, -1))
+                    operands = [expr.value]
+                case _:
+                    expr.accept(self)
+                    continue
+            for operand in reversed(operands):
+                stack.append((operand, depth + 1))
+        if max_depth > MAX_EXPRESSION_DEPTH:
+            self.deep_expressions += 1
+            return Expr.Deep(root)
+        return root
+
+    def begin_scope(self, has_environment: bool = True) -> None:
         self.scopes.append({})
+        if has_environment or not self.scope_homes:
+            self.scope_homes.append(len(self.scopes) - 1)
+            self.scope_sizes.append(0)
+        else:
+            home = self.scope_homes[-1]
+            self.scope_homes.append(home)
+            # The size of the enclosing environment, which is restored when the scope ends
+            self.scope_sizes.append(self.scope_sizes[home])
 
     def end_scope(self) -> None:
         if self.flags.get_bool("Wunused") and self.error_reporter:
@@ -75,9 +172,28 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                         token=identifier.token,
                     )
 
+        home = self.scope_homes.pop()
+        if home != len(self.scopes) - 1:
+            self.scope_sizes[home] = self.scope_sizes[-1]
         self.scopes.pop()
+        self.scope_sizes.pop()
+
+    def add_identifier(self, name: str, state: IdentifierState) -> IdentifierState:
+        """
+        Adds name to the innermost scope, and assigns it the next free slot of the environment of the scope
+        """
+        home = self.scope_homes[-1]
+        state.slot = self.scope_sizes[home]
+        self.scope_sizes[home] += 1
+        self.scopes[-1][name] = state
+        return state
 
-    def declare(self, name: Token) -> None:
+    def declare(
+        self,
+        name: Token,
+        declaration: Declaration | None = None,
+        is_param: bool = False,
+    ) -> IdentifierState:
         # Check for shadowing
         if self.flags.get_bool("Wshadow") and self.error_reporter:
             for i in range(len(self.scopes) - 1, -1, -1):
@@ -94,8 +210,10 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                         token=value.token,
                     )
 
-        scope = self.scopes[-1]
-        scope[name.string_repr] = IdentifierState(token=name)
+        return self.add_identifier(
+            name.string_repr,
+            IdentifierState(token=name, declaration=declaration, is_param=is_param),
+        )
 
     def define(self, name: Token) -> None:
         scope = self.scopes[-1]
@@ -109,7 +227,7 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
 
     def resolve_local(
         self,
-        expr: Expr.Expr,
+        expr: VariableExpr,
         name: Token,
         should_be_init: bool = False,
         should_be_mutable: bool = False,
@@ -128,7 +246,7 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                     )
                 ident.is_init = True
                 ident.is_used = True
-                self.interpreter.resolve(expr, len(self.scopes) - 1 - i)
+                self.resolve_access(expr, ident, i)
                 return True
 
         """
@@ -141,6 +259,66 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
         )
         return False
 
+    def resolve_access(
+        self, expr: VariableExpr, ident: IdentifierState, scope: int
+    ) -> None:
+        """
+        Decides how expr accesses ident, which is declared in the scope at index scope
+        """
+        functions = self.function_scopes
+        expr.slot = ident.slot
+        outermost = functions[0].scope if functions else len(self.scopes)
+        if self.scope_homes[scope] == scope and scope < outermost:
+            # Global variables are never captured, since they can be used by a later input of the REPL
+            expr.access = GLOBAL
+            expr.depth = sum(
+                1 for j in range(scope + 1, outermost) if self.scope_homes[j] == j
+            )
+        elif not functions or scope >= functions[-1].scope:
+            if ident.is_captured:
+                expr.access = CELL
+            else:
+                expr.access = LOCAL
+                ident.accesses.append(expr)
+        else:
+            expr.access = UPVALUE
+            expr.slot = self.resolve_upvalue(len(functions) - 1, ident, scope)
+
+    def resolve_upvalue(self, function: int, ident: IdentifierState, scope: int) -> int:
+        """
+        Returns the index of the cell of ident in the captures of function_scopes[function], adding it to
+        the captures of the function, and of the functions between it and the declaration, if needed
+        """
+        capture: Tuple[bool, int]
+        if function == 0 or scope >= self.function_scopes[function - 1].scope:
+            # Declared by the enclosing function, or by a block of the program
+            self.capture(ident)
+            capture = (True, ident.slot)
+        else:
+            capture = (False, self.resolve_upvalue(function - 1, ident, scope))
+        captures = self.function_scopes[function].function.captures
+        if capture in captures:
+            return captures.index(capture)
+        captures.append(capture)
+        return len(captures) - 1
+
+    def capture(self, ident: IdentifierState) -> None:
+        """
+        Moves ident to a cell, and changes the uses that have already been resolved
+        """
+        if ident.is_captured:
+            return
+        ident.is_captured = True
+        for expr in ident.accesses:
+            expr.access = CELL
+        ident.accesses.clear()
+        declaration = ident.declaration
+        if ident.is_param:
+            assert isinstance(declaration, (Stmt.Function, Expr.Arrow))
+            declaration.cell_params.append(ident.slot)
+        elif isinstance(declaration, (Stmt.Var, Stmt.Const, Stmt.Function, Stmt.Class)):
+            declaration.is_cell = True
+
     def report_error(
         self, message: str, token: Token, severity: ErrorLevel = "error"
     ) -> None:
@@ -153,26 +331,56 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
             )
 
     def resolve_function(
-        self, params: List[Token], body: List[Stmt.Stmt], function_type: FunctionType
+        self,
+        function: Stmt.Function | Expr.Arrow,
+        function_type: FunctionType,
+        is_method: bool = False,
     ) -> None:
         enclosing = self.current_function
         self.current_function = function_type
         self.begin_scope()
-        for param in params:
-            self.declare(param)
+        self.function_scopes.append(FunctionScope(len(self.scopes) - 1, function))
+        if is_method:
+            # "this" is passed to a method in slot 0, before the parameters, followed by "super" in slot 1
+            self.add_identifier(
+                "this",
+                IdentifierState(
+                    is_defined=True,
+                    is_init=True,
+                    is_mutable=False,
+                    is_used=True,
+                    declaration=function,
+                    is_param=True,
+                ),
+            )
+            if self.current_class == ClassType.SUBCLASS:
+                self.add_identifier(
+                    "super",
+                    IdentifierState(
+                        is_defined=True,
+                        is_init=True,
+                        is_mutable=False,
+                        is_used=True,
+                        declaration=function,
+                        is_param=True,
+                    ),
+                )
+        for param in function.params:
+            self.declare(param, function, is_param=True)
             self.define(param)
             """
             Inside the function, all the parameter variables are initialized
             """
             self.scopes[-1][param.string_repr].is_init = True
 
-        self.resolve(body)
+        self.resolve(function.body)
+        self.function_scopes.pop()
         self.end_scope()
         self.current_function = enclosing
 
     @override
     def visit_block_stmt(self, stmt: Stmt.Block) -> None:
-        self.begin_scope()
+        self.begin_scope(has_environment=False)
         self.resolve(stmt.statements)
         self.end_scope()
 
@@ -183,10 +391,10 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                 f'var "{stmt.name.string_repr}" has already been declared in this scope',
                 token=stmt.name,
             )
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name, stmt).slot
 
         if stmt.initializer:
-            self.resolve(stmt.initializer)
+            stmt.initializer = self.resolve_expr(stmt.initializer)
             self.scopes[-1][stmt.name.string_repr].is_init = True
 
         self.define(stmt.name)
@@ -199,9 +407,9 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                 f'const "{stmt.name.string_repr}" has already been declared in this scope',
                 token=stmt.name,
             )
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name, stmt).slot
         if stmt.initializer:
-            self.resolve(stmt.initializer)
+            stmt.initializer = self.resolve_expr(stmt.initializer)
             self.scopes[-1][stmt.name.string_repr].is_init = True
         self.define(stmt.name)
 
@@ -241,19 +449,19 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                 token=stmt.name,
             )
 
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name, stmt).slot
         self.define(stmt.name)
         self.scopes[-1][stmt.name.string_repr].is_init = True
         self.scopes[-1][stmt.name.string_repr].identifier_type = IdentifierType.FUNCTION
-        self.resolve_function(stmt.params, stmt.body, FunctionType.FUNCTION)
+        self.resolve_function(stmt, FunctionType.FUNCTION)
 
     @override
     def visit_arrow_expr(self, expr: Expr.Arrow) -> None:
-        self.resolve_function(expr.params, expr.body, FunctionType.FUNCTION)
+        self.resolve_function(expr, FunctionType.FUNCTION)
 
     @override
     def visit_assert_stmt(self, stmt: Stmt.Assert) -> None:
-        self.resolve(stmt.expression)
+        stmt.expression = self.resolve_expr(stmt.expression)
 
     @override
     def visit_binary_expr(self, expr: Expr.Binary) -> None:
@@ -264,7 +472,8 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
     def visit_break_stmt(self, stmt: Stmt.Break) -> None:
         if self.loop_depth == 0:
             self.report_error(
-                'Syntax Error: "break" statement outside a loop', token=stmt.keyword
+                'Syntax Error: "break" statement outside a loop',
+                token=self.interpreter.sources.token_at(stmt.keyword),
             )
 
     @override
@@ -277,22 +486,23 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
     def visit_continue_stmt(self, stmt: Stmt.Continue) -> None:
         if self.loop_depth == 0:
             self.report_error(
-                'Syntax Error: "continue" statement outside a loop', token=stmt.keyword
+                'Syntax Error: "continue" statement outside a loop',
+                token=self.interpreter.sources.token_at(stmt.keyword),
             )
 
     @override
     def visit_expression_stmt(self, stmt: Stmt.Expression) -> None:
-        self.resolve(stmt.expression)
+        stmt.expression = self.resolve_expr(stmt.expression)
 
     @override
     def visit_for_stmt(self, stmt: Stmt.For) -> None:
-        self.begin_scope()
+        self.begin_scope(has_environment=False)
         if stmt.initializer:
             self.resolve(stmt.initializer)
         if stmt.condition:
-            self.resolve(stmt.condition)
+            stmt.condition = self.resolve_expr(stmt.condition)
         if stmt.update:
-            self.resolve(stmt.update)
+            stmt.update = self.resolve_expr(stmt.update)
 
         self.loop_depth += 1
         self.resolve(stmt.body)
@@ -305,7 +515,7 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
 
     @override
     def visit_if_stmt(self, stmt: Stmt.If) -> None:
-        self.resolve(stmt.condition)
+        stmt.condition = self.resolve_expr(stmt.condition)
         self.resolve(stmt.if_branch)
         if stmt.else_branch:
             self.resolve(stmt.else_branch)
@@ -321,26 +531,31 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
 
     @override
     def visit_print_stmt(self, stmt: Stmt.Print) -> None:
-        self.resolve(stmt.expression)
+        stmt.expression = self.resolve_expr(stmt.expression)
 
     @override
     def visit_println_stmt(self, stmt: Stmt.Println) -> None:
-        self.resolve(stmt.expression)
+        stmt.expression = self.resolve_expr(stmt.expression)
 
     @override
     def visit_return_stmt(self, stmt: Stmt.Return) -> None:
         if self.current_function == FunctionType.NONE:
             self.report_error(
                 'Syntax Error: "return" statement outside a function',
-                token=stmt.keyword,
+                token=self.interpreter.sources.token_at(stmt.keyword),
             )
         if stmt.value:
             if self.current_function == FunctionType.INITIALIZER:
                 self.report_error(
                     "Syntax Error: Cannot return a value inside a constructor",
-                    token=stmt.keyword,
+                    token=self.interpreter.sources.token_at(stmt.keyword),
                 )
-            self.resolve(stmt.value)
+            stmt.value = self.resolve_expr(stmt.value)
+            # Nothing is left to do in the function after the call returns, so the call can reuse the
+            # python frame of the function. Not done in initializers, which always return "this"
+            stmt.is_tail_call = isinstance(
+                stmt.value, Expr.Call
+            ) and self.current_function in (FunctionType.FUNCTION, FunctionType.METHOD)
 
     @override
     def visit_ternary_expr(self, expr: Expr.Ternary) -> None:
@@ -354,7 +569,7 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
 
     @override
     def visit_while_stmt(self, stmt: Stmt.While) -> None:
-        self.resolve(stmt.condition)
+        stmt.condition = self.resolve_expr(stmt.condition)
         self.loop_depth += 1
         self.resolve(stmt.body)
         self.loop_depth -= 1
@@ -371,7 +586,7 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
 
         enclosing = self.current_class
         self.current_class = ClassType.CLASS
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name, stmt).slot
         self.define(stmt.name)
         self.scopes[-1][stmt.name.string_repr].is_init = True
         self.scopes[-1][stmt.name.string_repr].is_mutable = False
@@ -399,29 +614,13 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                     static_method.name,
                     "error",
                 )
-            self.resolve_function(
-                params=static_method.params,
-                body=static_method.body,
-                function_type=FunctionType.METHOD,
-            )
-
-        self.begin_scope()
-        self.scopes[-1]["this"] = IdentifierState(
-            is_defined=True, is_init=True, is_mutable=False, is_used=True
-        )
-
-        if stmt.base_class is not None:
-            self.scopes[-1]["super"] = IdentifierState(
-                is_defined=True, is_init=True, is_mutable=False, is_used=True
-            )
+            self.resolve_function(static_method, FunctionType.METHOD)
 
         for method in stmt.methods:
             declaration = FunctionType.METHOD
             if method.name.string_repr == "init":
                 declaration = FunctionType.INITIALIZER
-            self.resolve_function(
-                params=method.params, body=method.body, function_type=declaration
-            )
+            self.resolve_function(method, declaration, is_method=True)
 
         for getter in stmt.getters:
             if getter.name.string_repr == "init":
@@ -430,13 +629,8 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
                     getter.name,
                     "error",
                 )
-            self.resolve_function(
-                params=getter.params,
-                body=getter.body,
-                function_type=FunctionType.FUNCTION,
-            )
+            self.resolve_function(getter, FunctionType.FUNCTION, is_method=True)
 
-        self.end_scope()
         self.current_class = enclosing
 
     @override
@@ -474,4 +668,10 @@ class Resolver(Expr.Visitor[None], Stmt.Visitor[None]):
             )
             return
         elif self.current_class == ClassType.SUBCLASS:
-            self.resolve_local(expr, expr.keyword)
+            if self.resolve_local(expr, expr.keyword):
+                # The instance is needed to bind the methods of the base class
+                keyword = replace(
+                    expr.keyword, token_type=TokenType.THIS, string_repr="this"
+                )
+                expr.this = Expr.This(keyword=keyword)
+                self.resolve_local(expr.this, keyword)
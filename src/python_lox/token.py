@@ -132,7 +132,7 @@ misc = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     token_type: TokenType = TokenType.UNKNOWN
     line: int = 0
@@ -0,0 +1,810 @@
+import sys
+import typing
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Set, TextIO, override
+
+from .ast import expr as Expr
+from .ast import stmt as Stmt
+from .callable import Method
+from .environment import Cell
+from .error_reporter import ErrorReporter
+from .exceptions import RuntimeException
+from .interpreter import Interpreter
+from .lox_class import LoxClass, LoxInstance, SuperInstance
+from .native_functions import native_functions
+from .position import SourceTable
+from .token import Token, TokenType
+
+"""
+Transpiles a resolved program into python source code, which is then compiled and executed by CPython
+
+Lox variables become python variables. Since a Lox block introduces a new scope, but a python function does
+not, every declaration gets its own python name: a Lox variable "x" is named "x_", and declarations that
+would clash with it are named "x_1", "x_2", and so on. Names generated by the transpiler itself start with
+an underscore, and neither end with an underscore nor have one right before their trailing digits, so they
+cannot clash with Lox variables.
+
+Variables declared at the top level of the program are python globals. A local variable which is captured
+by a nested function is stored in a Cell, and the cell is passed to the nested function as a keyword only
+default argument. This way, a closure created inside a loop captures the variable of that iteration, like
+it does in the tree walking interpreter. Since whether a variable is captured is only known after the
+functions that use it are transpiled, the program is transpiled twice, and the first pass only finds the
+captured variables.
+
+Operators have an inline fast path for numbers, and fall back to the methods of Interpreter for everything
+else, so that the semantics (and error messages) are the same as the other backends.
+"""
+
+NUMBER_TYPES = frozenset({int, float})
+NUMBER_PAIRS = frozenset({(a, b) for a in NUMBER_TYPES for b in NUMBER_TYPES})
+
+NUMERIC_OPERATORS: Dict[TokenType, str] = {
+    TokenType.PLUS: "+",
+    TokenType.MINUS: "-",
+    TokenType.STAR: "*",
+    TokenType.PERCENTAGE: "%",
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUAL: "<=",
+    TokenType.EQUAL_EQUAL: "==",
+    TokenType.BANG_EQUAL: "!=",
+}
+
+# Operators which always evaluate to a bool
+BOOLEAN_OPERATORS = {
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+    TokenType.EQUAL_EQUAL,
+    TokenType.BANG_EQUAL,
+}
+
+INDENT = "    "
+
+
+class TranspiledFunction(Method):
+    def __init__(
+        self,
+        function: typing.Callable[..., object],
+        name: str,
+        arity: int,
+        is_method: bool = False,
+        receiver: LoxInstance | None = None,
+    ) -> None:
+        self.function = function
+        self.name_ = name
+        self.arity_ = arity
+        self.is_method = is_method
+        self.receiver = receiver
+        # Called directly by the generated code, after checking the number of arguments
+        self.fast = partial(function, receiver) if is_method else function
+
+    @override
+    def name(self) -> str:
+        return self.name_
+
+    def __str__(self) -> str:
+        return f"<function {self.name_}>"
+
+    @override
+    def arity(self) -> int:
+        return self.arity_
+
+    @override
+    def call(self, interpreter: Interpreter, args: List[object]) -> object:
+        return self.fast(*args)
+
+    @override
+    def call_method(
+        self, interpreter: Interpreter, this: LoxInstance, args: List[object]
+    ) -> object:
+        if self.is_method:
+            return self.function(this, *args)
+        return self.function(*args)
+
+    @override
+    def bind(self, instance: LoxInstance) -> "TranspiledFunction":
+        return TranspiledFunction(
+            self.function, self.name_, self.arity_, self.is_method, instance
+        )
+
+
+@dataclass
+class Variable:
+    python_name: str
+    # Identifies the declaration in both passes
+    key: int = 0
+    is_global: bool = False
+    # True if the variable is captured by a nested function, and is stored in a Cell
+    boxed: bool = False
+
+
+@dataclass
+class FunctionState:
+    enclosing: "FunctionState | None"
+    scopes: List[Dict[str, Variable]] = field(default_factory=list)
+    is_initializer: bool = False
+    # Globals which are assigned in this function, and have to be declared global
+    global_names: Set[str] = field(default_factory=set)
+    # Cells of enclosing functions that are used in this function, or in functions nested in it
+    captures: Dict[str, None] = field(default_factory=dict)
+    temporaries: int = 0
+    # Set when a continue statement is transpiled, so that for loops know if they have to handle it
+    has_continue: bool = False
+
+
+class PythonTranspiler(Expr.Visitor[str], Stmt.Visitor[None]):
+    def __init__(self, tokens: List[Token], sources: SourceTable) -> None:
+        # Tokens used for reporting errors, the generated code refers to them as _tokens[index]
+        self.tokens = tokens
+        # For the tokens of the positions in the AST
+        self.sources = sources
+        self.token_indices: Dict[int, int] = {}
+        self.name_counts: Dict[str, int] = {}
+        # Keys of the declarations which are captured by a nested function
+        self.captured: Set[int] = set()
+        self.global_scope: Dict[str, Variable] = {}
+        for function in native_functions:
+            self.global_scope[function.name()] = Variable(
+                self.python_name(function.name()), is_global=True
+            )
+        self.state = FunctionState(None, [self.global_scope])
+        self.lines: List[str] = []
+        self.indent = 0
+        self.definitions = 0
+
+    def transpile(self, statements: List[Stmt.Stmt]) -> str:
+        """
+        Returns the source of a python module which defines a function _main, which runs the statements
+        """
+        counts = dict(self.name_counts)
+        global_scope = dict(self.global_scope)
+        self.emit_main(statements)
+
+        # The first pass has found all the captured variables, generate the code again
+        self.name_counts = counts
+        self.global_scope.clear()
+        self.global_scope.update(global_scope)
+        return self.emit_main(statements)
+
+    def emit_main(self, statements: List[Stmt.Stmt]) -> str:
+        self.state = FunctionState(None, [self.global_scope])
+        self.lines = []
+        self.indent = 1
+        self.definitions = 0
+        for statement in statements:
+            self.statement(statement)
+        if not self.lines:
+            self.emit("pass")
+        body = self.lines
+
+        self.lines = []
+        self.indent = 0
+        self.emit("def _main():")
+        if self.state.global_names:
+            self.emit(f"{INDENT}global {', '.join(sorted(self.state.global_names))}")
+        return "\n".join(self.lines + body) + "\n"
+
+    # Helpers for generating code
+
+    def emit(self, line: str) -> None:
+        self.lines.append(INDENT * self.indent + line)
+
+    def statement(self, stmt: Stmt.Stmt) -> None:
+        self.state.temporaries = 0
+        stmt.accept(self)
+
+    def block(self, statements: List[Stmt.Stmt]) -> None:
+        """
+        Emits statements in a new scope as an indented block
+        """
+        self.indent += 1
+        length = len(self.lines)
+        self.state.scopes.append({})
+        for statement in statements:
+            self.statement(statement)
+        self.state.scopes.pop()
+        if len(self.lines) == length:
+            self.emit("pass")
+        self.indent -= 1
+
+    def expression(self, expr: Expr.Expr) -> str:
+        return expr.accept(self)
+
+    def temporary(self) -> str:
+        self.state.temporaries += 1
+        return f"_t{self.state.temporaries}"
+
+    def token(self, token: Token) -> str:
+        index = self.token_indices.get(id(token))
+        if index is None:
+            index = len(self.tokens)
+            self.tokens.append(token)
+            self.token_indices[id(token)] = index
+        return f"_tokens[{index}]"
+
+    def python_name(self, name: str) -> str:
+        count = self.name_counts.get(name, 0)
+        self.name_counts[name] = count + 1
+        if count == 0:
+            return f"{name}_"
+        return f"{name}_{count}"
+
+    def truthy(self, expr: Expr.Expr) -> str:
+        """
+        Returns a python expression which is True if expr is truthy in Lox
+        """
+        if self.is_boolean(expr):
+            return self.expression(expr)
+        temp = self.temporary()
+        return (
+            f"(({temp} := {self.expression(expr)}) is not None and {temp} is not False)"
+        )
+
+    def is_boolean(self, expr: Expr.Expr) -> bool:
+        if isinstance(expr, Expr.Grouping):
+            return self.is_boolean(expr.expression)
+        if isinstance(expr, Expr.Binary):
+            return expr.operator.token_type in BOOLEAN_OPERATORS
+        if isinstance(expr, Expr.Not):
+            return True
+        if isinstance(expr, Expr.Literal):
+            return isinstance(expr.value, bool)
+        return False
+
+    # Variables
+
+    def declare(self, name: str, key: int) -> Variable:
+        """
+        Adds a variable to the innermost scope. key identifies the declaration across both passes
+        """
+        state = self.state
+        variable = Variable(self.python_name(name), key)
+        if state.enclosing is None and len(state.scopes) == 1:
+            variable.is_global = True
+            state.global_names.add(variable.python_name)
+        else:
+            variable.boxed = key in self.captured
+        state.scopes[-1][name] = variable
+        return variable
+
+    def define(self, variable: Variable, value: str) -> None:
+        if variable.boxed:
+            self.emit(f"{variable.python_name} = _Cell({value})")
+        else:
+            self.emit(f"{variable.python_name} = {value}")
+
+    def lookup(self, name: str) -> Variable:
+        """
+        Finds the variable that name refers to, and records it as captured if it belongs to an enclosing
+        function
+        """
+        state: FunctionState | None = self.state
+        between: List[FunctionState] = []
+        while state is not None:
+            for scope in reversed(state.scopes):
+                variable = scope.get(name)
+                if variable is None:
+                    continue
+                if between and not variable.is_global:
+                    self.captured.add(variable.key)
+                    if variable.boxed:
+                        for function in between:
+                            function.captures[variable.python_name] = None
+                return variable
+            between.append(state)
+            state = state.enclosing
+        raise AssertionError(f'Logic error: Unresolved variable "{name}"')
+
+    def load(self, name: str) -> str:
+        variable = self.lookup(name)
+        if variable.boxed:
+            return f"{variable.python_name}.value"
+        return variable.python_name
+
+    def store(self, name: str, value: str) -> str:
+        variable = self.lookup(name)
+        if variable.boxed:
+            return f"_store({variable.python_name}, {value})"
+        if variable.is_global:
+            self.state.global_names.add(variable.python_name)
+        return f"({variable.python_name} := {value})"
+
+    def function(
+        self,
+        python_name: str,
+        this_key: int | None,
+        params: List[Token],
+        body: List[Stmt.Stmt],
+        is_initializer: bool = False,
+    ) -> None:
+        """
+        Emits a def statement for a function. If this_key is not None, the function is a method and takes
+        "this" as its first parameter
+        """
+        enclosing_lines, enclosing_indent = self.lines, self.indent
+        self.lines, self.indent = [], 1
+        self.state = FunctionState(self.state, [{}], is_initializer=is_initializer)
+
+        parameters: List[Variable] = []
+        if this_key is not None:
+            parameters.append(self.declare("this", this_key))
+        for param in params:
+            parameters.append(self.declare(param.string_repr, id(param)))
+        for variable in parameters:
+            if variable.boxed:
+                self.emit(f"{variable.python_name} = _Cell({variable.python_name})")
+
+        for statement in body:
+            self.statement(statement)
+        if is_initializer:
+            self.emit(f"return {self.load('this')}")
+        if not self.lines:
+            self.emit("pass")
+
+        state = self.state
+        assert state.enclosing is not None
+        self.state = state.enclosing
+        body_lines = self.lines
+        self.lines, self.indent = enclosing_lines, enclosing_indent
+
+        signature = [variable.python_name for variable in parameters]
+        if state.captures:
+            signature.append("*")
+            signature.extend(f"{name}={name}" for name in state.captures)
+        self.emit(f"def {python_name}({', '.join(signature)}):")
+        if state.global_names:
+            self.emit(f"{INDENT}global {', '.join(sorted(state.global_names))}")
+        for line in body_lines:
+            self.emit(line)
+
+    def function_value(
+        self,
+        name: str,
+        python_name: str,
+        arity: int,
+        is_method: bool = False,
+    ) -> str:
+        return f"_Function({python_name}, {name!r}, {arity}, {is_method})"
+
+    def definition_name(self, prefix: str) -> str:
+        """
+        Returns a unique name for a def statement, or for a variable used by the generated code
+        """
+        self.definitions += 1
+        return f"_{prefix}{self.definitions}"
+
+    # Expressions
+
+    @override
+    def visit_literal_expr(self, expr: Expr.Literal) -> str:
+        return repr(expr.value)
+
+    @override
+    def visit_grouping_expr(self, expr: Expr.Grouping) -> str:
+        return self.expression(expr.expression)
+
+    @override
+    def visit_unary_expr(self, expr: Expr.Unary) -> str:
+        right = self.expression(expr.right)
+        return f"_unary({self.token(expr.operator)}, {right})"
+
+    @override
+    def visit_not_expr(self, expr: Expr.Not) -> str:
+        right = self.expression(expr.right)
+        temp = self.temporary()
+        return f"(({temp} := {right}) is None or {temp} is False)"
+
+    @override
+    def visit_negate_expr(self, expr: Expr.Negate) -> str:
+        right = self.expression(expr.right)
+        temp = self.temporary()
+        return f"(-{temp} if type({temp} := {right}) in _NUMBER_TYPES else _unary({self.token(expr.operator)}, {temp}))"
+
+    @override
+    def visit_binary_expr(self, expr: Expr.Binary) -> str:
+        left = self.expression(expr.left)
+        right = self.expression(expr.right)
+        token_type = expr.operator.token_type
+        a = self.temporary()
+        b = self.temporary()
+        if token_type == TokenType.EQUAL_EQUAL:
+            fallback = f"_equal({a}, {b})"
+        elif token_type == TokenType.BANG_EQUAL:
+            fallback = f"(not _equal({a}, {b}))"
+        else:
+            fallback = f"_binary({self.token(expr.operator)}, {a}, {b})"
+
+        operator = NUMERIC_OPERATORS.get(token_type)
+        if operator is None:
+            return f"(({a} := {left}), ({b} := {right}), {fallback})[2]"
+        return f"(({a} {operator} {b}) if (type({a} := {left}), type({b} := {right})) in _NUMBER_PAIRS else {fallback})"
+
+    @override
+    def visit_comma_expr(self, expr: Expr.Comma) -> str:
+        left = self.expression(expr.left)
+        right = self.expression(expr.right)
+        return f"({left}, {right})[1]"
+
+    @override
+    def visit_logical_expr(self, expr: Expr.Logical) -> str:
+        temp = self.temporary()
+        left = self.expression(expr.left)
+        right = self.expression(expr.right)
+        if expr.operator.token_type == TokenType.OR:
+            return f"({temp} if ({temp} := {left}) is not None and {temp} is not False else {right})"
+        return f"({right} if ({temp} := {left}) is not None and {temp} is not False else {temp})"
+
+    @override
+    def visit_ternary_expr(self, expr: Expr.Ternary) -> str:
+        condition = self.truthy(expr.condition)
+        if_branch = self.expression(expr.if_branch)
+        else_branch = self.expression(expr.else_branch)
+        return f"({if_branch} if {condition} else {else_branch})"
+
+    @override
+    def visit_variable_expr(self, expr: Expr.Variable) -> str:
+        return self.load(expr.name.string_repr)
+
+    @override
+    def visit_assign_expr(self, expr: Expr.Assign) -> str:
+        value = self.expression(expr.value)
+        return self.store(expr.name.string_repr, value)
+
+    @override
+    def visit_call_expr(self, expr: Expr.Call) -> str:
+        if isinstance(expr.callee, Expr.Get):
+            return self.method_call(expr, expr.callee)
+        temp = self.temporary()
+        callee = self.expression(expr.callee)
+        args = ", ".join(self.expression(arg) for arg in expr.args)
+        arity = len(expr.args)
+        return f"({temp}.fast({args}) if type({temp} := {callee}) is _Function and {temp}.arity_ == {arity} else _call({temp}, [{args}], {self.token(self.sources.token_at(expr.paren))}))"
+
+    def method_call(self, expr: Expr.Call, callee: Expr.Get) -> str:
+        """
+        A method is called with the instance as its first argument, other properties are called with _call
+        """
+        obj = self.temporary()
+        method = self.temporary()
+        name = self.token(callee.name)
+        args = [self.expression(arg) for arg in expr.args]
+        arity = len(expr.args)
+        fast = f"{method}.function({', '.join([obj, *args])})"
+        condition = f"type({method} := _method({obj} := {self.expression(callee.obj)}, {name})) is _Function and {method}.arity_ == {arity}"
+        return f"({fast} if {condition} else _call(_get({obj}, {name}), [{', '.join(args)}], {self.token(self.sources.token_at(expr.paren))}))"
+
+    @override
+    def visit_arrow_expr(self, expr: Expr.Arrow) -> str:
+        python_name = self.definition_name("arrow")
+        self.function(python_name, None, expr.params, expr.body)
+        return self.function_value("<arrow function>", python_name, len(expr.params))
+
+    @override
+    def visit_get_expr(self, expr: Expr.Get) -> str:
+        return f"_get({self.expression(expr.obj)}, {self.token(expr.name)})"
+
+    @override
+    def visit_set_expr(self, expr: Expr.Set) -> str:
+        obj = self.expression(expr.obj)
+        token = self.token(expr.name)
+        return (
+            f"_set(_instance({obj}, {token}), {token}, {self.expression(expr.value)})"
+        )
+
+    @override
+    def visit_this_expr(self, expr: Expr.This) -> str:
+        return self.load_this()
+
+    @override
+    def visit_super_expr(self, expr: Expr.Super) -> str:
+        return f"_super({self.load_this()}, {self.load('super')})"
+
+    # Statements
+
+    @override
+    def visit_expression_stmt(self, stmt: Stmt.Expression) -> None:
+        expr = stmt.expression
+        while isinstance(expr, Expr.Grouping):
+            expr = expr.expression
+        if isinstance(expr, Expr.Assign):
+            value = self.expression(expr.value)
+            variable = self.lookup(expr.name.string_repr)
+            if variable.boxed:
+                self.emit(f"{variable.python_name}.value = {value}")
+                return
+            if variable.is_global:
+                self.state.global_names.add(variable.python_name)
+            self.emit(f"{variable.python_name} = {value}")
+            return
+        self.emit(self.expression(expr))
+
+    @override
+    def visit_print_stmt(self, stmt: Stmt.Print) -> None:
+        self.emit(f"_print({self.expression(stmt.expression)})")
+
+    @override
+    def visit_println_stmt(self, stmt: Stmt.Println) -> None:
+        self.emit(f"_println({self.expression(stmt.expression)})")
+
+    @override
+    def visit_var_stmt(self, stmt: Stmt.Var) -> None:
+        value = "None"
+        if stmt.initializer is not None:
+            value = self.expression(stmt.initializer)
+        self.define(self.declare(stmt.name.string_repr, id(stmt.name)), value)
+
+    @override
+    def visit_const_stmt(self, stmt: Stmt.Const) -> None:
+        value = self.expression(stmt.initializer)
+        self.define(self.declare(stmt.name.string_repr, id(stmt.name)), value)
+
+    @override
+    def visit_block_stmt(self, stmt: Stmt.Block) -> None:
+        self.emit("if True:")
+        self.block(stmt.statements)
+
+    @override
+    def visit_if_stmt(self, stmt: Stmt.If) -> None:
+        self.emit(f"if {self.truthy(stmt.condition)}:")
+        self.block(stmt.if_branch.statements)
+        if stmt.else_branch is not None:
+            self.emit("else:")
+            self.block(stmt.else_branch.statements)
+
+    @override
+    def visit_while_stmt(self, stmt: Stmt.While) -> None:
+        self.emit(f"while {self.truthy(stmt.condition)}:")
+        self.block(stmt.body.statements)
+
+    @override
+    def visit_for_stmt(self, stmt: Stmt.For) -> None:
+        self.emit("if True:")
+        self.indent += 1
+        self.state.scopes.append({})
+        if stmt.initializer is not None:
+            self.statement(stmt.initializer)
+
+        condition = "True"
+        if stmt.condition is not None:
+            self.state.temporaries = 0
+            condition = self.truthy(stmt.condition)
+
+        # The body is generated first, to find out if it contains a continue statement
+        enclosing_lines, enclosing_has_continue = self.lines, self.state.has_continue
+        self.lines, self.state.has_continue = [], False
+        self.block(stmt.body.statements)
+        body, has_continue = self.lines, self.state.has_continue
+        self.lines, self.state.has_continue = enclosing_lines, enclosing_has_continue
+
+        update = None
+        if stmt.update is not None:
+            self.state.temporaries = 0
+            update = self.expression(stmt.update)
+
+        if update is not None and has_continue:
+            # A continue statement has to run the update, so the update is run at the start of every
+            # iteration except the first
+            first = self.definition_name("first")
+            self.emit(f"{first} = True")
+            self.emit("while True:")
+            self.emit(f"{INDENT}if not {first}:")
+            self.emit(f"{INDENT * 2}{update}")
+            self.emit(f"{INDENT}{first} = False")
+            if condition != "True":
+                self.emit(f"{INDENT}if not {condition}:")
+                self.emit(f"{INDENT * 2}break")
+            self.lines.extend(body)
+        else:
+            self.emit(f"while {condition}:")
+            self.lines.extend(body)
+            if update is not None:
+                self.emit(f"{INDENT}{update}")
+
+        self.state.scopes.pop()
+        self.indent -= 1
+
+    @override
+    def visit_break_stmt(self, stmt: Stmt.Break) -> None:
+        self.emit("break")
+
+    @override
+    def visit_continue_stmt(self, stmt: Stmt.Continue) -> None:
+        self.state.has_continue = True
+        self.emit("continue")
+
+    @override
+    def visit_assert_stmt(self, stmt: Stmt.Assert) -> None:
+        self.emit(f"if not {self.truthy(stmt.expression)}:")
+        message = "''"
+        if stmt.message_expression is not None:
+            message = self.expression(stmt.message_expression)
+        self.emit(f"{INDENT}raise _assertion_error({message})")
+
+    @override
+    def visit_function_stmt(self, stmt: Stmt.Function) -> None:
+        variable = self.declare(stmt.name.string_repr, id(stmt.name))
+        name = stmt.name.string_repr
+        if variable.boxed:
+            python_name = self.definition_name("function")
+            self.emit(f"{variable.python_name} = _Cell(None)")
+            self.function(python_name, None, stmt.params, stmt.body)
+            value = self.function_value(name, python_name, len(stmt.params))
+            self.emit(f"{variable.python_name}.value = {value}")
+            return
+        self.function(variable.python_name, None, stmt.params, stmt.body)
+        value = self.function_value(name, variable.python_name, len(stmt.params))
+        self.emit(f"{variable.python_name} = {value}")
+
+    @override
+    def visit_return_stmt(self, stmt: Stmt.Return) -> None:
+        if self.state.is_initializer:
+            self.emit(f"return {self.load_this()}")
+        elif stmt.value is None:
+            self.emit("return None")
+        else:
+            self.emit(f"return {self.expression(stmt.value)}")
+
+    def load_this(self) -> str:
+        return self.load("this")
+
+    @override
+    def visit_class_stmt(self, stmt: Stmt.Class) -> None:
+        variable = self.declare(stmt.name.string_repr, id(stmt.name))
+        if variable.boxed:
+            self.emit(f"{variable.python_name} = _Cell(None)")
+
+        base_class = "None"
+        base_token = "None"
+        if stmt.base_class is not None:
+            # The base class is stored in a variable named super, which the methods capture
+            self.state.scopes.append({})
+            super_ = self.declare("super", id(stmt.base_class))
+            self.define(super_, self.expression(stmt.base_class))
+            base_class = self.load("super")
+            base_token = self.token(stmt.base_class.name)
+
+        tables: List[str] = []
+        for functions, is_method, can_be_initializer in (
+            (stmt.methods, True, True),
+            (stmt.getters, True, False),
+            (stmt.static_methods, False, False),
+        ):
+            entries: List[str] = []
+            for function in functions:
+                name = function.name.string_repr
+                python_name = self.definition_name("method")
+                self.function(
+                    python_name,
+                    id(function) if is_method else None,
+                    function.params,
+                    function.body,
+                    is_initializer=can_be_initializer and name == "init",
+                )
+                value = self.function_value(
+                    name, python_name, len(function.params), is_method
+                )
+                entries.append(f"{name!r}: {value}")
+            tables.append("{" + ", ".join(entries) + "}")
+
+        value = f"_class({self.token(stmt.name)}, {base_class}, {base_token}, {', '.join(tables)})"
+        if stmt.base_class is not None:
+            self.state.scopes.pop()
+        if variable.boxed:
+            self.emit(f"{variable.python_name}.value = {value}")
+        else:
+            self.emit(f"{variable.python_name} = {value}")
+
+
+class PythonInterpreter(Interpreter):
+    """
+    Transpiles the program to python (see PythonTranspiler), and runs it with exec
+    """
+
+    def __init__(
+        self, error_reporter: ErrorReporter | None = None, stdout: TextIO = sys.stdout
+    ) -> None:
+        super().__init__(error_reporter=error_reporter, stdout=stdout)
+        self.tokens: List[Token] = []
+        self.transpiler = PythonTranspiler(self.tokens, self.sources)
+        self.namespace: Dict[str, object] = {
+            "_Function": TranspiledFunction,
+            "_Cell": Cell,
+            "_NUMBER_TYPES": NUMBER_TYPES,
+            "_NUMBER_PAIRS": NUMBER_PAIRS,
+            "_tokens": self.tokens,
+            "_unary": self.unary_operation,
+            "_binary": self.binary_operation,
+            "_equal": self.is_equal,
+            "_call": self.call_function,
+            "_get": self.get_property,
+            "_method": self.find_method,
+            "_instance": self.check_instance,
+            "_set": self.set_property,
+            "_store": self.store,
+            "_class": self.create_class,
+            "_super": SuperInstance,
+            "_print": self.print,
+            "_println": self.println,
+            "_assertion_error": self.assertion_error,
+        }
+        for function in native_functions:
+            variable = self.transpiler.global_scope[function.name()]
+            self.namespace[variable.python_name] = function
+
+    @override
+    def interpret(self, statements: List[Stmt.Stmt]) -> None:
+        source = self.transpiler.transpile(statements)
+        try:
+            code = compile(source, "<lox>", "exec")
+        except (SyntaxError, RecursionError) as e:
+            # Python limits how deeply parentheses, indented blocks and expressions can be nested
+            message = e.msg if isinstance(e, SyntaxError) else str(e)
+            self.report_runtime_error(
+                RuntimeException(
+                    f"Error: The program is nested too deeply for the python backend: {message}"
+                )
+            )
+            return
+        try:
+            exec(code, self.namespace)
+            main = self.namespace["_main"]
+            assert callable(main)
+            main()
+        except RecursionError:
+            self.report_runtime_error(self.python_stack_overflow())
+        except RuntimeException as e:
+            self.report_runtime_error(e)
+
+    @override
+    def supports_deep_expressions(self) -> bool:
+        # The transpiler recurses into expressions, and python limits how deeply they can be nested
+        return False
+
+    def get_property(self, obj: object, name: Token) -> object:
+        return self.check_instance(obj, name).get(name, self)
+
+    def find_method(self, obj: object, name: Token) -> Method | None:
+        return self.check_instance(obj, name).find_method(name.string_repr)
+
+    def set_property(self, obj: LoxInstance, name: Token, value: object) -> object:
+        obj.set(name, value)
+        return value
+
+    def store(self, cell: Cell, value: object) -> object:
+        cell.value = value
+        return value
+
+    def print(self, value: object) -> None:
+        print(self.stringify(value), file=self.stdout, end="")
+
+    def println(self, value: object) -> None:
+        print(self.stringify(value), file=self.stdout)
+
+    def assertion_error(self, message: object) -> RuntimeException:
+        return RuntimeException(f"Assertion Error: {message}")
+
+    def create_class(
+        self,
+        name: Token,
+        base_class: object,
+        base_class_name: Token | None,
+        methods: Dict[str, Method],
+        getters: Dict[str, Method],
+        static_methods: Dict[str, Method],
+    ) -> LoxClass:
+        if base_class_name is not None and not isinstance(base_class, LoxClass):
+            raise RuntimeException(
+                f'Error: class "{name.string_repr}" cannot derive from "{base_class_name.string_repr}" since "{base_class_name.string_repr}" is not a class',
+                token=name,
+            )
+        return LoxClass(
+            name.string_repr,
+            methods,
+            getters=getters,
+            base_class=base_class if isinstance(base_class, LoxClass) else None,
+            static_methods=static_methods,
+        )
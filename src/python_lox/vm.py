@@ -0,0 +1,474 @@
+import sys
+from typing import Dict, List, TextIO, override
+
+from .ast import stmt as Stmt
+from .bytecode import ClassTemplate, CodeObject, OpCode
+from .bytecode_compiler import BytecodeCompiler
+from .callable import Method
+from .environment import Cell
+from .error_reporter import ErrorReporter
+from .exceptions import RuntimeException
+from .interpreter import Interpreter
+from .lox_class import LoxClass, LoxInstance, SuperInstance
+from .native_functions import native_functions
+from .token import Token
+
+# Opcodes as plain integers, comparing them is faster than comparing enum members
+CONSTANT = int(OpCode.CONSTANT)
+POP = int(OpCode.POP)
+GET_LOCAL = int(OpCode.GET_LOCAL)
+SET_LOCAL = int(OpCode.SET_LOCAL)
+DEFINE_LOCAL = int(OpCode.DEFINE_LOCAL)
+GET_CELL = int(OpCode.GET_CELL)
+SET_CELL = int(OpCode.SET_CELL)
+DEFINE_CELL = int(OpCode.DEFINE_CELL)
+DECLARE_LOCAL = int(OpCode.DECLARE_LOCAL)
+DECLARE_CELL = int(OpCode.DECLARE_CELL)
+GET_UPVALUE = int(OpCode.GET_UPVALUE)
+SET_UPVALUE = int(OpCode.SET_UPVALUE)
+GET_GLOBAL = int(OpCode.GET_GLOBAL)
+SET_GLOBAL = int(OpCode.SET_GLOBAL)
+DEFINE_GLOBAL = int(OpCode.DEFINE_GLOBAL)
+GET_PROPERTY = int(OpCode.GET_PROPERTY)
+SET_PROPERTY = int(OpCode.SET_PROPERTY)
+SUPER = int(OpCode.SUPER)
+GET_METHOD = int(OpCode.GET_METHOD)
+EQUAL = int(OpCode.EQUAL)
+NOT_EQUAL = int(OpCode.NOT_EQUAL)
+ADD = int(OpCode.ADD)
+SUBTRACT = int(OpCode.SUBTRACT)
+MULTIPLY = int(OpCode.MULTIPLY)
+DIVIDE = int(OpCode.DIVIDE)
+MODULO = int(OpCode.MODULO)
+GREATER = int(OpCode.GREATER)
+GREATER_EQUAL = int(OpCode.GREATER_EQUAL)
+LESS = int(OpCode.LESS)
+LESS_EQUAL = int(OpCode.LESS_EQUAL)
+NEGATE = int(OpCode.NEGATE)
+NOT = int(OpCode.NOT)
+TYPEOF = int(OpCode.TYPEOF)
+JUMP = int(OpCode.JUMP)
+JUMP_IF_FALSE = int(OpCode.JUMP_IF_FALSE)
+JUMP_IF_TRUE = int(OpCode.JUMP_IF_TRUE)
+JUMP_IF_FALSE_OR_POP = int(OpCode.JUMP_IF_FALSE_OR_POP)
+JUMP_IF_TRUE_OR_POP = int(OpCode.JUMP_IF_TRUE_OR_POP)
+CALL = int(OpCode.CALL)
+CALL_METHOD = int(OpCode.CALL_METHOD)
+CLOSURE = int(OpCode.CLOSURE)
+CLASS = int(OpCode.CLASS)
+RETURN = int(OpCode.RETURN)
+PRINT = int(OpCode.PRINT)
+PRINTLN = int(OpCode.PRINTLN)
+ASSERT_FAIL = int(OpCode.ASSERT_FAIL)
+
+NUMBERS = {int, float}
+
+# Pushed by GET_METHOD in place of the instance, when the property is not a method
+NOT_A_METHOD = object()
+
+
+class VMFunction(Method):
+    def __init__(
+        self,
+        code: CodeObject,
+        upvalues: List[Cell],
+        receiver: LoxInstance | None = None,
+    ) -> None:
+        self.code = code
+        self.upvalues = upvalues
+        # Instance which is passed as "this" if the function is a bound method
+        self.receiver = receiver
+
+    @override
+    def name(self) -> str:
+        return self.code.name
+
+    def __str__(self) -> str:
+        return f"<function {self.name()}>"
+
+    @override
+    def arity(self) -> int:
+        return self.code.arity
+
+    @override
+    def call(self, interpreter: Interpreter, args: List[object]) -> object:
+        assert isinstance(interpreter, VirtualMachine)
+        return interpreter.call_function_value(self, args)
+
+    @override
+    def call_method(
+        self, interpreter: Interpreter, this: LoxInstance, args: List[object]
+    ) -> object:
+        assert isinstance(interpreter, VirtualMachine)
+        return interpreter.call_function_value(self, args, this)
+
+    @override
+    def bind(self, instance: LoxInstance) -> "VMFunction":
+        return VMFunction(self.code, self.upvalues, receiver=instance)
+
+
+class Frame:
+    __slots__ = ("function", "code", "ip", "slots")
+
+    def __init__(self, function: VMFunction, slots: List[object]) -> None:
+        self.function = function
+        self.code = function.code
+        self.ip = 0
+        self.slots = slots
+
+
+class VirtualMachine(Interpreter):
+    """
+    Compiles the program to bytecode (see bytecode_compiler.py), and executes it in a dispatch loop. Lox
+    function calls push a frame on the frame stack of the VM instead of recursing in python.
+    """
+
+    def __init__(
+        self, error_reporter: ErrorReporter | None = None, stdout: TextIO = sys.stdout
+    ) -> None:
+        super().__init__(error_reporter=error_reporter, stdout=stdout)
+        self.global_values: Dict[str, object] = {
+            function.name(): function for function in native_functions
+        }
+        self.frames: List[Frame] = []
+        self.stack: List[object] = []
+
+    @override
+    def interpret(self, statements: List[Stmt.Stmt]) -> None:
+        code = BytecodeCompiler(self.sources).compile(statements)
+        try:
+            self.call_function_value(VMFunction(code, []), [])
+        except RecursionError:
+            self.report_runtime_error(self.python_stack_overflow())
+        except RuntimeException as e:
+            self.report_runtime_error(e)
+
+    @override
+    def supports_deep_expressions(self) -> bool:
+        # The bytecode compiler recurses into expressions
+        return False
+
+    def call_function_value(
+        self, function: VMFunction, args: List[object], receiver: object = None
+    ) -> object:
+        """
+        Calls function from python, and runs the VM until it returns
+        """
+        base = len(self.frames)
+        stack_size = len(self.stack)
+        self.push_frame(function, args, receiver=receiver)
+        try:
+            return self.run(base)
+        finally:
+            del self.frames[base:]
+            del self.stack[stack_size:]
+
+    def push_frame(
+        self,
+        function: VMFunction,
+        args: List[object],
+        token: Token | None = None,
+        receiver: object = None,
+    ) -> Frame:
+        """
+        Pushes a frame which calls function with args, token is the call which is reported if the stack
+        overflows. A method gets receiver as this, or the instance it is bound to if receiver is None
+        """
+        if len(self.frames) >= self.max_depth:
+            raise RuntimeException(
+                f"Runtime Exception: Stack overflow, more than {self.max_depth} nested calls",
+                token=token,
+            )
+        code = function.code
+        if code.is_method:
+            if receiver is None:
+                receiver = function.receiver
+            slots: List[object] = [receiver, *args]
+        else:
+            slots = args
+        if len(slots) < code.num_slots:
+            slots.extend([None] * (code.num_slots - len(slots)))
+        for slot in code.cell_params:
+            slots[slot] = Cell(slots[slot])
+        frame = Frame(function, slots)
+        self.frames.append(frame)
+        return frame
+
+    def run(self, base: int) -> object:
+        """
+        Executes instructions until the frame at index base returns, and returns its return value
+        """
+        frames = self.frames
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        global_values = self.global_values
+        binary_operation = self.binary_operation
+        is_equal = self.is_equal
+
+        frame = frames[-1]
+        code_object = frame.code
+        code = code_object.code
+        constants = code_object.constants
+        slots = frame.slots
+        upvalues = frame.function.upvalues
+        ip = frame.ip
+
+        while True:
+            op = code[ip]
+            arg = code[ip + 1]
+            ip += 2
+
+            if op == GET_LOCAL:
+                push(slots[arg])
+            elif op == CONSTANT:
+                push(constants[arg])
+            elif op == GET_GLOBAL:
+                try:
+                    push(global_values[constants[arg]])  # type: ignore
+                except KeyError:
+                    raise RuntimeException(
+                        f'Name Error: "{constants[arg]}" is not defined',
+                        token=code_object.tokens[ip - 2],
+                    )
+            elif op == POP:
+                pop()
+            elif op == JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip = arg
+            elif op == JUMP:
+                ip = arg
+            elif (
+                op == ADD
+                or op == SUBTRACT
+                or op == LESS
+                or op == LESS_EQUAL
+                or op == GREATER
+                or op == GREATER_EQUAL
+                or op == MULTIPLY
+                or op == MODULO
+            ):
+                b = pop()
+                a = stack[-1]
+                if type(a) in NUMBERS and type(b) in NUMBERS:
+                    if op == ADD:
+                        stack[-1] = a + b  # type: ignore
+                    elif op == SUBTRACT:
+                        stack[-1] = a - b  # type: ignore
+                    elif op == LESS:
+                        stack[-1] = a < b  # type: ignore
+                    elif op == LESS_EQUAL:
+                        stack[-1] = a <= b  # type: ignore
+                    elif op == GREATER:
+                        stack[-1] = a > b  # type: ignore
+                    elif op == GREATER_EQUAL:
+                        stack[-1] = a >= b  # type: ignore
+                    elif op == MULTIPLY:
+                        stack[-1] = a * b  # type: ignore
+                    else:
+                        stack[-1] = a % b  # type: ignore
+                else:
+                    stack[-1] = binary_operation(code_object.tokens[ip - 2], a, b)
+            elif op == CALL or op == CALL_METHOD:
+                receiver: object = None
+                if op == CALL_METHOD:
+                    # The instance which GET_METHOD left above the method is passed as this
+                    receiver = stack[-arg - 1]
+                    del stack[-arg - 1]
+                    if receiver is NOT_A_METHOD:
+                        receiver = None
+                callee = stack[-arg - 1]
+                if receiver is not None and not (
+                    type(callee) is VMFunction and callee.code.arity == arg
+                ):
+                    assert isinstance(receiver, LoxInstance) and isinstance(
+                        callee, Method
+                    )
+                    callee = stack[-arg - 1] = receiver.bound_method(callee)
+                    receiver = None
+                if type(callee) is LoxClass:
+                    # The initializer runs in a frame of the VM, and returns the instance
+                    constructor = callee.initializer
+                    if type(constructor) is VMFunction and constructor.arity() == arg:
+                        receiver = LoxInstance(callee)
+                        callee = constructor
+                if type(callee) is VMFunction and callee.code.arity == arg:
+                    args = stack[len(stack) - arg :]
+                    del stack[len(stack) - arg - 1 :]
+                    frame.ip = ip
+                    frame = self.push_frame(
+                        callee, args, code_object.tokens[ip - 2], receiver
+                    )
+                    code_object = frame.code
+                    code = code_object.code
+                    constants = code_object.constants
+                    slots = frame.slots
+                    upvalues = callee.upvalues
+                    ip = 0
+                else:
+                    args = stack[len(stack) - arg :]
+                    del stack[len(stack) - arg - 1 :]
+                    frame.ip = ip
+                    push(self.call_function(callee, args, code_object.tokens[ip - 2]))
+            elif op == RETURN:
+                value = pop()
+                frames.pop()
+                if len(frames) == base:
+                    return value
+                frame = frames[-1]
+                code_object = frame.code
+                code = code_object.code
+                constants = code_object.constants
+                slots = frame.slots
+                upvalues = frame.function.upvalues
+                ip = frame.ip
+                push(value)
+            elif op == DEFINE_LOCAL:
+                slots[arg] = pop()
+            elif op == SET_LOCAL:
+                slots[arg] = stack[-1]
+            elif op == GET_CELL:
+                push(slots[arg].value)  # type: ignore
+            elif op == SET_CELL:
+                slots[arg].value = stack[-1]  # type: ignore
+            elif op == DEFINE_CELL:
+                slots[arg] = Cell(pop())
+            elif op == GET_UPVALUE:
+                push(upvalues[arg].value)
+            elif op == SET_UPVALUE:
+                upvalues[arg].value = stack[-1]
+            elif op == DECLARE_LOCAL:
+                slots[arg] = None
+            elif op == DECLARE_CELL:
+                slots[arg] = Cell()
+            elif op == EQUAL:
+                b = pop()
+                stack[-1] = is_equal(stack[-1], b)
+            elif op == NOT_EQUAL:
+                b = pop()
+                stack[-1] = not is_equal(stack[-1], b)
+            elif op == DIVIDE:
+                b = pop()
+                stack[-1] = binary_operation(code_object.tokens[ip - 2], stack[-1], b)
+            elif op == JUMP_IF_TRUE:
+                value = pop()
+                if not (value is None or value is False):
+                    ip = arg
+            elif op == JUMP_IF_FALSE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip = arg
+                else:
+                    pop()
+            elif op == JUMP_IF_TRUE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    pop()
+                else:
+                    ip = arg
+            elif op == NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == NEGATE or op == TYPEOF:
+                stack[-1] = self.unary_operation(code_object.tokens[ip - 2], stack[-1])
+            elif op == GET_PROPERTY:
+                obj = pop()
+                token = code_object.tokens[ip - 2]
+                if not isinstance(obj, LoxInstance):
+                    raise RuntimeException(
+                        "Only instances of class have fields", token=token
+                    )
+                frame.ip = ip
+                push(obj.get_cached(token, self, code_object.property_caches[ip - 2]))
+            elif op == SET_PROPERTY:
+                value = pop()
+                obj = pop()
+                token = code_object.tokens[ip - 2]
+                if not isinstance(obj, LoxInstance):
+                    raise RuntimeException(
+                        "Only instances of class have fields", token=token
+                    )
+                obj.set_cached(token, value, code_object.property_caches[ip - 2])
+                push(value)
+            elif op == GET_METHOD:
+                obj = stack[-1]
+                token = code_object.tokens[ip - 2]
+                if not isinstance(obj, LoxInstance):
+                    raise RuntimeException(
+                        "Only instances of class have fields", token=token
+                    )
+                cache = code_object.property_caches[ip - 2]
+                method = obj.find_method_cached(cache)
+                if method is None:
+                    frame.ip = ip
+                    stack[-1] = obj.get_cached(token, self, cache)
+                    push(NOT_A_METHOD)
+                else:
+                    stack[-1] = method
+                    push(obj)
+            elif op == SUPER:
+                base_class = pop()
+                this = stack[-1]
+                assert isinstance(this, LoxInstance) and isinstance(
+                    base_class, LoxClass
+                )
+                stack[-1] = SuperInstance(this, base_class)
+            elif op == SET_GLOBAL:
+                global_values[constants[arg]] = stack[-1]  # type: ignore
+            elif op == DEFINE_GLOBAL:
+                global_values[constants[arg]] = pop()  # type: ignore
+            elif op == CLOSURE:
+                function_code = constants[arg]
+                assert isinstance(function_code, CodeObject)
+                function_upvalues: List[Cell] = [
+                    slots[index] if is_local else upvalues[index]  # type: ignore
+                    for is_local, index in function_code.captures
+                ]
+                push(VMFunction(function_code, function_upvalues))
+            elif op == CLASS:
+                template = constants[arg]
+                assert isinstance(template, ClassTemplate)
+                push(self.create_class(template, code_object.tokens[ip - 2]))
+            elif op == PRINT:
+                print(self.stringify(pop()), file=self.stdout, end="")
+            elif op == PRINTLN:
+                print(self.stringify(pop()), file=self.stdout)
+            elif op == ASSERT_FAIL:
+                if arg:
+                    raise RuntimeException(f"Assertion Error: {pop()}")
+                raise RuntimeException("Assertion Error: ")
+            else:
+                raise AssertionError(f"Logic error: Invalid opcode {op}")
+
+    def create_class(self, template: ClassTemplate, token: object) -> LoxClass:
+        """
+        Creates a class from the template, the methods, getters and static methods are on the stack, above
+        the base class
+        """
+        stack = self.stack
+
+        static_methods: Dict[str, Method] = {}
+        for name in reversed(template.static_methods):
+            static_methods[name] = stack.pop()  # type: ignore
+        getters: Dict[str, Method] = {}
+        for name in reversed(template.getters):
+            getters[name] = stack.pop()  # type: ignore
+        methods: Dict[str, Method] = {}
+        for name in reversed(template.methods):
+            methods[name] = stack.pop()  # type: ignore
+
+        base_class = stack.pop()
+        if template.base_class is not None and not isinstance(base_class, LoxClass):
+            raise RuntimeException(
+                f'Error: class "{template.name.string_repr}" cannot derive from "{template.base_class.string_repr}" since "{template.base_class.string_repr}" is not a class',
+                token=template.name,
+            )
+
+        return LoxClass(
+            template.name.string_repr,
+            methods,
+            getters=getters,
+            base_class=base_class if isinstance(base_class, LoxClass) else None,
+            static_methods=static_methods,
+        )
@@ -4,6 +4,7 @@ from typing import List
 
 from python_lox.interpreter import Interpreter
 from python_lox.lexer import Lexer
+from python_lox.native_functions import native_functions
 from python_lox.parser import Parser
 from python_lox.resolver import IdentifierState, Resolver
 
@@ -20,11 +21,15 @@ def interpret(source: str):
     interpreter = Interpreter(stdout=outfile)
     resolver = Resolver(interpreter)
 
-    resolver.scopes.append({})
-    for global_value in interpreter.globals.values.keys():
-        resolver.scopes[0][global_value] = IdentifierState(
-            is_init=True, is_mutable=False, is_defined=True, is_used=True
+    resolver.begin_scope()
+    for function in native_functions:
+        resolver.add_identifier(
+            function.name(),
+            IdentifierState(
+                is_init=True, is_mutable=False, is_defined=True, is_used=True
+            ),
         )
+    resolver.begin_scope()
     resolver.resolve(expr)
 
     interpreter.interpret(expr)
@@ -0,0 +1,220 @@
+from io import StringIO
+from typing import List, Tuple
+
+import pytest
+
+from python_lox.error_reporter import ErrorReporter
+from python_lox.lox import Lox
+from python_lox.parser import MAX_NESTING
+from python_lox.resolver import MAX_EXPRESSION_DEPTH
+
+from .test_lox_programs import get_lox_files
+
+BACKENDS = ["closure", "vm", "python"]
+
+
+def run(source: str, backend: str) -> Tuple[str, int, List[str]]:
+    outfile = StringIO()
+    error_reporter = ErrorReporter()
+    lox = Lox(error_reporter, backend=backend, stdout=outfile)
+    exit_code = lox.run(source)
+    errors = [
+        message for level, message, _ in error_reporter.messages if level != "warn"
+    ]
+    return outfile.getvalue(), exit_code, errors
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_programs_same_output(backend: str):
+    for file in get_lox_files():
+        with open(file) as f:
+            source = f.read()
+        assert run(source, backend) == run(source, "tree"), file
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_runtime_errors(backend: str):
+    sources = [
+        'println 3 + "a";',
+        "println 10 / 0;",
+        "var x = 3; x();",
+        "fun foo(a) { return a; } foo(1, 2);",
+        "class A {} println A().x;",
+        "class A { m(x) { return x; } } A().m();",
+        "class A { init() { this.f = 1; } } A().f();",
+        "var a = 1; a.m();",
+        'assert 1 == 2, "message";',
+        "println -true;",
+        "class A {} class B : A { m() { return super.nope(); } } B().m();",
+    ]
+    for source in sources:
+        assert run(source, backend) == run(source, "tree"), source
+
+
+def test_missing_attribute_of_super():
+    source = "class A {} class B : A { m() { return super.nope(); } } B().m();"
+    _, _, errors = run(source, "tree")
+    assert errors == ['Error: There is no attribute "nope" on an instance of class "A"']
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_control_flow(backend: str):
+    source = """
+    var total = 0;
+    var i = 0;
+    while true {
+        i += 1;
+        if i > 10 { break; }
+        if i % 2 == 0 { continue; }
+        total += i;
+    }
+    println total;
+    const make = (n) => () => n * 2;
+    println make(21)();
+    println typeof(make), typeof(1.5), typeof("s"), typeof(nil);
+    println 5 > 3 ? "yes" : "no";
+    println nil or "default";
+    println 0 and false;
+    """
+    assert run(source, backend) == run(source, "tree")
+
+
+def test_disassemble():
+    lox = Lox(ErrorReporter())
+    listing = lox.disassemble(
+        "fun add(a, b) { const sum = a + b; return sum; } println add(1, 2);"
+    )
+    assert listing is not None
+    assert "== <script> ==" in listing
+    assert "== add ==" in listing
+    assert "CALL" in listing
+    assert "ADD" in listing
+
+
+def test_emit_python():
+    lox = Lox(ErrorReporter())
+    source = lox.emit_python("fun add(a, b) { return a + b; } println add(1, 2);")
+    assert source is not None
+    assert "def _main():" in source
+    assert "def add_(a_, b_):" in source
+    compile(source, "<lox>", "exec")
+
+
+def test_closures_capture_loop_variables():
+    source = """
+    var first = nil;
+    for var i = 0; i < 3; i += 1 {
+        var j = i;
+        if i == 0 { first = () => j; }
+        if i == 1 { continue; }
+        j = j + 100;
+    }
+    println first();
+    """
+    for backend in ["tree", *BACKENDS]:
+        assert run(source, backend) == ("100\n", 0, []), backend
+
+
+def test_vm_deep_recursion():
+    source = """
+    fun depth(n) {
+        if (n == 0) {
+            return 0;
+        }
+        return 1 + depth(n - 1);
+    }
+    println depth(20000);
+    """
+    assert run(source, "vm") == ("20000\n", 0, [])
+
+    outfile = StringIO()
+    error_reporter = ErrorReporter()
+    lox = Lox(error_reporter, backend="vm", stdout=outfile, max_depth=100)
+    lox.run(source)
+    assert error_reporter.messages[-1][1] == (
+        "Runtime Exception: Stack overflow, more than 100 nested calls"
+    )
+
+
+@pytest.mark.parametrize("backend", ["tree", *BACKENDS])
+def test_stack_overflow(backend: str):
+    _, _, errors = run("fun forever(n) { return 1 + forever(n); } forever(0);", backend)
+    assert errors[0].startswith("Runtime Exception: Stack overflow")
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_deeply_nested_statements(backend: str):
+    nested = [
+        "{" * MAX_NESTING + "println 1;" + "}" * MAX_NESTING,
+        "if true { " * MAX_NESTING + "println 1;" + "}" * MAX_NESTING,
+        "while true { " * MAX_NESTING + "println 1;" + "break; }" * MAX_NESTING,
+        "fun f() { " * MAX_NESTING + "println 1;" + "} f();" * MAX_NESTING,
+    ]
+    for source in nested:
+        assert run(source, backend) == ("1\n", 0, []), source
+
+
+def test_deep_expressions():
+    source = """
+    class Box { init(value) { this.value = value; } get() { return this.value; } }
+    fun id(x) { return x; }
+    var a = 1;
+    var box = Box(0);
+    println DEEP;
+    """
+    deep = [
+        ("1 + " * 3000 + "1", "3001"),
+        ("(" * 3000 + "a" + ")" * 3000, "1"),
+        ("-" * 3001 + "a", "-1"),
+        ("false or " * 3000 + "a", "1"),
+        ("a = " * 3000 + "2", "2"),
+        ("false ? 0 : " * 3000 + "3", "3"),
+        ("id(" * 3000 + "4" + ")" * 3000, "4"),
+        ("box.value = " * 3000 + "Box(" * 3000 + "5" + ").get()" * 3000, "5"),
+    ]
+    for expression, value in deep:
+        assert run(source.replace("DEEP", expression), "tree") == (f"{value}\n", 0, [])
+    for backend in BACKENDS:
+        output, exit_code, errors = run(source.replace("DEEP", deep[0][0]), backend)
+        assert (output, exit_code) == ("", 1)
+        assert errors == [
+            f"Error: Expression nested too deeply, the {backend} backend supports at most {MAX_EXPRESSION_DEPTH} levels of nesting. Use the tree backend"
+        ]
+
+
+@pytest.mark.parametrize("backend", ["closure", "vm"])
+def test_expressions_nested_up_to_the_limit(backend: str):
+    depth = MAX_EXPRESSION_DEPTH - 1
+    source = """
+    fun id(x) { return x; }
+    var a = 1;
+    println DEEP;
+    """
+    deep = [
+        ("a + " * depth + "a", f"{depth + 1}"),
+        ("(" * depth + "a" + ")" * depth, "1"),
+        ("-" * depth + "a", "-1"),
+        ("false or " * depth + "a", "1"),
+        ("a = " * depth + "2", "2"),
+        ("false ? 0 : " * depth + "3", "3"),
+        ("id(" * depth + "4" + ")" * depth, "4"),
+    ]
+    for expression, value in deep:
+        program = source.replace("DEEP", expression)
+        assert run(program, backend) == (f"{value}\n", 0, [])
+    # Inside the deepest blocks
+    blocks = MAX_NESTING - 1
+    nested = "{" * blocks + source.replace("DEEP", deep[0][0]) + "}" * blocks
+    assert run(nested, backend) == (f"{depth + 1}\n", 0, [])
+
+
+def test_python_backend_nesting():
+    # Python limits how deeply parentheses can be nested, the error is reported
+    source = "var a = 1; println " + " + ".join(["a"] * 150) + ";"
+    output, _, errors = run(source, "python")
+    assert output == ""
+    assert errors[0].startswith(
+        "Error: The program is nested too deeply for the python backend"
+    )
+    parens = "println " + "(" * 120 + "1" + ")" * 120 + ";"
+    assert run(parens, "python") == ("1\n", 0, [])
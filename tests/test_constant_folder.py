@@ -0,0 +1,159 @@
+from io import StringIO
+
+from python_lox.ast import expr as Expr
+from python_lox.ast import stmt as Stmt
+from python_lox.error_reporter import ErrorReporter
+from python_lox.lox import Lox
+from python_lox.resolver import MAX_EXPRESSION_DEPTH
+
+
+def fold(source: str):
+    error_reporter = ErrorReporter()
+    statements = Lox(error_reporter).parse_and_resolve(source)
+    return statements, error_reporter
+
+
+def test_fold_operators():
+    statements, _ = fold(
+        """
+        println 2 * (3 + 4) - 1;
+        println "a" + "b";
+        println !(1 < 2) or nil;
+        println -3 == -3.0 ? "equal" : "different";
+        """
+    )
+    assert statements is not None
+    values = []
+    for statement in statements:
+        assert isinstance(statement, Stmt.Println)
+        assert isinstance(statement.expression, Expr.Literal)
+        values.append(statement.expression.value)
+    assert values == [13, "ab", None, "equal"]
+
+
+def test_propagate_constants():
+    statements, _ = fold(
+        """
+        const width = 4;
+        const area = width * width;
+        var x = area + 1;
+        {
+            var width = 10;
+            x = width;
+        }
+        println x;
+        """
+    )
+    assert statements is not None
+    assert statements[1] == Stmt.Const(
+        name=statements[1].name, initializer=Expr.Literal(16)
+    )
+    assert isinstance(statements[2], Stmt.Var)
+    assert statements[2].initializer == Expr.Literal(17)
+    # The inner width is a variable, so it is not replaced
+    block = statements[3]
+    assert isinstance(block, Stmt.Block)
+    assign = block.statements[1]
+    assert isinstance(assign, Stmt.Expression)
+    assert isinstance(assign.expression, Expr.Assign)
+    assert isinstance(assign.expression.value, Expr.Variable)
+
+
+def test_prune_branches():
+    statements, error_reporter = fold(
+        """
+        const debug = false;
+        if debug {
+            println 1 + "a";
+        } else {
+            println "release";
+        }
+        while debug {
+            println "never";
+        }
+        """
+    )
+    assert statements is not None
+    assert not error_reporter.is_error
+    assert len(statements) == 2
+    assert isinstance(statements[1], Stmt.Block)
+
+
+def test_type_errors_are_reported_before_running():
+    outfile = StringIO()
+    error_reporter = ErrorReporter()
+    lox = Lox(error_reporter, stdout=outfile)
+    assert lox.run('println "start"; fun f() { return 2 - "a"; }') == 1
+    assert outfile.getvalue() == ""
+    assert error_reporter.messages[-1][1] == (
+        "Type Error: Operator - not supported between different types"
+    )
+
+
+def test_operands_which_are_never_evaluated_are_not_checked():
+    outfile = StringIO()
+    error_reporter = ErrorReporter()
+    lox = Lox(error_reporter, stdout=outfile)
+    source = """
+        println true or 1 + "a";
+        println false and 1 + "a";
+        println true ? 1 : 1 + "a";
+        println false ? 1 + "a" : 2;
+    """
+    assert lox.run(source) == 0
+    assert outfile.getvalue() == "true\nfalse\n1\n2\n"
+    assert not error_reporter.is_error
+    assert lox.run('println false or 1 + "a";') == 1
+    assert error_reporter.messages[-1][1] == (
+        "Type Error: Operator + not supported between different types"
+    )
+
+
+def test_division_by_zero_is_left_to_run_time():
+    outfile = StringIO()
+    error_reporter = ErrorReporter()
+    lox = Lox(error_reporter, stdout=outfile)
+    source = """
+        println "start";
+        var debug = false;
+        if debug {
+            println 1 / 0;
+        }
+        println "end";
+        println 1 / 0;
+    """
+    assert lox.run(source) == 0
+    assert outfile.getvalue() == "start\nend\n"
+    assert error_reporter.messages[-1][1] == (
+        "Runtime Error: Divide by Zero Error: division by zero"
+    )
+
+
+def test_deep_expressions_are_folded():
+    opening, closing = "(" * MAX_EXPRESSION_DEPTH, ")" * MAX_EXPRESSION_DEPTH
+    statements, error_reporter = fold(
+        f"""
+        var a = 1;
+        println {opening}1 + 2{closing};
+        println {opening}a + 2 * 3{closing};
+        println {opening}false and 1 + "a"{closing};
+        """
+    )
+    assert statements is not None and not error_reporter.is_error
+    _, constant, variable, short_circuit = statements
+    assert isinstance(constant, Stmt.Println)
+    assert constant.expression == Expr.Literal(3)
+    assert isinstance(variable, Stmt.Println)
+    assert isinstance(variable.expression, Expr.Deep)
+    expression = variable.expression.expression
+    while isinstance(expression, Expr.Grouping):
+        expression = expression.expression
+    assert isinstance(expression, Expr.Binary)
+    assert expression.right == Expr.Literal(6)
+    assert isinstance(short_circuit, Stmt.Println)
+    assert short_circuit.expression == Expr.Literal(False)
+
+    outfile = StringIO()
+    source = f"var a = 1; println {opening}a + 2 * 3{closing};"
+    assert Lox(ErrorReporter(), stdout=outfile).run(source) == 0
+    assert outfile.getvalue() == "7\n"
@@ -118,3 +118,29 @@ def test_closures():
         )
         == "123\n1234\n45"
     )
+
+
+def test_tail_calls_do_not_grow_the_stack():
+    assert (
+        interpret(
+            """
+            fun loop(n, acc) {
+                if (n == 0) {
+                    return acc;
+                }
+                return loop(n - 1, acc + n);
+            }
+            class Counter {
+                count(n) {
+                    if (n == 0) {
+                        return "done";
+                    }
+                    return this.count(n - 1);
+                }
+            }
+            println loop(20000, 0);
+            println Counter().count(20000);
+            """
+        )
+        == "200010000\ndone\n"
+    )
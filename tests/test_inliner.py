@@ -0,0 +1,147 @@
+from io import StringIO
+
+import pytest
+
+from python_lox import flags
+from python_lox.ast import expr as Expr
+from python_lox.ast import stmt as Stmt
+from python_lox.error_reporter import ErrorReporter
+from python_lox.lox import Lox, backends
+from python_lox.resolver import MAX_EXPRESSION_DEPTH
+
+FUNCTIONS = """
+    const double = (x) => x * 2;
+    fun add(a, b) { return a + b; }
+    fun fact(n) { return n <= 1 ? 1 : n * fact(n - 1); }
+"""
+
+
+def inline(source: str):
+    """
+    Returns the expressions printed by the source, after the functions are declared
+    """
+    statements = Lox(ErrorReporter()).parse_and_resolve(FUNCTIONS + source)
+    assert statements is not None
+    expressions = []
+    for statement in statements:
+        if isinstance(statement, Stmt.Block):
+            statement = statement.statements[-1]
+        if isinstance(statement, Stmt.Println):
+            expressions.append(statement.expression)
+    return expressions
+
+
+def test_inline_calls():
+    expressions = inline(
+        """
+        println double(21);
+        var n = 2;
+        println add(double(n), n);
+        println add(n, n) + fact(3);
+        println add(n, double(n));
+        """
+    )
+    # The inlined call is folded
+    assert expressions[0] == Expr.Literal(42)
+    # n * 2 + n
+    assert isinstance(expressions[1], Expr.Binary)
+    assert isinstance(expressions[1].left, Expr.Binary)
+    assert isinstance(expressions[1].right, Expr.Variable)
+    # fact is recursive
+    assert isinstance(expressions[2], Expr.Binary)
+    assert isinstance(expressions[2].left, Expr.Binary)
+    assert isinstance(expressions[2].right, Expr.Call)
+    # n + n * 2
+    assert isinstance(expressions[3], Expr.Binary)
+    assert isinstance(expressions[3].right, Expr.Binary)
+
+
+def test_calls_which_are_not_inlined():
+    expressions = inline(
+        """
+        var n = 1;
+        var triple = (x) => x * 3;
+        println triple(n);
+        println double(1, 2);
+        println add(double(n), double(n));
+        {
+            // Only global functions are inlined
+            const k = 1;
+            fun bump(x) { return x + k; }
+            println bump(2);
+        }
+        """
+    )
+    assert len(expressions) == 4
+    # triple is a variable, double has one parameter, and add would evaluate both arguments at once
+    assert all(isinstance(expr, Expr.Call) for expr in expressions)
+
+
+def test_shadowed_globals_are_not_inlined():
+    statements = Lox(ErrorReporter()).parse_and_resolve(
+        """
+        var k = 1;
+        fun bump(x) { return x + k; }
+        println bump(1);
+        fun f() {
+            var k = 10;
+            return bump(k);
+        }
+        """
+    )
+    assert statements is not None
+    assert isinstance(statements[2], Stmt.Println)
+    assert isinstance(statements[2].expression, Expr.Binary)
+    function = statements[3]
+    assert isinstance(function, Stmt.Function)
+    returned = function.body[1]
+    assert isinstance(returned, Stmt.Return)
+    assert isinstance(returned.value, Expr.Call)
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_inlined_calls_keep_errors(backend: str):
+    outfile = StringIO()
+    error_reporter = ErrorReporter()
+    lox = Lox(error_reporter, backend=backend, stdout=outfile)
+    lox.run(
+        """
+        fun decrement(x) {
+            return x - 1;
+        }
+        fun show(x) { return x; }
+        println decrement(4) + decrement(show(2));
+        var s = "a";
+        println decrement(s);
+        """
+    )
+    assert outfile.getvalue() == "4\n"
+    _, message, token = error_reporter.messages[-1]
+    assert message == "Runtime Error: Operator - not supported between different types"
+    assert token is not None and token.line == 3
+
+
+def test_inline_limit(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(flags.values, "finline-limit", 2)
+    expressions = inline("println double(21);")
+    assert isinstance(expressions[0], Expr.Call)
+    monkeypatch.setitem(flags.values, "finline-functions", False)
+    expressions = inline("var n = 1; println add(n, n);")
+    assert isinstance(expressions[0], Expr.Call)
+
+
+def test_deep_expressions_are_inlined():
+    opening, closing = "(" * MAX_EXPRESSION_DEPTH, ")" * MAX_EXPRESSION_DEPTH
+    expressions = inline(
+        f"""
+        println {opening}double(21){closing};
+        var n = 2;
+        println {opening}add(n, n){closing};
+        """
+    )
+    assert expressions[0] == Expr.Literal(42)
+    assert isinstance(expressions[1], Expr.Deep)
+    expression = expressions[1].expression
+    while isinstance(expression, Expr.Grouping):
+        expression = expression.expression
+    assert isinstance(expression, Expr.Binary)
@@ -1,3 +1,13 @@
+from io import StringIO
+
+from python_lox.ast import expr as Expr
+from python_lox.ast import stmt as Stmt
+from python_lox.callable import LoxFunction
+from python_lox.error_reporter import ErrorReporter
+from python_lox.interpreter import MAX_DEOPTS
+from python_lox.lox import Lox
+from python_lox.lox_class import LoxInstance
+
 from .conftest import interpret
 
 
@@ -98,3 +108,200 @@ def test_variables():
         )
         == "230\n"
     )
+
+
+def test_quickened_binary_expressions():
+    assert (
+        interpret(
+            """
+                fun add(a, b) {
+                    return a + b;
+                }
+                println add(1, 2), add(3, 4);
+                println add("a", "b");
+                println add(1.5, 2);
+                println add(true, true);
+                var i = 0;
+                var x = 1;
+                while i < 6 {
+                    x = x * 2;
+                    if i == 2 {
+                        x = x / 4;
+                    }
+                    i += 1;
+                }
+                println x;
+              """
+        )
+        == "7\nab\n3.5\n2\n16.0\n"
+    )
+
+
+def test_binary_expressions_are_specialized():
+    lox = Lox(ErrorReporter(), stdout=StringIO())
+    lox.run(
+        """
+            fun add(a, b) {
+                var sum = a + b;
+                return sum;
+            }
+            add(1, 2);
+            add(3, 4);
+        """
+    )
+    add = lox.interpreter.environment.values[0]
+    assert isinstance(add, LoxFunction)
+    declaration = add.declaration.body[0]
+    assert isinstance(declaration, Stmt.Var)
+    binary = declaration.initializer
+    assert isinstance(binary, Expr.Binary)
+    assert binary.quickened_type is int and binary.quickened is not None
+    assert binary.deopts == 0
+
+    # A call with other types deoptimizes the site, which is specialized for the new type
+    lox.run('add("a", "b");')
+    assert binary.quickened_type is str and binary.deopts == 1
+    lox.run("add(1, 2.5);")
+    assert binary.quickened is None and binary.deopts == 2
+
+    # After MAX_DEOPTS deoptimizations, the site is no longer specialized
+    for _ in range(MAX_DEOPTS):
+        lox.run('add(1, 2); add("a", "b");')
+    assert binary.quickened is None and binary.deopts == MAX_DEOPTS
+    lox.run("add(1, 2);")
+    assert binary.quickened is None
+
+
+def test_specialized_operators_check_their_operands():
+    error_reporter = ErrorReporter()
+    outfile = StringIO()
+    lox = Lox(error_reporter, stdout=outfile)
+    lox.run(
+        """
+            fun divide(a, b) { return a / b; }
+            fun less(a, b) { return a < b; }
+            println divide(6, 4);
+            println divide(1, 4);
+            println less(1, 2);
+            println less("b", "a");
+            println less(2, 1);
+        """
+    )
+    assert outfile.getvalue() == "1.5\n0.25\ntrue\nfalse\nfalse\n"
+    assert not error_reporter.is_error
+
+    # The specialized division still reports division by zero, at the operator
+    lox.run("divide(1, 0);")
+    _, message, token = error_reporter.messages[-1]
+    assert message == "Runtime Error: Divide by Zero Error: division by zero"
+    assert token is not None and token.string_repr == "/"
+    # As in the REPL, the next line runs after an error
+    error_reporter.is_error = False
+    lox.run('var n = 1; less(n, "a");')
+    _, message, token = error_reporter.messages[-1]
+    assert message == "Runtime Error: Operator < not supported between different types"
+    assert token is not None and token.string_repr == "<"
+
+
+def test_instances_share_shapes():
+    lox = Lox(ErrorReporter(), stdout=StringIO())
+    lox.run(
+        """
+            class Point {
+                init(x, y) {
+                    this.x = x;
+                    this.y = y;
+                }
+            }
+            var a = Point(1, 2);
+            var b = Point(3, 4);
+            var c = Point(5, 6);
+            c.z = 7;
+            c.x = 8;
+        """
+    )
+    a, b, c = lox.interpreter.environment.values[1:]
+    assert isinstance(a, LoxInstance)
+    assert isinstance(b, LoxInstance)
+    assert isinstance(c, LoxInstance)
+    assert a.shape is b.shape
+    assert a.shape.slots == {"x": 0, "y": 1}
+    assert b.values == [3, 4]
+    assert c.shape.slots == {"x": 0, "y": 1, "z": 2}
+    assert c.values == [8, 6, 7]
+
+
+def test_property_accesses_are_cached():
+    lox = Lox(ErrorReporter(), stdout=StringIO())
+    lox.run(
+        """
+            class A {
+                init() {
+                    this.x = 1;
+                }
+                name() {
+                    return "a";
+                }
+            }
+            class B : A {
+                init() {
+                    this.y = 2;
+                    this.x = 3;
+                }
+            }
+            fun read(obj) {
+                var value = obj.x;
+                return value;
+            }
+            fun name(obj) {
+                var value = obj.name();
+                return value;
+            }
+            var a = A();
+            var b = B();
+            read(a);
+            name(a);
+        """
+    )
+    read, name, a, b = lox.interpreter.environment.values[2:]
+    assert isinstance(read, LoxFunction) and isinstance(name, LoxFunction)
+    assert isinstance(a, LoxInstance) and isinstance(b, LoxInstance)
+    declaration = read.declaration.body[0]
+    assert isinstance(declaration, Stmt.Var)
+    get = declaration.initializer
+    assert isinstance(get, Expr.Get) and get.cache is not None
+    assert get.cache.shape is a.shape and get.cache.index == 0
+    assert not get.cache.shapes
+
+    # Another shape goes to the polymorphic cache, which remembers where x is in it
+    lox.run("read(b);")
+    assert get.cache.shape is a.shape and get.cache.shapes == {b.shape: 1}
+
+    # A method call caches the entry of the method table of the class, after finding that the shape of the
+    # instance does not have a field with that name
+    declaration = name.declaration.body[0]
+    assert isinstance(declaration, Stmt.Var)
+    call = declaration.initializer
+    assert isinstance(call, Expr.Call) and isinstance(call.callee, Expr.Get)
+    cache = call.callee.cache
+    assert cache is not None
+    assert cache.shape is a.shape and cache.index == -1
+    assert cache.class_ is a.class_ and cache.entry == a.class_.table["name"]
+    lox.run("name(b);")
+    assert cache.classes == {b.class_: b.class_.table["name"]}
+
+
+def test_binary_operation_errors():
+    sources = {
+        'var s = "a"; println s - s;': 'Type Error: Operator "-" not valid between the operands',
+        'var s = "a"; println s % s;': 'Type Error: Operator "%" not valid between the operands',
+        "var n = nil; println n + n;": 'Type Error: Operator "+" not valid between the operands',
+        'var n = 1; println n < "a";': "Runtime Error: Operator < not supported between different types",
+        "class A {} var a = A(); println a > a;": 'Type Error: Operator ">" not valid between the operands',
+    }
+    for source, expected in sources.items():
+        error_reporter = ErrorReporter()
+        Lox(error_reporter, stdout=StringIO()).run(source)
+        _, message, token = error_reporter.messages[-1]
+        assert message == expected
+        assert token is not None and token.string_repr in "-%+<>"
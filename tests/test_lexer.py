@@ -1,5 +1,13 @@
+from io import StringIO
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from python_lox.error_reporter import ErrorReporter
 from python_lox.lexer import Lexer
-from python_lox.token import TokenType
+from python_lox.lox import Lox
+from python_lox.token import Token, TokenType
 
 
 def test_lexer_empty_source():
@@ -292,3 +300,101 @@ def test_block_comments():
     assert tokens[7].token_type == TokenType.NUMBER
     assert tokens[7].line == 12
     assert tokens[8].token_type == TokenType.EOF
+
+
+def lex_each_character(source: str):
+    """
+    Lexes the source one character at a time, without the master pattern
+    """
+    error_reporter = ErrorReporter()
+    lexer = Lexer(source, error_reporter)
+    tokens = []
+    while lexer.current < len(source):
+        lexer.index = lexer.current
+        lexer.scan_token(tokens)
+    return tokens, error_reporter.messages
+
+
+def test_master_pattern_matches_character_lexer():
+    programs = Path(__file__).parent / "programs"
+    sources = [path.read_text() for path in programs.glob("*.lox")]
+    sources += [
+        "1.5e3 0x1F 0b101 0o17 0x 0b2 0o9 1e 1e+ 1.x 1.5.3 00x1 007 x1.y",
+        '"multi\nline" "unterminated\n',
+        "/* a\n b */ c /* unterminated\n x",
+        "a // c\n b /= c / d //",
+        "é ab\u0301c aé 1٣ 1.٣ 0x1٣ x² ²",
+        "@ # \f a\tb\r\nc /*/ /**/",
+        "!= ! == = => >= <= < > += -= *= %= ? : ; . ,",
+    ]
+    for source in sources:
+        error_reporter = ErrorReporter()
+        tokens = Lexer(source, error_reporter).process()
+        assert tokens[-1].token_type == TokenType.EOF
+        assert (tokens[:-1], error_reporter.messages) == lex_each_character(source)
+
+
+def test_file_is_lexed_in_chunks(monkeypatch: pytest.MonkeyPatch):
+    # Strings and comments span several chunks
+    monkeypatch.setattr("python_lox.lexer.CHUNK_SIZE", 4)
+    sources = [
+        (Path(__file__).parent / "programs" / "closures.lox").read_text(),
+        'var s = "a string\nover\nthree lines";\n/* a\nlong\ncomment */ print s;',
+        'print 1;\n"unterminated\nstring',
+        "a /* unterminated\n comment",
+        "no newline at the end",
+    ]
+
+    def lexemes(tokens: List[Token]):
+        return [(t.token_type, t.line, t.literal, t.string_repr) for t in tokens]
+
+    for source in sources:
+        error_reporter = ErrorReporter()
+        tokens = Lexer(source, error_reporter).process()
+        chunked_reporter = ErrorReporter()
+        chunked = list(Lexer(StringIO(source), chunked_reporter).tokens())
+        assert lexemes(chunked) == lexemes(tokens)
+        assert chunked_reporter.messages == error_reporter.messages
+        # Errors are shown with the line of the token
+        for token in chunked[:-1]:
+            if "\n" not in token.string_repr:
+                line, _, _ = chunked_reporter.get_token_line(token)
+                assert line == source.splitlines()[token.line - 1]
+
+
+def test_token_buffer():
+    source = 'var count = 1.5;\nprint count + "s";\ncount = count * 0x10;'
+    tokens = Lexer(source).process()
+    assert list(tokens) == list(Lexer(source).tokens())
+    assert tokens[-1] == Token(token_type=TokenType.EOF)
+    assert [token.literal for token in tokens[3:9:5]] == [1.5, "s"]
+    # Only the literals of numbers and strings are stored, lexemes are sliced when a token is read
+    assert sorted(tokens.literals.values(), key=str) == [1.5, 16, "s"]
+    assert len(tokens.types) == len(tokens) == 17
+    # Identifiers share one string
+    assert tokens[1].string_repr is tokens[6].string_repr is tokens[12].literal
+
+
+def test_tokens_are_lexed_in_batches(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("python_lox.lexer.BATCH_SIZE", 2)
+    source = (Path(__file__).parent / "programs" / "closures.lox").read_text()
+    source += '\nprint 1 @ 2;\nprint "unterminated;'
+    error_reporter = ErrorReporter()
+    tokens = Lexer(source, error_reporter).process()
+    batched_reporter = ErrorReporter()
+    batched = list(Lexer(source, batched_reporter).tokens())
+    assert batched == list(tokens)
+    assert batched_reporter.messages == error_reporter.messages
+
+
+def test_lexer_errors_are_reported_in_order():
+    # The parser reads the tokens before a lexer error first, so the errors are in the order of the source
+    error_reporter = ErrorReporter()
+    source = 'print 1 +;\nprint 2 @ 3;\nprint "a;'
+    Lox(error_reporter, stdout=StringIO()).run(source)
+    assert [message for _, message, _ in error_reporter.messages] == [
+        "Expected expression",
+        "Syntax Error: Invalid character '@' at line 2",
+        'Expected ";" at end of print statement',
+        "Syntax Error: Unterminated string literal at line 3",
+    ]
@@ -434,3 +434,53 @@ def test_continue_and_break():
         )
         == "19\n"
     )
+
+
+def test_for_loop_inside_function():
+    assert (
+        interpret(
+            """
+                fun sum(n) {
+                    var total = 0;
+                    for var i = 0; i < n; i = i + 1 {
+                        total = total + i;
+                    }
+                    return total;
+                }
+                println sum(5);
+            """
+        )
+        == "10\n"
+    )
+
+
+def test_return_from_nested_loops():
+    assert (
+        interpret(
+            """
+                fun find(n) {
+                    var i = 0;
+                    while true {
+                        for var j = 0; j < n; j = j + 1 {
+                            if (i * j == n) {
+                                return i + j;
+                            }
+                        }
+                        i = i + 1;
+                    }
+                }
+                println find(12);
+                var count = 0;
+                for var k = 0; k < 10; k = k + 1 {
+                    {
+                        if (k % 2 == 0) {
+                            continue;
+                        }
+                    }
+                    count = count + 1;
+                }
+                println count;
+            """
+        )
+        == "8\n5\n"
+    )
@@ -14,3 +14,20 @@ def get_lox_files() -> List[str]:
 def test_all():
     for file in get_lox_files():
         exec_command(["pylox", file])
+
+
+def test_all_closure_backend():
+    for file in get_lox_files():
+        exec_command(["pylox", "--backend", "closure", file])
+
+
+def test_all_vm_backend():
+    for file in get_lox_files():
+        exec_command(["pylox", "--backend", "vm", file])
+        exec_command(["pylox", "--disassemble", file])
+
+
+def test_all_python_backend():
+    for file in get_lox_files():
+        exec_command(["pylox", "--backend", "python", file])
+        exec_command(["pylox", "--emit-python", file])
@@ -1,6 +1,15 @@
+import dataclasses
+from io import StringIO
+
+import pytest
+
+from python_lox.ast import expr as Expr
+from python_lox.ast import stmt as Stmt
+from python_lox.error_reporter import ErrorReporter
 from python_lox.extras import astprint
 from python_lox.lexer import Lexer
-from python_lox.parser import Parser
+from python_lox.lox import Lox
+from python_lox.parser import MAX_NESTING, Parser
 from python_lox.token import TokenType
 
 
@@ -97,6 +106,18 @@ def test_comparisons():
     assert astprint("3 - 2 > 5 - 4") == "(> (- 3 2) (- 5 4))"
 
 
+def test_operators_of_every_precedence():
+    assert (
+        astprint("a, b = c ? d : e or f and g")
+        == "(, var a (= b (?: var c var d (or var e (and var f var g)))))"
+    )
+    assert (
+        astprint("a = b += 1 % 2 < 3 != 4")
+        == "(= a (= b (+ var b (!= (< (% 1 2) 3) 4))))"
+    )
+    assert astprint("x ? 1 : 2, y") == "(, (?: var x 1 2) var y)"
+
+
 def test_ternary_expression():
     assert astprint("2 > 3 ? 5 : 7") == "(?: (> 2 3) 5 7)"
     assert (
@@ -105,3 +126,95 @@ def test_ternary_expression():
     )
 
     assert astprint("2 > 3 ? 5 == 2 : 6 - 3") == "(?: (> 2 3) (== 5 2) (- 6 3))"
+
+
+def test_operator_nodes():
+    exp = Parser(Lexer("1, a += -2 * 3 < 4 == !5 % 6").process()).expression()
+    assert isinstance(exp, Expr.Comma)
+    assign = exp.right
+    assert isinstance(assign, Expr.Assign)
+    assert isinstance(assign.value, Expr.Add)
+    equal = assign.value.right
+    assert isinstance(equal, Expr.Equal)
+    assert isinstance(equal.left, Expr.Less)
+    assert isinstance(equal.left.left, Expr.Multiply)
+    assert isinstance(equal.left.left.left, Expr.Negate)
+    assert isinstance(equal.right, Expr.Modulo)
+    assert isinstance(equal.right.left, Expr.Not)
+    assert isinstance(equal.right.left, Expr.Unary)
+
+
+def test_compact_nodes():
+    parser = Parser(Lexer("\n  f(1,\n 2)").process())
+    exp = parser.expression()
+    assert isinstance(exp, Expr.Call)
+    assert not hasattr(exp, "__dict__")
+    # The parenthesis is only kept as a position
+    assert isinstance(exp.paren, int)
+    paren = parser.sources.token_at(exp.paren)
+    assert paren.token_type == TokenType.RIGHT_PAREN
+    assert (paren.line, paren.start, paren.end) == (3, 10, 11)
+    assert paren.src[paren.start] == ")"
+    literal = exp.args[0]
+    assert isinstance(literal, Expr.Literal)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        literal.value = 2  # type: ignore
+
+
+def test_sources_belong_to_the_interpreter():
+    lox = Lox(ErrorReporter(), stdout=StringIO())
+    source = "fun f() { return 1; } f();"
+    lox.run(source)
+    assert lox.interpreter.sources.sources == [source]
+    assert Lox(ErrorReporter()).interpreter.sources.sources == []
+
+
+def test_tokens_are_parsed_as_they_are_lexed():
+    source = "var f = (a, b) => a + b;\n" * 50 + "f(1, 2)"
+    tokens = Lexer(source).tokens()
+    parser = Parser(tokens)
+    statements = parser.parse(repl=True)
+    assert statements is not None and len(statements) == 51
+    # The last statement was parsed again as an expression to print
+    assert isinstance(statements[-1], Stmt.Println)
+    assert isinstance(statements[-1].expression, Expr.Call)
+    assert next(tokens, None) is None
+    # Only the tokens from the start of the last declaration are kept
+    assert len(parser.tokens.buffer) <= 8
+
+
+def test_deeply_nested_expressions():
+    exp = Parser(
+        Lexer("-" * 5000 + "(" * 5000 + "1" + ")" * 5000).process()
+    ).expression()
+    for _ in range(5000):
+        assert isinstance(exp, Expr.Negate)
+        exp = exp.right
+    for _ in range(5000):
+        assert isinstance(exp, Expr.Grouping)
+        exp = exp.expression
+    assert exp == Expr.Literal(1)
+
+    exp = Parser(Lexer("f" + "(1, 2)" * 5000 + ".x = 1").process()).expression()
+    assert isinstance(exp, Expr.Set)
+    assert isinstance(exp.obj, Expr.Call) and len(exp.obj.args) == 2
+
+
+def test_nesting_limit():
+    error_reporter = ErrorReporter()
+    source = "{" * MAX_NESTING + "}" * MAX_NESTING
+    assert Parser(Lexer(source).process(), error_reporter).parse() is not None
+    assert not error_reporter.is_error
+    source = "var f = " + "() => " * (MAX_NESTING + 1) + "1;"
+    assert Parser(Lexer(source).process(), error_reporter).parse() is None
+    message, token = error_reporter.messages[0][1:]
+    assert message == f"Too many nested blocks, at most {MAX_NESTING} are allowed"
+    assert token is not None and token.token_type == TokenType.ARROW
+    # The rest of the program is not parsed, only the first error is reported
+    error_reporter = ErrorReporter()
+    blocks = MAX_NESTING + 1
+    source = "{" * blocks + "var a = 1; print a;" + "}" * blocks + "print 2;"
+    assert Parser(Lexer(source).process(), error_reporter).parse() is None
+    assert [message for _, message, _ in error_reporter.messages] == [
+        f"Too many nested blocks, at most {MAX_NESTING} are allowed"
+    ]
@@ -1,6 +1,9 @@
 import pytest
 
+from python_lox.ast import stmt as Stmt
+from python_lox.error_reporter import ErrorReporter
 from python_lox.exceptions import NameException, RuntimeException
+from python_lox.lox import Lox
 
 from .conftest import interpret
 
@@ -227,6 +230,43 @@ def test_scopes():
         )
 
 
+def test_flat_closures():
+    source = """
+        fun counter(start) {
+            var count = start;
+            var unused = 0;
+            fun add(n) {
+                fun apply() {
+                    count += n;
+                    return count;
+                }
+                return apply();
+            }
+            return add;
+        }
+        const add = counter(10);
+        add(1);
+        println add(2);
+    """
+    assert interpret(source) == "13\n"
+
+    statements = Lox(ErrorReporter()).parse_and_resolve(source)
+    assert statements is not None
+    counter = statements[0]
+    assert isinstance(counter, Stmt.Function)
+    count, unused, add = counter.body[0], counter.body[1], counter.body[2]
+    assert isinstance(count, Stmt.Var) and isinstance(unused, Stmt.Var)
+    assert isinstance(add, Stmt.Function)
+    apply = add.body[0]
+    assert isinstance(apply, Stmt.Function)
+    # Only the variables used by closures are stored in cells, and a closure only keeps the cells it uses
+    assert count.is_cell and not unused.is_cell
+    assert counter.captures == [] and counter.cell_params == []
+    assert add.captures == [(True, count.slot)] and add.cell_params == [0]
+    # count is an upvalue of add, n is in the environment of add
+    assert apply.captures == [(False, 0), (True, 0)]
+
+
 def test_logical_operators():
     assert (
         interpret(
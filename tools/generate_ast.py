@@ -4,6 +4,52 @@ from typing import Any, Dict, List, Tuple
 import typer
 from rich import print
 
+# Annotations filled in by the resolver. They are not part of the syntax, so they are ignored when comparing
+# and printing nodes
+# access: How the variable is accessed (LOCAL, CELL, UPVALUE or GLOBAL, see environment.py)
+# depth: For a global variable, the number of environments between the program and the declaration
+# slot: Index of the variable in its environment, or in the upvalues of the function
+resolved_slot = ("slot", "int = field(default=-1, compare=False, repr=False)")
+resolved_location = [
+    ("access", "int = field(default=-1, compare=False, repr=False)"),
+    ("depth", "int = field(default=-1, compare=False, repr=False)"),
+    resolved_slot,
+]
+# is_cell: True if a closure captures the declared variable, so that it is stored in a Cell
+resolved_declaration = [
+    resolved_slot,
+    ("is_cell", "bool = field(default=False, compare=False, repr=False)"),
+]
+# captures: The cells that a closure of the function keeps, as (is_local, index) pairs. The cell is in the
+# slot index of the enclosing function's environment if is_local, otherwise at index in its upvalues
+# cell_params: Slots of the parameters captured by closures, which are moved to cells on each call
+resolved_function = [
+    (
+        "captures",
+        "List[Tuple[bool, int]] = field(default_factory=list, compare=False, repr=False)",
+    ),
+    (
+        "cell_params",
+        "List[int] = field(default_factory=list, compare=False, repr=False)",
+    ),
+]
+# Set by the tree walking interpreter: the operation specialized for the operand types seen at the site,
+# which are both of type quickened_type, and the number of times the specialization failed
+quickened_operation = [
+    ("quickened_type", "type | None = field(default=None, compare=False, repr=False)"),
+    (
+        "quickened",
+        "Callable[[Any, Any], object] | None = field(default=None, compare=False, repr=False)",
+    ),
+    ("deopts", "int = field(default=0, compare=False, repr=False)"),
+]
+# Set by the tree walking interpreter on the first access: the inline cache of the property, see
+# lox_class.PropertyCache
+property_cache = (
+    "cache",
+    '"PropertyCache | None" = field(default=None, compare=False, repr=False)',
+)
+
 ast_classes: Dict[str, Any] = {
     "expr": {
         "binary": [
@@ -11,8 +57,9 @@ ast_classes: Dict[str, Any] = {
             ("left", "Expr"),
             ("operator", "Token"),
             ("right", "Expr"),
+            *quickened_operation,
         ],
-        "assign": [("name", "Token"), ("value", "Expr")],
+        "assign": [("name", "Token"), ("value", "Expr"), *resolved_location],
         "ternary": [
             ("condition", "Expr"),
             ("if_branch", "Expr"),
@@ -21,29 +68,39 @@ ast_classes: Dict[str, Any] = {
         "grouping": [("expression", "Expr")],
         "literal": [("value", "object")],
         "unary": [("operator", "Token"), ("right", "Expr")],
-        "variable": [("name", "Token")],
+        "variable": [("name", "Token"), *resolved_location],
         "logical": [
             # Variable name, Type hints, Default value (if any)
             ("left", "Expr"),
             ("operator", "Token"),
             ("right", "Expr"),
         ],
-        "call": [("callee", "Expr"), ("paren", "Token"), ("args", "List[Expr]")],
+        "call": [("callee", "Expr"), ("paren", "Position"), ("args", "List[Expr]")],
         "arrow": [
             ("params", "List[Token]"),
             ("body", 'List["Stmt"]'),
+            *resolved_function,
+        ],
+        "get": [("obj", "Expr"), ("name", "Token"), property_cache],
+        "set": [("obj", "Expr"), ("name", "Token"), ("value", "Expr"), property_cache],
+        "this": [("keyword", "Token"), *resolved_location],
+        "super": [
+            ("keyword", "Token"),
+            *resolved_location,
+            # Set by the resolver, the use of "this" that super is bound to
+            ("this", '"This | None" = field(default=None, compare=False, repr=False)'),
         ],
-        "get": [("obj", "Expr"), ("name", "Token")],
-        "set": [("obj", "Expr"), ("name", "Token"), ("value", "Expr")],
-        "this": [("keyword", "Token")],
-        "super": [("keyword", "Token")],
     },
     "stmt": {
         "expression": [("expression", "Expr")],
         "print": [("expression", "Expr")],
         "println": [("expression", "Expr")],
-        "var": [("name", "Token"), ("initializer", "Expr | None = None")],
-        "const": [("name", "Token"), ("initializer", "Expr")],
+        "var": [
+            ("name", "Token"),
+            ("initializer", "Expr | None = None"),
+            *resolved_declaration,
+        ],
+        "const": [("name", "Token"), ("initializer", "Expr"), *resolved_declaration],
         "block": [("statements", "List[Stmt]")],
         "if": [
             ("condition", "Expr"),
@@ -57,8 +114,8 @@ ast_classes: Dict[str, Any] = {
             ("condition", "Expr | None = None"),
             ("update", "Expr | None = None"),
         ],
-        "break": [("keyword", "Token")],
-        "continue": [("keyword", "Token")],
+        "break": [("keyword", "Position")],
+        "continue": [("keyword", "Position")],
         "assert": [
             ("expression", "Expr"),
             ("message_expression", "Expr | None = None"),
@@ -67,22 +124,67 @@ ast_classes: Dict[str, Any] = {
             ("name", "Token"),
             ("params", "List[Token]"),
             ("body", "List[Stmt]"),
+            *resolved_declaration,
+            *resolved_function,
+        ],
+        "return": [
+            ("keyword", "Position"),
+            ("value", "Expr | None = None"),
+            # Set by the resolver, when the value is a call whose result is directly returned
+            ("is_tail_call", "bool = field(default=False, compare=False, repr=False)"),
         ],
-        "return": [("keyword", "Token"), ("value", "Expr | None = None")],
         "class": [
             ("name", "Token"),
             ("methods", "List[Function]"),
             ("static_methods", "List[Function]"),
             ("getters", "List[Function]"),
             ("base_class", "Variable | None = None"),
+            *resolved_declaration,
+        ],
+    },
+}
+
+# Subclasses of a node, one for each operator, so that visitors can dispatch on the operator with one method
+# call. Their visitor methods default to the method of the base node. The names are snake case, and each
+# maps to the token types of its operator
+# deep: Set by the resolver on an expression nested deeper than MAX_EXPRESSION_DEPTH, which the tree walking
+# interpreter evaluates without recursing, and the optimizers leave as it is
+specialized_classes: Dict[str, Dict[str, List[Tuple[str, List[str]]]]] = {
+    "expr": {
+        "binary": [
+            ("add", ["PLUS"]),
+            ("subtract", ["MINUS"]),
+            ("multiply", ["STAR"]),
+            ("divide", ["SLASH"]),
+            ("modulo", ["PERCENTAGE"]),
+            ("less", ["LESS"]),
+            ("less_equal", ["LESS_EQUAL"]),
+            ("greater", ["GREATER"]),
+            ("greater_equal", ["GREATER_EQUAL"]),
+            ("equal", ["EQUAL_EQUAL"]),
+            ("not_equal", ["BANG_EQUAL"]),
+            ("comma", ["COMMA"]),
         ],
+        "unary": [
+            ("negate", ["MINUS"]),
+            ("not", ["BANG", "NOT"]),
+            ("typeof", ["TYPEOF"]),
+        ],
+        "grouping": [("deep", [])],
     },
+    "stmt": {},
 }
 
+# Nodes which are not changed after they are created by the parser. The other nodes are rewritten in place by
+# the constant folder and the inliner, or annotated by the resolver and the interpreter
+frozen_classes = {"expr": ["literal"], "stmt": ["break", "continue"]}
+
 imports = {
     "expr": """
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable, Dict
+from ..token import TokenType
 if TYPE_CHECKING:
+    from ..lox_class import PropertyCache
     from .stmt import Stmt
         """,
     "stmt": """
@@ -90,17 +192,24 @@ from .expr import  Expr, Variable
     """,
 }
 
-module_header = """from typing import Generic, TypeVar, List
-from dataclasses import dataclass
+module_header = """from typing import Generic, TypeVar, List, Tuple
+from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
+from ..position import Position
 from ..token import Token
 
 """
 
 
+def camel_case(name: str) -> str:
+    return "".join(part.capitalize() for part in name.split("_"))
+
+
 def base_class_template(module: str):
     return f"""
 class {module.capitalize()}(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def accept(self, visitor: Visitor[T]) -> T:
         pass
@@ -113,8 +222,9 @@ def class_template(module: str, class_name: str, attributes: List[Tuple[str, str
     for attribute in attributes:
         attribute_strings.append(f"    {attribute[0]}: {attribute[1]}")
 
+    frozen = ", frozen=True" if class_name in frozen_classes[module] else ""
     return f"""
-@dataclass
+@dataclass(slots=True{frozen})
 class {class_name.capitalize()}({module.capitalize()}):
 {"\n".join(attribute_strings)}
 
@@ -124,12 +234,41 @@ class {class_name.capitalize()}({module.capitalize()}):
 """
 
 
+def specialized_class_template(module: str, base: str, class_name: str):
+    return f"""
+@dataclass(slots=True)
+class {camel_case(class_name)}({base.capitalize()}):
+    def accept(self, visitor: Visitor[T]) -> T:
+        return visitor.visit_{class_name}_{module}(self)
+
+"""
+
+
+def operator_classes_template(base: str, classes: List[Tuple[str, List[str]]]):
+    entries: List[str] = []
+    for class_name, token_types in classes:
+        for token_type in token_types:
+            entries.append(f"    TokenType.{token_type}: {camel_case(class_name)},")
+
+    return f"""
+# The node created for each operator
+{base}_classes: Dict[TokenType, type[{base.capitalize()}]] = {{
+{"\n".join(entries)}
+}}
+"""
+
+
 def visitor_template(module: str, classes: List[str]):
     methods: List[str] = []
     for cls in classes:
         methods += [
             f'    @abstractmethod\n    def visit_{cls}_{module}(self, {module}: "{cls.capitalize()}") -> T:\n        pass\n'
         ]
+    for base, specialized in specialized_classes[module].items():
+        for cls, _ in specialized:
+            methods += [
+                f'    def visit_{cls}_{module}(self, {module}: "{camel_case(cls)}") -> T:\n        return self.visit_{base}_{module}({module})\n'
+            ]
 
     return f"""
 T = TypeVar('T')
@@ -151,6 +290,11 @@ def main(output_directory: Path):
             outfile.write(base_class_template(module))
             for cls, attrs in v.items():
                 outfile.write(class_template(module, cls, attrs))
+            for base, specialized in specialized_classes[module].items():
+                for cls, _ in specialized:
+                    outfile.write(specialized_class_template(module, base, cls))
+                if any(token_types for _, token_types in specialized):
+                    outfile.write(operator_classes_template(base, specialized))
 
 
 if __name__ == "__main__":
@@ -91,7 +91,7 @@ class TokenType(Enum):
 
 
 token_class = """
-@dataclass
+@dataclass(slots=True)
 class Token:
     token_type: TokenType = TokenType.UNKNOWN
     line: int = 0